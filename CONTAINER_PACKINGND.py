@@ -11,12 +11,14 @@ from tkinter import ttk, messagebox, filedialog
 import random
 import csv
 import math
-from collections import defaultdict, Counter
+from collections import Counter
 import heapq
-import time
+import threading
+import multiprocessing
 from datetime import datetime
 import os
 import dim_module
+from packing_engine import PackingEngine, PackingOptions, PackingProgress, count_units, SAMPLE_MANIFEST
 
 import matplotlib
 matplotlib.use("TkAgg")
@@ -199,6 +201,12 @@ class ContainerAppAdvanced:
 
         self.result = None
         self.rotation_analysis = None
+        self.lower_bounds = None  # Cận dưới số xe của lần tối ưu gần nhất
+
+        # Trạng thái lần tính toán chạy nền
+        self.opt_thread = None
+        self.opt_progress = None
+        self.opt_output = None
         
         # Layer movement state
         self.selected_item_indices = []
@@ -217,6 +225,9 @@ class ContainerAppAdvanced:
         
         # Thêm biến cho tolerance chiều cao
         self.height_tolerance_var = tk.IntVar(value=10)  # Giá trị mặc định 10mm
+        self.improve_time_var = tk.IntVar(value=0)  # Giây cải thiện SA sau khi xếp, 0 = tắt
+        self.brkga_time_var = tk.IntVar(value=0)  # Giây tìm kiếm BRKGA thay cho xếp greedy, 0 = tắt
+        self.beam_width_var = tk.IntVar(value=0)  # Độ rộng beam search theo layer, 0 = tắt
         
         self.build_layout()
 
@@ -318,7 +329,9 @@ class ContainerAppAdvanced:
         adv_frame.pack(fill="x", pady=2)
         
         self.allow_rotation = tk.BooleanVar(value=True)
-        self.use_maxrect = tk.BooleanVar(value=True)
+        self.use_maxrect = tk.BooleanVar(value=False)
+        self.use_extreme_point = tk.BooleanVar(value=False)
+        self.two_phase = tk.BooleanVar(value=False)
         self.group_similar = tk.BooleanVar(value=True)
         self.pack_density = tk.BooleanVar(value=True)
         self.multi_strategy = tk.BooleanVar(value=True)
@@ -326,7 +339,9 @@ class ContainerAppAdvanced:
         self.allow_height_tolerance = tk.BooleanVar(value=True)  # Thêm tùy chọn mới
         
         ttk.Checkbutton(adv_frame, text="Cho phép hoán đổi Y-Z", variable=self.allow_rotation).pack(anchor="w")
-        ttk.Checkbutton(adv_frame, text="Sử dụng G-F", variable=self.use_maxrect).pack(anchor="w")
+        ttk.Checkbutton(adv_frame, text="Dựng layer bằng MaxRects", variable=self.use_maxrect).pack(anchor="w")
+        ttk.Checkbutton(adv_frame, text="Xếp 3D theo điểm cực (không chia layer)", variable=self.use_extreme_point).pack(anchor="w")
+        ttk.Checkbutton(adv_frame, text="Chia hàng trước, xếp các xe song song", variable=self.two_phase).pack(anchor="w")
         ttk.Checkbutton(adv_frame, text="Gom nhóm tương tự", variable=self.group_similar).pack(anchor="w")
         ttk.Checkbutton(adv_frame, text="Tối ưu mật độ xếp", variable=self.pack_density).pack(anchor="w")
         ttk.Checkbutton(adv_frame, text="So sánh nhiều chiến lược", variable=self.multi_strategy).pack(anchor="w")
@@ -345,6 +360,27 @@ class ContainerAppAdvanced:
         tolerance_entry.pack(side="left", padx=2)
         ttk.Label(tolerance_frame, text="mm cùng layer").pack(side="left")
 
+        # Thời gian cải thiện lời giải (simulated annealing) sau khi xếp
+        improve_frame = ttk.Frame(adv_frame)
+        improve_frame.pack(fill="x", pady=2, anchor="w")
+        ttk.Label(improve_frame, text="Cải thiện thêm").pack(side="left")
+        ttk.Entry(improve_frame, textvariable=self.improve_time_var, width=5).pack(side="left", padx=2)
+        ttk.Label(improve_frame, text="giây (0 = tắt)").pack(side="left")
+
+        # Tìm kiếm BRKGA (thứ tự item + hướng xoay) thay cho bước xếp greedy
+        brkga_frame = ttk.Frame(adv_frame)
+        brkga_frame.pack(fill="x", pady=2, anchor="w")
+        ttk.Label(brkga_frame, text="Tìm kiếm GA").pack(side="left")
+        ttk.Entry(brkga_frame, textvariable=self.brkga_time_var, width=5).pack(side="left", padx=2)
+        ttk.Label(brkga_frame, text="giây (0 = tắt)").pack(side="left")
+
+        # Beam search theo layer trong từng container
+        beam_frame = ttk.Frame(adv_frame)
+        beam_frame.pack(fill="x", pady=2, anchor="w")
+        ttk.Label(beam_frame, text="Beam search layer, độ rộng").pack(side="left")
+        ttk.Entry(beam_frame, textvariable=self.beam_width_var, width=5).pack(side="left", padx=2)
+        ttk.Label(beam_frame, text="(0 = tắt)").pack(side="left")
+
         # DXF export debug log toggle
         self.dxf_debug_var = tk.BooleanVar(value=False)
         ttk.Checkbutton(adv_frame, text="Ghi log DXF khi xuất (debug)", variable=self.dxf_debug_var).pack(anchor="w")
@@ -389,9 +425,21 @@ class ContainerAppAdvanced:
         btn_frame.columnconfigure(1, weight=1)
         btn_frame.columnconfigure(2, weight=1)
 
-        tk.Button(frame, text="TÍNH TOÁN XẾP KIỆN", command=self.run_advanced_optimization,
+        self.calc_button = tk.Button(frame, text="TÍNH TOÁN XẾP KIỆN", command=self.run_advanced_optimization,
                   bg="green", fg="white", font=("Arial", 12, "bold"),
-                  relief="raised", bd=3).pack(fill="x", pady=10, ipady=10)
+                  relief="raised", bd=3)
+        self.calc_button.pack(fill="x", pady=(10, 2), ipady=10)
+        ttk.Button(frame, text="Đề xuất đội xe (nhiều loại xe)", command=self.suggest_fleet).pack(fill="x", pady=(0, 2))
+
+        # Tiến trình tính toán (chạy nền) + nút hủy
+        progress_frame = ttk.Frame(frame)
+        progress_frame.pack(fill="x", pady=(0, 5))
+        self.opt_progress_bar = ttk.Progressbar(progress_frame, mode="determinate", maximum=100)
+        self.opt_progress_bar.pack(side="left", fill="x", expand=True, padx=2)
+        self.cancel_button = ttk.Button(progress_frame, text="HỦY", command=self.cancel_optimization, state="disabled")
+        self.cancel_button.pack(side="right", padx=2)
+        self.opt_status_label = ttk.Label(frame, text="", foreground="blue")
+        self.opt_status_label.pack(anchor="w")
 
     def add_labeled_entry(self, parent, label, var):
         fr = ttk.Frame(parent)
@@ -474,9 +522,14 @@ class ContainerAppAdvanced:
         entry.focus_set()
 
         def save_edit(event=None):
+            if not entry.winfo_exists():
+                return
+            changed = entry.get() != str(old_value)
             values[col_index] = entry.get()
             tree.item(row_id, values=values)
             entry.destroy()
+            if changed and tree is self.data_tree:
+                self.run_incremental_repack()
 
         entry.bind("<Return>", save_edit)
         entry.bind("<FocusOut>", save_edit)
@@ -2919,7 +2972,7 @@ class ContainerAppAdvanced:
             cH = self.container_height.get()
             
             # Re-run packing algorithm
-            new_container = self.pack_gap_filling_single_container(raw_items, cL, cW, cH)
+            new_container = self.make_packing_engine().pack_gap_filling_single_container(raw_items, cL, cW, cH)
             
             if new_container:
                 packed, layers = new_container
@@ -3267,10 +3320,12 @@ class ContainerAppAdvanced:
         # Tính toán lại tọa độ Z (Z1 ở đáy = 0)
         current_z = 0
         for i, layer in enumerate(container["layers"]):
+            # Dời cả layer: kiện chồng giữ nguyên độ cao so với đáy layer
+            offset = current_z - layer["z"]
             layer["z"] = current_z
             layer["name"] = f"Lớp Z{i+1}"
             for box in layer["boxes"]:
-                box["z"] = current_z
+                box["z"] += offset
             current_z += layer["height"]
         
         self.display_advanced_results()
@@ -3286,10 +3341,35 @@ class ContainerAppAdvanced:
         messagebox.showinfo("Thành công", "Đã áp dụng thứ tự lớp mới!")
 
     # =============================================================
-    # PACKING ALGORITHMS - IMPROVED STACKING (2D PACKING ON BASE SURFACE)
+    # PACKING ALGORITHMS - THUẬT TOÁN NẰM TRONG packing_engine.py (HEADLESS)
     # =============================================================
     
-    def run_advanced_optimization(self):
+    def get_packing_options(self):
+        """Đọc các tùy chọn từ GUI một lần, trả về PackingOptions bất biến cho engine"""
+        return PackingOptions(
+            allow_rotation=self.allow_rotation.get(),
+            use_maxrect=self.use_maxrect.get(),
+            placement="extreme_point" if self.use_extreme_point.get() else "layers",
+            beam_width=max(0, self.beam_width_var.get()),
+            two_phase=self.two_phase.get(),
+            group_similar=self.group_similar.get(),
+            pack_density=self.pack_density.get(),
+            multi_strategy=self.multi_strategy.get(),
+            allow_stacking_in_layer=self.allow_stacking_in_layer.get(),
+            allow_height_tolerance=self.allow_height_tolerance.get(),
+            height_tolerance=self.height_tolerance_var.get(),
+            stack_strategy=self.stack_strategy.get(),
+            improve_time_budget=float(self.improve_time_var.get()),
+            use_brkga=self.brkga_time_var.get() > 0,
+            brkga_time_budget=float(self.brkga_time_var.get()),
+            brkga_generations=10000,  # GUI giới hạn theo thời gian
+        )
+
+    def make_packing_engine(self):
+        return PackingEngine(self.get_packing_options())
+
+    def collect_raw_items(self):
+        """Một bản ghi SKU cho mỗi dòng manifest hợp lệ (Q > 0)"""
         raw_items = []
         for child in self.data_tree.get_children():
             v = self.data_tree.item(child)["values"]
@@ -3303,15 +3383,74 @@ class ContainerAppAdvanced:
                     else:
                         rotate = 1
                 
-                for _ in range(Q):
+                # Một bản ghi SKU cho mỗi dòng, engine chỉ tạo từng kiện khi xuất box
+                if Q > 0:
                     raw_items.append({
                         "L": L, "W": W, "H": H, 
-                        "NoID": ID, "uid": random.random(),
+                        "NoID": ID, "count": Q,
                         "rotate": rotate
                     })
             except (ValueError, IndexError):
                 pass
-            
+        return raw_items
+
+    def suggest_fleet(self):
+        """Chọn tổ hợp loại xe rẻ nhất (FLEET_TYPES) chở hết manifest, chạy nền"""
+        if self.opt_thread is not None and self.opt_thread.is_alive():
+            return
+        raw_items = self.collect_raw_items()
+        if not raw_items:
+            messagebox.showwarning("Cảnh báo", "Không có dữ liệu hàng hóa!")
+            return
+
+        self.opt_progress = PackingProgress(total_items=count_units(raw_items))
+        engine = PackingEngine(self.get_packing_options(), self.opt_progress)
+        self.fleet_output = {}
+
+        def worker():
+            try:
+                self.fleet_output["fleet"] = engine.pack_fleet(raw_items)
+            except Exception as e:
+                self.fleet_output["error"] = e
+
+        self.calc_button.config(state="disabled")
+        self.cancel_button.config(state="normal")
+        self.opt_progress_bar["value"] = 0
+        self.opt_thread = threading.Thread(target=worker, daemon=True)
+        self.opt_thread.start()
+        self.root.after(100, self._poll_optimization, self._finish_fleet)
+
+    def _finish_fleet(self, snap):
+        if "error" in self.fleet_output:
+            messagebox.showerror("Lỗi", f"Lỗi khi chọn đội xe:\n{self.fleet_output['error']}")
+            return
+        fleet = self.fleet_output.get("fleet")
+        if not fleet:
+            if snap["cancelled"]:
+                self.opt_status_label.config(text="Đã hủy - chưa có đội xe chở hết hàng", foreground="red")
+            else:
+                messagebox.showerror("Lỗi", "Không loại xe nào chở hết được hàng!")
+            return
+        status = f"Xong: đội xe {len(fleet['solution'])} xe - {snap['elapsed']:.1f}s"
+        if snap["cancelled"]:
+            status = f"Đã hủy - giữ đội xe tốt nhất đã thử: {len(fleet['solution'])} xe"
+        self.opt_status_label.config(text=status, foreground="red" if snap["cancelled"] else "green")
+        lines = [f"Chi phí: {fleet['cost']:.2f}", ""]
+        for c in fleet["solution"]:
+            L, W, H = c["dims"]
+            lines.append(f"{c['name']}: {c['packed_count']} kiện - Đầy {100 * c['packed_vol'] / (L * W * H):.1f}%")
+        messagebox.showinfo("Đội xe rẻ nhất", "\n".join(lines))
+
+    def run_incremental_repack(self):
+        """Manifest vừa sửa: chỉ xếp lại từ container đầu tiên bị ảnh hưởng"""
+        if self.result:
+            self.run_advanced_optimization(previous=self.result)
+
+    def run_advanced_optimization(self, previous=None):
+        if self.opt_thread is not None and self.opt_thread.is_alive():
+            return
+
+        raw_items = self.collect_raw_items()
         if not raw_items: 
             messagebox.showwarning("Cảnh báo", "Không có dữ liệu hàng hóa!")
             return
@@ -3320,1073 +3459,102 @@ class ContainerAppAdvanced:
         cW = self.container_width.get()
         cH = self.container_height.get()
 
+        self.opt_progress = PackingProgress(total_items=count_units(raw_items))
+        engine = PackingEngine(self.get_packing_options(), self.opt_progress)
+
         invalid_items = []
-        for item in raw_items:
-            fits = False
-            allow_rotate = item["rotate"] == 1 and self.allow_rotation.get()
-            
-            if allow_rotate:
-                fits = (
-                    (item["L"] <= cL and item["W"] <= cW and item["H"] <= cH) or
-                    (item["L"] <= cL and item["H"] <= cW and item["W"] <= cH) or
-                    (item["W"] <= cL and item["L"] <= cW and item["H"] <= cH) or
-                    (item["W"] <= cL and item["H"] <= cW and item["L"] <= cH) or
-                    (item["H"] <= cL and item["L"] <= cW and item["W"] <= cH) or
-                    (item["H"] <= cL and item["W"] <= cW and item["L"] <= cH)
-                )
-            else:
-                fits = (item["L"] <= cL and item["W"] <= cW and item["H"] <= cH)
-            
-            if not fits:
-                rotate_status = "Có thể xoay" if allow_rotate else "Không xoay"
-                invalid_items.append(f"{item['NoID']} ({item['L']}x{item['W']}x{item['H']}) - {rotate_status}")
+        for item in engine.find_oversized_items(raw_items, cL, cW, cH):
+            allow_rotate = item["rotate"] == 1 and engine.options.allow_rotation
+            rotate_status = "Có thể xoay" if allow_rotate else "Không xoay"
+            invalid_items.append(f"{item['NoID']} ({item['L']}x{item['W']}x{item['H']}) - {rotate_status}")
         
         if invalid_items:
             messagebox.showerror("Lỗi", f"Các hàng sau quá khổ container:\n" + "\n".join(invalid_items[:5]) + 
                                ("\n..." if len(invalid_items) > 5 else ""))
             return
 
-        if self.multi_strategy.get():
-            best_solution = self.run_multi_strategy_optimization(raw_items, cL, cW, cH)
-        else:
-            best_solution = self.run_single_strategy_optimization(raw_items, cL, cW, cH)
-            
-        if not best_solution:
-            messagebox.showerror("Lỗi", "Không thể xếp hàng vào container!")
-            return
-            
-        self.result = best_solution
-        
-        self.rotation_analysis = self.analyze_rotation_improvement(raw_items, cL, cW, cH)
-        
-        self.display_advanced_results()
-        self.update_visualizer_controls()
-        self.update_full_visualizer_controls()
-        self.draw_cross_sections()
-        
-        # Cập nhật Tab 2
-        if hasattr(self, 'tab2_cross_container'):
-            self.update_tab2_controls()
+        # Chạy engine ở thread nền, GUI chỉ đọc tiến trình qua root.after
+        self.opt_output = {}
 
-    def run_multi_strategy_optimization(self, raw_items, cL, cW, cH):
-        strategies = [
-            {"name": "GFBUp", "func": self.pack_gap_filling},
-            {"name": "GFI", "func": self.pack_gap_filling_interleaved},
-            {"name": "Greedy + Layer-based", "func": self.pack_greedy_layer_based},
-            {"name": "Hybrid Approach", "func": self.pack_hybrid_approach}
-        ]
-        
-        best_solution = None
-        best_metric = float('-inf')
-        best_strategy_name = ""
-        
-        for strategy in strategies:
+        def worker():
             try:
-                start_time = time.time()
-                solution = strategy["func"](raw_items[:], cL, cW, cH)
-                end_time = time.time()
-                
-                if solution and len(solution) > 0:
-                    metric = self.evaluate_solution_quality(solution, cL, cW, cH)
-                    
-                    for i, container in enumerate(solution):
-                        container["strategy"] = strategy["name"]
-                        container["time"] = end_time - start_time
-                        container["name"] = f"Xe {i+1:02d}"
-                    
-                    print(f"Chiến lược {strategy['name']}: {len(solution)} xe, Điểm: {metric:.2f}, Thời gian: {end_time - start_time:.2f}s")
-                    
-                    if metric > best_metric:
-                        best_metric = metric
-                        best_solution = solution
-                        best_strategy_name = strategy["name"]
-            except Exception as e:
-                print(f"Lỗi với chiến lược {strategy['name']}: {str(e)}")
-                continue
-        
-        if best_solution:
-            print(f"CHIẾN LƯỢC TỐT NHẤT: {best_strategy_name} với điểm số: {best_metric:.2f}")
-            for container in best_solution:
-                container["best_strategy"] = best_strategy_name
-                
-        return best_solution
-
-    def run_single_strategy_optimization(self, raw_items, cL, cW, cH):
-        solution = self.pack_gap_filling(raw_items, cL, cW, cH)
-        if solution:
-            for i, container in enumerate(solution):
-                container["name"] = f"Xe {i+1:02d}"
-        return solution
-
-    def evaluate_solution_quality(self, solution, cL, cW, cH):
-        if not solution:
-            return float('-inf')
-            
-        total_volume = cL * cW * cH * len(solution)
-        used_volume = sum(cont["packed_vol"] for cont in solution)
-        
-        volume_utilization = used_volume / total_volume if total_volume > 0 else 0
-        container_count = len(solution)
-        
-        item_counts = [cont["packed_count"] for cont in solution]
-        stability = 1 - (max(item_counts) - min(item_counts)) / max(item_counts) if max(item_counts) > 0 else 1
-        
-        metric = (volume_utilization * 0.5 + 
-                 (1 / container_count) * 0.3 + 
-                 stability * 0.2)
-        
-        return metric
-
-    def pack_gap_filling(self, items, cL, cW, cH):
-        if self.group_similar.get():
-            items = self.normalize_dimensions_advanced(items)
-        
-        remaining_items = items[:]
-        all_containers = []
-        container_count = 0
-        
-        while remaining_items and container_count < 100:
-            container_count += 1
-            
-            packed, layers = self.pack_gap_filling_single_container(remaining_items, cL, cW, cH)
-            
-            if not packed:
-                break
-            
-            container = {
-                "name": f"Xe {container_count:02d}",
-                "layers": layers,
-                "packed_count": len(packed),
-                "packed_vol": sum(i["L"]*i["W"]*i["H"] for i in packed)
-            }
-            
-            self.sort_layers_by_z(container)
-            all_containers.append(container)
-            
-            packed_uids = [item["uid"] for item in packed]
-            remaining_items = [item for item in remaining_items if item["uid"] not in packed_uids]
-            
-        return all_containers
-
-    def pack_gap_filling_single_container(self, items, cL, cW, cH):
-        if self.group_similar.get():
-            items = self.normalize_dimensions_simple(items)
-
-        rem = items[:]
-        layers = []
-        packed_total = []
-
-        current_z = 0
-        max_layers = 200
-        layer_count = 0
-
-        while rem and current_z < cH and layer_count < max_layers:
-            layer_height = self.select_layer_height_interleaved(rem, cH - current_z)
-            if layer_height is None:
-                break
-
-            placed_in_layer = self.build_layer_by_length_skyline(rem, cL, cW, layer_height, current_z)
-            if not placed_in_layer:
-                possible_heights = sorted({it["H"] for it in rem if it["H"] <= (cH-current_z)})
-                smaller = [h for h in possible_heights if h < layer_height]
-                if smaller:
-                    layer_height = max(smaller)
-                    placed_in_layer = self.build_layer_by_length_skyline(rem, cL, cW, layer_height, current_z)
-                if not placed_in_layer:
-                    break
-
-            layers.append({
-                "name": f"Layer_{layer_count+1}",
-                "z": current_z,
-                "height": layer_height,
-                "boxes": placed_in_layer
-            })
-
-            packed_total.extend(placed_in_layer)
-            placed_uids = set(b["uid"] for b in placed_in_layer)
-            rem = [r for r in rem if r["uid"] not in placed_uids]
-
-            current_z += layer_height
-            layer_count += 1
-
-        return packed_total, layers
-
-    def normalize_dimensions_simple(self, items, tolerance=5):
-        if not items:
-            return items
-        groups = []
-        normalized = []
-        for it in items:
-            matched = False
-            for g in groups:
-                if it["NoID"] == g["NoID"] and abs(it["L"]-g["L"])<=tolerance and abs(it["W"]-g["W"])<=tolerance and abs(it["H"]-g["H"])<=tolerance:
-                    matched = True
-                    normalized.append({"L": g["L"], "W": g["W"], "H": g["H"], "NoID": it["NoID"], "uid": it["uid"], "rotate": it["rotate"]})
-                    break
-            if not matched:
-                groups.append({"L": it["L"], "W": it["W"], "H": it["H"], "NoID": it["NoID"]})
-                normalized.append(it.copy())
-        return normalized
-
-    def select_layer_height_interleaved(self, items, remaining_height):
-        heights = sorted([it["H"] for it in items if it["H"] <= remaining_height])
-        if not heights:
-            return None
-        
-        n = len(heights)
-        p30 = heights[max(0, int(n*0.7)-1)]
-        tall = [h for h in heights if h >= p30]
-        short = [h for h in heights if h <= heights[max(0, int(n*0.3)-1)]]
-
-        height_counts = Counter(heights)
-        mode_height = height_counts.most_common(1)[0][0]
-        
-        if len(tall) > len(short):
-            chosen = min(tall)
-        elif len(short) > len(tall):
-            chosen = max(short)
-        else:
-            chosen = mode_height
-
-        if chosen > remaining_height:
-            chosen = remaining_height
-        return chosen
-
-    # =============================================================
-    # CẢI TIẾN CHÍNH: ƯU TIÊN ITEM CÓ CHIỀU CAO CHÊNH NHAU ≤ tolerance mm CÙNG LAYER
-    # (ĐÃ THAY ĐỔI TỪ 10mm CỐ ĐỊNH SANG GIÁ TRỊ TỪ BIẾN self.height_tolerance_var)
-    # =============================================================
-    
-    def build_layer_by_length_skyline(self, items, cL, cW, layer_height, current_z):
-        """Xây dựng layer với cải tiến cho phép item có chiều cao chênh nhau ≤ tolerance mm"""
-        candidates = []
-        for it in items:
-            if self.can_item_fit_in_layer_with_tolerance(it, cL, cW, layer_height):
-                candidates.append(it.copy())
-
-        if not candidates:
-            return []
-
-        candidates.sort(key=lambda x: (x["L"]*x["W"], x["H"]), reverse=True)
-
-        placed = []
-        rows = []
-        
-        # Tìm chiều cao thực tế của layer (có thể lớn hơn layer_height nếu có item cao hơn)
-        actual_layer_height = layer_height
-        
-        for it in candidates:
-            # Tạo các biến thể item với tolerance cho phép
-            item_variants = self.generate_item_variants_with_tolerance(it, cL, cW, layer_height)
-            
-            placed_flag = False
-            for variant in item_variants:
-                if variant["L"] > cL or variant["W"] > cW or variant["H"] > (layer_height + self.height_tolerance_var.get()):
-                    continue
-
-                # Cập nhật actual_layer_height nếu item cao hơn layer_height ban đầu
-                if variant["H"] > actual_layer_height:
-                    actual_layer_height = variant["H"]
-
-                for row in rows:
-                    if variant["W"] <= row["height"]:
-                        segs = row["segments"]
-                        x_pos = self.find_x_position_in_segments(segs, variant["L"], cL)
-                        if x_pos is not None:
-                            box = {
-                                "x": x_pos, "y": row["y"], "z": current_z, 
-                                "L": variant["L"], "W": variant["W"], "H": variant["H"], 
-                                "NoID": variant["NoID"], "uid": variant["uid"],
-                                "rotated": variant.get("rotated", False),
-                                "stacked": False,
-                                "stack_level": 1
-                            }
-                            placed.append(box)
-                            row["segments"] = self.update_segments_after_place(segs, x_pos, variant["L"])
-                            placed_flag = True
-                            break
-                if placed_flag:
-                    break
-
-                next_y = sum(r["height"] for r in rows)
-                if next_y + variant["W"] <= cW:
-                    box = {
-                        "x": 0, "y": next_y, "z": current_z, 
-                        "L": variant["L"], "W": variant["W"], "H": variant["H"], 
-                        "NoID": variant["NoID"], "uid": variant["uid"],
-                        "rotated": variant.get("rotated", False),
-                        "stacked": False,
-                        "stack_level": 1
-                    }
-                    placed.append(box)
-                    rows.append({"y": next_y, "height": variant["W"], "segments": [(variant["L"], cL)]})
-                    placed_flag = True
-                    break
-
-        if not placed:
-            return []
-
-        placed_uids = set(b["uid"] for b in placed)
-        remaining_small = [it for it in items if it["uid"] not in placed_uids]
-
-        # Sử dụng chiến lược chồng mới với tính toán tolerance
-        if self.allow_stacking_in_layer.get():
-            remaining_small = self.place_stacked_items_with_tolerance(placed, rows, remaining_small, cL, cW, actual_layer_height, current_z)
-            # Cập nhật remaining_small: loại bỏ các item đã được đặt (có trong placed)
-            placed_uids = set(b["uid"] for b in placed)
-            remaining_small = [it for it in remaining_small if it["uid"] not in placed_uids]
-
-        # Loại bỏ trùng lặp
-        unique = {}
-        final = []
-        for b in placed:
-            if b["uid"] not in unique:
-                unique[b["uid"]] = True
-                final.append(b)
-
-        return final
-
-    def can_item_fit_in_layer_with_tolerance(self, item, cL, cW, layer_height):
-        """Kiểm tra item có thể fit vào layer với tolerance chiều cao"""
-        if not self.allow_height_tolerance.get():
-            # Nếu không bật tolerance, dùng logic cũ
-            return self.can_item_fit_in_layer(item, cL, cW, layer_height)
-        
-        # Với tolerance, cho phép chiều cao lớn hơn đến tolerance mm
-        tolerance_value = self.height_tolerance_var.get()
-        max_allowed_height = layer_height + tolerance_value
-        
-        if item["L"] <= cL and item["W"] <= cW and item["H"] <= max_allowed_height:
-            return True
-        
-        if self.allow_rotation.get() and item["rotate"] == 1:
-            if item["L"] <= cL and item["H"] <= cW and item["W"] <= max_allowed_height:
-                return True
-            if item["W"] <= cL and item["L"] <= cW and item["H"] <= max_allowed_height:
-                return True
-            if item["H"] <= cL and item["L"] <= cW and item["W"] <= max_allowed_height:
-                return True
-            if item["W"] <= cL and item["H"] <= cW and item["L"] <= max_allowed_height:
-                return True
-            if item["H"] <= cL and item["W"] <= cW and item["L"] <= max_allowed_height:
-                return True
-        
-        return False
-
-    def generate_item_variants_with_tolerance(self, item, cL, cW, layer_height):
-        """Tạo các biến thể item với tolerance chiều cao"""
-        variants = []
-        L, W, H = item["L"], item["W"], item["H"]
-        
-        # Sử dụng giá trị tolerance từ biến
-        tolerance_value = self.height_tolerance_var.get() if self.allow_height_tolerance.get() else 0
-        max_allowed_height = layer_height + tolerance_value
-        
-        if L <= cL and W <= cW and H <= max_allowed_height:
-            variants.append({
-                "L": L, "W": W, "H": H, 
-                "NoID": item["NoID"], "uid": item["uid"],
-                "rotated": False
-            })
-        
-        if self.allow_rotation.get() and item["rotate"] == 1:
-            if L <= cL and H <= cW and W <= max_allowed_height:
-                variants.append({
-                    "L": L, "W": H, "H": W, 
-                    "NoID": item["NoID"], "uid": item["uid"],
-                    "rotated": True
-                })
-            
-            if W <= cL and L <= cW and H <= max_allowed_height:
-                variants.append({
-                    "L": W, "W": L, "H": H, 
-                    "NoID": item["NoID"], "uid": item["uid"],
-                    "rotated": True
-                })
-            
-            if H <= cL and L <= cW and W <= max_allowed_height:
-                variants.append({
-                    "L": H, "W": L, "H": W, 
-                    "NoID": item["NoID"], "uid": item["uid"],
-                    "rotated": True
-                })
-            
-            if W <= cL and H <= cW and L <= max_allowed_height:
-                variants.append({
-                    "L": W, "W": H, "H": L, 
-                    "NoID": item["NoID"], "uid": item["uid"],
-                    "rotated": True
-                })
-            
-            if H <= cL and W <= cW and L <= max_allowed_height:
-                variants.append({
-                    "L": H, "W": W, "H": L, 
-                    "NoID": item["NoID"], "uid": item["uid"],
-                    "rotated": True
-                })
-        
-        variants.sort(key=lambda x: x["L"] * x["W"], reverse=True)
-        
-        return variants
-
-    def place_stacked_items_with_tolerance(self, placed, rows, remaining_items, cL, cW, layer_height, current_z):
-        """Đặt các item chồng với tolerance chiều cao"""
-        strategy = self.stack_strategy.get()
-        
-        if strategy == "2d_packing":
-            return self.place_stacked_items_2d_packing_with_tolerance(placed, rows, remaining_items, cL, cW, layer_height, current_z)
-        elif strategy == "same_spot":
-            return self.place_stacked_items_same_spot_with_tolerance(placed, rows, remaining_items, cL, cW, layer_height, current_z)
-        else:  # "separate"
-            return self.place_stacked_items_separate_with_tolerance(placed, rows, remaining_items, cL, cW, layer_height, current_z)
-
-    def place_stacked_items_2d_packing_with_tolerance(self, placed, rows, remaining_items, cL, cW, layer_height, current_z):
-        """Chiến lược 2D packing với tolerance chiều cao"""
-        if not remaining_items:
-            return remaining_items
-            
-        updated_remaining = remaining_items[:]
-        
-        # Tìm các base item có H_base < layer_height (có tính tolerance)
-        base_items = [box for box in placed if box["H"] < layer_height]
-        # Sắp xếp base từ lớn → nhỏ (ưu tiên base lớn để đặt nhiều item con)
-        base_items.sort(key=lambda x: x["L"] * x["W"], reverse=True)
-
-        for base in base_items:
-            gap_h = layer_height - base["H"]
-            if gap_h <= 0:
-                continue
-
-            # Lọc các item nhỏ chưa đặt, có thể xếp lên base này (có tính tolerance)
-            candidate_small = [it for it in updated_remaining]
-            
-            if not candidate_small:
-                continue
-
-            # === Packing cục bộ 2D trên mặt base ===
-            local_placed = []
-            rows_local = []
-            
-            # Sắp xếp item nhỏ theo diện tích giảm dần
-            candidates_for_base = []
-            for s in candidate_small:
-                variants = self.generate_item_variants_with_tolerance(s, 
-                                                                    base["L"], base["W"], gap_h)
-                for v in variants:
-                    if v["L"] <= base["L"] and v["W"] <= base["W"] and v["H"] <= gap_h:
-                        candidates_for_base.append({
-                            "item": s,
-                            "variant": v
-                        })
-                        break
-
-            candidates_for_base.sort(key=lambda x: x["variant"]["L"] * x["variant"]["W"], reverse=True)
-
-            stacked_uids = []
-            
-            for cand in candidates_for_base:
-                s = cand["item"]
-                v = cand["variant"]
-                placed_flag = False
-
-                # Thử đặt vào các row hiện có
-                for row in rows_local:
-                    if v["W"] <= row["height"]:
-                        segs = row["segments"]
-                        x_pos = self.find_x_position_in_segments(segs, v["L"], base["L"])
-                        if x_pos is not None:
-                            local_placed.append({
-                                "x": x_pos,
-                                "y": row["y"],
-                                "h": v["H"],
-                                "variant": v,
-                                "uid": s["uid"]
-                            })
-                            row["segments"] = self.update_segments_after_place(segs, x_pos, v["L"])
-                            placed_flag = True
-                            stacked_uids.append(s["uid"])
-                            break
-
-                # Nếu không đặt được → tạo row mới
-                if not placed_flag:
-                    next_y = sum(r["height"] for r in rows_local)
-                    if next_y + v["W"] <= base["W"]:
-                        local_placed.append({
-                            "x": 0,
-                            "y": next_y,
-                            "h": v["H"],
-                            "variant": v,
-                            "uid": s["uid"]
-                        })
-                        rows_local.append({
-                            "y": next_y,
-                            "height": v["W"],
-                            "segments": self.update_segments_after_place([(0, base["L"])], 0, v["L"])
-                        })
-                        placed_flag = True
-                        stacked_uids.append(s["uid"])
-
-                if placed_flag:
-                    # Đánh dấu đã dùng, không dùng cho base khác
-                    updated_remaining = [r for r in updated_remaining if r["uid"] != s["uid"]]
-
-            # === Sau khi packing cục bộ, gán tọa độ thực tế vào placed ===
-            current_z_stack = base["z"] + base["H"]
-            local_placed.sort(key=lambda b: (b["y"], b["x"]))
-
-            for stacked_box_local in local_placed:
-                v = stacked_box_local["variant"]
-                s = None
-                for cand in candidates_for_base:
-                    if cand["item"]["uid"] == stacked_box_local["uid"]:
-                        s = cand["item"]
-                        break
-                
-                if s is None:
-                    continue
-                    
-                stacked_box = {
-                    "x": base["x"] + stacked_box_local["x"],
-                    "y": base["y"] + stacked_box_local["y"],
-                    "z": current_z_stack,
-                    "L": v["L"],
-                    "W": v["W"],
-                    "H": v["H"],
-                    "NoID": s["NoID"],
-                    "uid": s["uid"],
-                    "rotated": v.get("rotated", False),
-                    "stacked": True,
-                    "stack_level": 2
-                }
-                placed.append(stacked_box)
-                current_z_stack += v["H"]
-                if current_z_stack - (base["z"] + base["H"]) >= gap_h:
-                    break
-
-        return updated_remaining
-
-    def place_stacked_items_same_spot_with_tolerance(self, placed, rows, remaining_items, cL, cW, layer_height, current_z):
-        """Chiến lược same spot với tolerance chiều cao"""
-        if not remaining_items:
-            return remaining_items
-            
-        updated_remaining = remaining_items[:]
-        base_items = [box for box in placed if box["H"] < layer_height]
-        base_items.sort(key=lambda x: x["L"] * x["W"], reverse=True)
-        
-        stacked_uids = set()
-        
-        for base in base_items:
-            gap_h = layer_height - base["H"]
-            if gap_h <= 0:
-                continue
-                
-            stackable_items = []
-            for i, s in enumerate(updated_remaining):
-                if s["uid"] in stacked_uids:
-                    continue
-                small_variants = self.generate_item_variants_with_tolerance(s, base["L"], base["W"], gap_h)
-                
-                for variant in small_variants:
-                    if variant["L"] <= base["L"] and variant["W"] <= base["W"] and variant["H"] <= gap_h:
-                        stackable_items.append({
-                            "item": s,
-                            "variant": variant,
-                            "index": i,
-                            "height": variant["H"]
-                        })
-                        break
-            
-            stackable_items.sort(key=lambda x: x["height"], reverse=True)
-            
-            best_stack = []
-            best_height = 0
-            
-            # Tìm tổ hợp tốt nhất
-            for i in range(len(stackable_items)):
-                current_stack = []
-                current_height = 0
-                
-                for j in range(i, len(stackable_items)):
-                    s_item = stackable_items[j]
-                    if current_height + s_item["height"] <= gap_h:
-                        current_stack.append(s_item)
-                        current_height += s_item["height"]
-                        
-                        if abs(current_height - gap_h) < 1:
-                            break
-                
-                if current_height > best_height:
-                    best_height = current_height
-                    best_stack = current_stack.copy()
-            
-            # Đặt các item chồng lên cùng vị trí
-            if best_stack:
-                current_z_stack = current_z + base["H"]
-                stack_level = 2
-                for stack_item in best_stack:
-                    variant = stack_item["variant"]
-                    s = stack_item["item"]
-                    
-                    stacked_box = {
-                        "x": base["x"],
-                        "y": base["y"], 
-                        "z": current_z_stack,
-                        "L": variant["L"],
-                        "W": variant["W"],
-                        "H": variant["H"],
-                        "NoID": s["NoID"],
-                        "uid": s["uid"],
-                        "rotated": variant.get("rotated", False),
-                        "stacked": True,
-                        "stack_level": stack_level
-                    }
-                    
-                    placed.append(stacked_box)
-                    stacked_uids.add(s["uid"])
-                    current_z_stack += variant["H"]
-                    stack_level += 1
-
-        updated_remaining = [item for item in updated_remaining if item["uid"] not in stacked_uids]
-        return updated_remaining
-
-    def place_stacked_items_separate_with_tolerance(self, placed, rows, remaining_items, cL, cW, layer_height, current_z):
-        """Chiến lược separate với tolerance chiều cao"""
-        if not remaining_items:
-            return remaining_items
-            
-        updated_remaining = remaining_items[:]
-        
-        stackable_areas = []
-        for box in placed:
-            if box["H"] < layer_height * 0.7:
-                stackable_areas.append({
-                    "base_box": box,
-                    "remaining_height": layer_height - box["H"],
-                    "used_height": 0
-                })
-        
-        stackable_areas.sort(key=lambda x: (x["base_box"]["L"] * x["base_box"]["W"]), reverse=True)
-        
-        stacked_uids = set()
-        
-        for area in stackable_areas:
-            if area["remaining_height"] <= 0 or not updated_remaining:
-                continue
-                
-            base_box = area["base_box"]
-            max_height = area["remaining_height"]
-            
-            stackable_candidates = []
-            for i, item in enumerate(updated_remaining):
-                if item["uid"] in stacked_uids:
-                    continue
-                variants = self.generate_item_variants_with_tolerance(item, base_box["L"], base_box["W"], max_height)
-                for variant in variants:
-                    if (variant["L"] <= base_box["L"] and 
-                        variant["W"] <= base_box["W"] and 
-                        variant["H"] <= max_height):
-                        stackable_candidates.append({
-                            "item": item,
-                            "variant": variant,
-                            "index": i
-                        })
-                        break
-            
-            if not stackable_candidates:
-                continue
-            
-            stackable_candidates.sort(key=lambda x: x["variant"]["H"], reverse=True)
-            
-            for candidate in stackable_candidates:
-                variant = candidate["variant"]
-                item = candidate["item"]
-                
-                found_position = self.find_position_near_base(placed, rows, base_box, variant, cL, cW)
-                
-                if found_position:
-                    stacked_box = {
-                        "x": found_position["x"],
-                        "y": found_position["y"], 
-                        "z": current_z + base_box["H"],
-                        "L": variant["L"],
-                        "W": variant["W"],
-                        "H": variant["H"],
-                        "NoID": item["NoID"],
-                        "uid": item["uid"],
-                        "rotated": variant.get("rotated", False),
-                        "stacked": True,
-                        "stack_level": 2
-                    }
-                    
-                    placed.append(stacked_box)
-                    stacked_uids.add(item["uid"])
-                    
-                    self.update_rows_for_stacked_item(rows, stacked_box, cL)
-                    
-                    area["used_height"] += variant["H"]
-                    area["remaining_height"] -= variant["H"]
-                    
-                    if area["remaining_height"] > 0:
-                        for i2, item2 in enumerate(updated_remaining):
-                            if item2["uid"] in stacked_uids:
-                                continue
-                            variants2 = self.generate_item_variants_with_tolerance(item2, variant["L"], variant["W"], area["remaining_height"])
-                            for variant2 in variants2:
-                                if (variant2["L"] <= variant["L"] and 
-                                    variant2["W"] <= variant["W"] and 
-                                    variant2["H"] <= area["remaining_height"]):
-                                    
-                                    stacked_box2 = {
-                                        "x": found_position["x"],
-                                        "y": found_position["y"], 
-                                        "z": current_z + base_box["H"] + variant["H"],
-                                        "L": variant2["L"],
-                                        "W": variant2["W"],
-                                        "H": variant2["H"],
-                                        "NoID": item2["NoID"],
-                                        "uid": item2["uid"],
-                                        "rotated": variant2.get("rotated", False),
-                                        "stacked": True,
-                                        "stack_level": 3
-                                    }
-                                    
-                                    placed.append(stacked_box2)
-                                    stacked_uids.add(item2["uid"])
-                                    break
-                            break
-                    
-                    break
-
-        updated_remaining = [item for item in updated_remaining if item["uid"] not in stacked_uids]
-        return updated_remaining
-
-    # Các hàm helper cần giữ lại
-    def can_item_fit_in_layer(self, item, cL, cW, layer_height):
-        """Hàm cũ để tương thích"""
-        if item["L"] <= cL and item["W"] <= cW and item["H"] <= layer_height:
-            return True
-        
-        if self.allow_rotation.get() and item["rotate"] == 1:
-            if item["L"] <= cL and item["H"] <= cW and item["W"] <= layer_height:
-                return True
-            if item["W"] <= cL and item["L"] <= cW and item["H"] <= layer_height:
-                return True
-            if item["H"] <= cL and item["L"] <= cW and item["W"] <= layer_height:
-                return True
-            if item["W"] <= cL and item["H"] <= cW and item["L"] <= layer_height:
-                return True
-            if item["H"] <= cL and item["W"] <= cW and item["L"] <= layer_height:
-                return True
-        
-        return False
-
-    def generate_item_variants(self, item, cL, cW, layer_height):
-        """Hàm cũ để tương thích"""
-        variants = []
-        L, W, H = item["L"], item["W"], item["H"]
-        
-        if L <= cL and W <= cW and H <= layer_height:
-            variants.append({
-                "L": L, "W": W, "H": H, 
-                "NoID": item["NoID"], "uid": item["uid"],
-                "rotated": False
-            })
-        
-        if self.allow_rotation.get() and item["rotate"] == 1:
-            if L <= cL and H <= cW and W <= layer_height:
-                variants.append({
-                    "L": L, "W": H, "H": W, 
-                    "NoID": item["NoID"], "uid": item["uid"],
-                    "rotated": True
-                })
-            
-            if W <= cL and L <= cW and H <= layer_height:
-                variants.append({
-                    "L": W, "W": L, "H": H, 
-                    "NoID": item["NoID"], "uid": item["uid"],
-                    "rotated": True
-                })
-            
-            if H <= cL and L <= cW and W <= layer_height:
-                variants.append({
-                    "L": H, "W": L, "H": W, 
-                    "NoID": item["NoID"], "uid": item["uid"],
-                    "rotated": True
-                })
-            
-            if W <= cL and H <= cW and L <= layer_height:
-                variants.append({
-                    "L": W, "W": H, "H": L, 
-                    "NoID": item["NoID"], "uid": item["uid"],
-                    "rotated": True
-                })
-            
-            if H <= cL and W <= cW and L <= layer_height:
-                variants.append({
-                    "L": H, "W": W, "H": L, 
-                    "NoID": item["NoID"], "uid": item["uid"],
-                    "rotated": True
-                })
-        
-        variants.sort(key=lambda x: x["L"] * x["W"], reverse=True)
-        
-        return variants
-
-    def find_position_near_base(self, placed, rows, base_box, variant, cL, cW):
-        """Tìm vị trí trống gần base_box để đặt item chồng"""
-        
-        candidate_positions = [
-            {"x": base_box["x"] + base_box["L"], "y": base_box["y"]},
-            {"x": max(0, base_box["x"] - variant["L"]), "y": base_box["y"]},
-            {"x": base_box["x"], "y": base_box["y"] + base_box["W"]},
-            {"x": base_box["x"], "y": max(0, base_box["y"] - variant["W"])},
-            {"x": base_box["x"] + base_box["L"], "y": base_box["y"] + base_box["W"]},
-        ]
-        
-        for pos in candidate_positions:
-            if (pos["x"] + variant["L"] <= cL and 
-                pos["y"] + variant["W"] <= cW and
-                pos["x"] >= 0 and pos["y"] >= 0):
-                
-                overlap = False
-                test_rect = {
-                    "x": pos["x"], 
-                    "y": pos["y"], 
-                    "L": variant["L"], 
-                    "W": variant["W"]
-                }
-                
-                for box in placed:
-                    if self.boxes_overlap(test_rect, box):
-                        overlap = True
-                        break
-                
-                if not overlap:
-                    return pos
-        
-        for row in rows:
-            segs = row["segments"]
-            x_pos = self.find_x_position_in_segments(segs, variant["L"], cL)
-            if x_pos is not None:
-                test_rect = {"x": x_pos, "y": row["y"], "L": variant["L"], "W": variant["W"]}
-                if not self.boxes_overlap(test_rect, base_box):
-                    return {"x": x_pos, "y": row["y"]}
-        
-        return None
-
-    def boxes_overlap(self, rect1, rect2):
-        """Kiểm tra hai hình chữ nhật có chồng lên nhau không"""
-        return not (rect1["x"] + rect1["L"] <= rect2["x"] or
-                    rect2["x"] + rect2["L"] <= rect1["x"] or
-                    rect1["y"] + rect1["W"] <= rect2["y"] or
-                    rect2["y"] + rect2["W"] <= rect1["y"])
-
-    def update_rows_for_stacked_item(self, rows, stacked_box, cL):
-        """Cập nhật rows khi đặt item chồng"""
-        for row in rows:
-            if row["y"] <= stacked_box["y"] < row["y"] + row["height"]:
-                segs = row["segments"]
-                row["segments"] = self.update_segments_after_place(segs, stacked_box["x"], stacked_box["L"])
-                break
-        else:
-            rows.append({
-                "y": stacked_box["y"],
-                "height": stacked_box["W"],
-                "segments": [(stacked_box["L"], cL)]
-            })
-
-    def find_x_position_in_segments(self, segments, length_needed, cL):
-        for (start, end) in segments:
-            if end - start >= length_needed:
-                return start
-        return None
-
-    def update_segments_after_place(self, segments, x_pos, length):
-        new = []
-        for (s, e) in segments:
-            if x_pos >= e or (x_pos + length) <= s:
-                new.append((s, e))
-            else:
-                if s < x_pos:
-                    new.append((s, x_pos))
-                if x_pos + length < e:
-                    new.append((x_pos + length, e))
-        new.sort()
-        merged = []
-        for seg in new:
-            if not merged:
-                merged.append(seg)
-            else:
-                last = merged[-1]
-                if last[1] >= seg[0]:
-                    merged[-1] = (last[0], max(last[1], seg[1]))
+                if previous:
+                    solution = engine.repack_incremental(raw_items, (cL, cW, cH), previous)
                 else:
-                    merged.append(seg)
-        return merged
+                    solution = engine.pack(raw_items, (cL, cW, cH))
+                self.opt_output["solution"] = solution
+                self.opt_output["lower_bounds"] = engine.lower_bounds
+                if solution:
+                    self.opt_output["rotation_analysis"] = engine.analyze_rotation_improvement(raw_items, cL, cW, cH)
+            except Exception as e:
+                self.opt_output["error"] = e
+
+        self.calc_button.config(state="disabled")
+        self.cancel_button.config(state="normal")
+        self.opt_progress_bar["value"] = 0
+        self.opt_thread = threading.Thread(target=worker, daemon=True)
+        self.opt_thread.start()
+        self.root.after(100, self._poll_optimization)
+
+    def cancel_optimization(self):
+        """Dừng tìm kiếm, giữ lời giải tốt nhất đã có"""
+        if self.opt_progress is not None:
+            self.opt_progress.cancel()
+            self.opt_status_label.config(text="Đang dừng...", foreground="red")
+
+    def _poll_optimization(self, finish=None):
+        snap = self.opt_progress.snapshot()
+        if snap["total_items"]:
+            self.opt_progress_bar["value"] = 100 * snap["items_packed"] / snap["total_items"]
+        self.opt_status_label.config(
+            text=f"{snap['stage']} - Xe: {snap['containers_done']} | Lớp: {snap['layers_built']} | {snap['elapsed']:.1f}s",
+            foreground="red" if snap["cancelled"] else "blue"
+        )
 
-    def pack_gap_filling_interleaved(self, items, cL, cW, cH):
-        return self.pack_gap_filling(items, cL, cW, cH)
+        if self.opt_thread.is_alive():
+            self.root.after(100, self._poll_optimization, finish)
+            return
 
-    def pack_greedy_layer_based(self, items, cL, cW, cH):
-        return self.pack_gap_filling(items, cL, cW, cH)
+        self.calc_button.config(state="normal")
+        self.cancel_button.config(state="disabled")
+        (finish or self._finish_optimization)(snap)
 
-    def pack_hybrid_approach(self, items, cL, cW, cH):
-        return self.pack_gap_filling(items, cL, cW, cH)
+    def _finish_optimization(self, snap):
+        output = self.opt_output or {}
+        if "error" in output:
+            messagebox.showerror("Lỗi", f"Lỗi khi tính toán:\n{output['error']}")
+            return
 
-    def normalize_dimensions_advanced(self, items, tolerance=5):
-        if not self.group_similar.get():
-            return items
-            
-        normalized = []
-        dimension_groups = {}
-        
-        for item in items:
-            found_group = None
-            for group_key in dimension_groups:
-                Lg, Wg, Hg, IDg, rotate_g = group_key
-                
-                size_match = (abs(item["L"] - Lg) <= tolerance and 
-                             abs(item["W"] - Wg) <= tolerance and 
-                             abs(item["H"] - Hg) <= tolerance)
-                
-                type_match = item["NoID"] == IDg
-                rotate_match = item["rotate"] == rotate_g
-                
-                if size_match and type_match and rotate_match:
-                    found_group = group_key
-                    break
-                    
-                if item["rotate"] == 1:
-                    permutations = [
-                        (item["L"], item["W"], item["H"]),
-                        (item["L"], item["H"], item["W"]),
-                        (item["W"], item["L"], item["H"]),
-                        (item["W"], item["H"], item["L"]),
-                        (item["H"], item["L"], item["W"]),
-                        (item["H"], item["W"], item["L"])
-                    ]
-                    
-                    for perm in permutations:
-                        if (abs(perm[0] - Lg) <= tolerance and 
-                            abs(perm[1] - Wg) <= tolerance and 
-                            abs(perm[2] - Hg) <= tolerance and
-                            item["NoID"] == IDg and
-                            item["rotate"] == rotate_g):
-                            found_group = group_key
-                            item["L"], item["W"], item["H"] = Lg, Wg, Hg
-                            break
-                        if found_group:
-                            break
-            
-            if found_group:
-                new_item = item.copy()
-                new_item["L"] = dimension_groups[found_group]["L"]
-                new_item["W"] = dimension_groups[found_group]["W"] 
-                new_item["H"] = dimension_groups[found_group]["H"]
-                normalized.append(new_item)
+        best_solution = output.get("solution")
+        if not best_solution:
+            if snap["cancelled"]:
+                self.opt_status_label.config(text="Đã hủy - chưa có lời giải", foreground="red")
             else:
-                group_key = (item["L"], item["W"], item["H"], item["NoID"], item["rotate"])
-                dimension_groups[group_key] = item
-                normalized.append(item)
-                
-        return normalized
+                messagebox.showerror("Lỗi", "Không thể xếp hàng vào container!")
+            return
 
-    def sort_layers_by_z(self, container):
-        """Sắp xếp layers theo Z tăng dần (Z1 ở dưới cùng, Zn ở trên cùng)"""
-        layers = container["layers"]
-        layers_sorted = sorted(layers, key=lambda x: x["z"])
-        
-        current_z = 0
-        for idx, layer in enumerate(layers_sorted):
-            layer["name"] = f"Lớp Z{idx+1}"
-            layer["z"] = current_z
-            for box in layer["boxes"]:
-                box["z"] = current_z
-            current_z += layer["height"]
-        
-        container["layers"] = layers_sorted
+        self.result = best_solution
+        self.rotation_analysis = output.get("rotation_analysis")
+        self.lower_bounds = output.get("lower_bounds")
 
-    def analyze_rotation_improvement(self, raw_items, cL, cW, cH):
-        analysis = {
-            "improved_items": [],
-            "summary": {}
-        }
-        
-        item_types = defaultdict(list)
-        for item in raw_items:
-            item_types[item["NoID"]].append(item)
-        
-        for item_type, items in item_types.items():
-            if not items:
-                continue
-                
-            sample_item = items[0]
-            L, W, H = sample_item["L"], sample_item["W"], sample_item["H"]
-            
-            if sample_item["rotate"] != 1:
-                continue
-            
-            orientations = [
-                (L, W, H),
-                (L, H, W),
-                (W, L, H),
-                (W, H, L),
-                (H, L, W),
-                (H, W, L)
-            ]
-            
-            best_count = 0
-            best_orientation = orientations[0]
-            
-            for orientation in orientations:
-                count = self.calculate_possible_count(orientation[0], orientation[1], orientation[2], cL, cW, cH)
-                if count > best_count:
-                    best_count = count
-                    best_orientation = orientation
-            
-            original_count = self.calculate_possible_count(L, W, H, cL, cW, cH)
-            
-            if best_count > original_count:
-                improvement = ((best_count - original_count) / original_count) * 100
-                
-                analysis["improved_items"].append({
-                    "type": item_type,
-                    "original": (L, W, H),
-                    "best_orientation": best_orientation,
-                    "original_count": original_count,
-                    "best_count": best_count,
-                    "improvement": improvement,
-                    "quantity": len(items)
-                })
-        
-        analysis["improved_items"].sort(key=lambda x: x["improvement"], reverse=True)
+        packed_total = sum(c["packed_count"] for c in best_solution)
+        self.opt_progress_bar["value"] = 100 * packed_total / snap["total_items"]
+        status = f"Xong: {len(best_solution)} xe - {snap['elapsed']:.1f}s"
+        if snap["cancelled"]:
+            status = f"Đã hủy - giữ lời giải tốt nhất: {len(best_solution)} xe"
+        self.opt_status_label.config(text=status, foreground="red" if snap["cancelled"] else "green")
         
-        if analysis["improved_items"]:
-            total_items = sum(item["quantity"] for item in analysis["improved_items"])
-            avg_improvement = sum(item["improvement"] for item in analysis["improved_items"]) / len(analysis["improved_items"])
-            analysis["summary"] = {
-                "total_improved_types": len(analysis["improved_items"]),
-                "total_improved_items": total_items,
-                "avg_improvement": avg_improvement
-            }
+        self.display_advanced_results()
+        self.update_visualizer_controls()
+        self.update_full_visualizer_controls()
+        self.draw_cross_sections()
         
-        return analysis
+        # Cập nhật Tab 2
+        if hasattr(self, 'tab2_cross_container'):
+            self.update_tab2_controls()
 
-    def calculate_possible_count(self, L, W, H, cL, cW, cH):
-        count_x = cL // L
-        count_y = cW // W  
-        count_z = cH // H
-        
-        total = count_x * count_y * count_z
-        
-        count_x2 = cL // L
-        count_y2 = cW // H
-        count_z2 = cH // W
-        
-        total2 = count_x2 * count_y2 * count_z2
-        
-        return max(total, total2)
+        if packed_total < snap["total_items"]:
+            messagebox.showwarning("Cảnh báo", f"Kết quả chưa đầy đủ: mới xếp {packed_total}/{snap['total_items']} kiện!")
 
     # =============================================================
     # DISPLAY FUNCTIONS
@@ -4411,6 +3579,12 @@ class ContainerAppAdvanced:
         self.result_text.insert("end", "="*50 + "\n")
         self.result_text.insert("end", f"Chiến lược tốt nhất: {best_strategy}\n", "BEST")
         self.result_text.insert("end", f"Tổng số xe: {len(self.result)}\n")
+        if self.lower_bounds:
+            lb = self.lower_bounds
+            self.result_text.insert("end", f"Cận dưới số xe: {lb['best']} (thể tích {lb['volume']}, "
+                                           f"L1 {lb['l1']}, L2 {lb['l2']})\n")
+            if len(self.result) <= lb["best"]:
+                self.result_text.insert("end", "Số xe đã tối ưu (bằng cận dưới)\n", "BEST")
         self.result_text.insert("end", f"Tổng kiện hàng: {total_items}\n")
         self.result_text.insert("end", f"Độ đầy trung bình: {overall_fill_rate:.1f}%\n")
         
@@ -4513,6 +3687,9 @@ class ContainerAppAdvanced:
             self.result_text.insert("end", f"{i+1}. {item['type']}:\n", "ROTATE")
             self.result_text.insert("end", f"   Kích thước gốc: {item['original'][0]}×{item['original'][1]}×{item['original'][2]}mm\n")
             self.result_text.insert("end", f"   Kích thước tối ưu: {item['best_orientation'][0]}×{item['best_orientation'][1]}×{item['best_orientation'][2]}mm\n")
+            if len(item.get("pattern", ())) > 1:
+                mix = " + ".join(f"{n}×({o[0]}×{o[1]}×{o[2]})" for o, n in item["pattern"])
+                self.result_text.insert("end", f"   Trộn hướng: {mix}\n")
             self.result_text.insert("end", f"   Số lượng xếp được: {item['original_count']} → {item['best_count']} (+{item['improvement']:.1f}%)\n")
             self.result_text.insert("end", f"   Số lượng hiện có: {item['quantity']} kiện\n")
             self.result_text.insert("end", "\n")
@@ -5678,31 +4855,7 @@ class ContainerAppAdvanced:
     # =============================================================
     
     def load_sample(self):
-        sample_data = [
-            (2590, 300, 160, 54, "C100", 1),
-            (2590, 300, 160, 10, "C101", 1),
-            (2590, 300, 160, 1, "C102", 1),
-            (2600, 172, 160, 5, "C106", 1),
-            (2960, 230, 220, 27, "B109", 1),
-            (2960, 230, 220, 1, "B156", 1),
-            (2990, 330, 220, 78, "L100", 1),
-            (2990, 330, 220, 9, "L101", 1),
-            (2990, 330, 220, 4, "L152", 1),
-            (2990, 395, 225, 24, "L106", 1),
-            (2990, 395, 225, 3, "L107", 1),
-            (2990, 395, 225, 1, "L153", 1),
-            (3155, 230, 220, 3, "B100", 1),
-            (3865, 212, 211, 5, "L180", 1),
-            (3865, 230, 220, 10, "B164", 1),
-            (3890, 330, 220, 50, "L156", 1),
-            (3890, 398, 225, 5, "L157", 1),
-            (4050, 230, 220, 15, "B103", 1),
-            (4955, 230, 220, 9, "B106", 1),
-            (4955, 230, 220, 5, "B161", 1),
-            (4955, 230, 220, 1, "B162", 1),
-            (6050, 230, 220, 5, "B180", 1),
-        ]
-        for d in sample_data: 
+        for d in SAMPLE_MANIFEST:
             self.data_tree.insert("", "end", values=d)
 
     def add_row_dialog(self):
@@ -5747,6 +4900,7 @@ class ContainerAppAdvanced:
                     
                 self.data_tree.insert("", "end", values=(L, W, H, Q, ID, rotate))
                 top.destroy()
+                self.run_incremental_repack()
             except ValueError as e:
                 messagebox.showerror("Lỗi", f"Dữ liệu không hợp lệ!\n{str(e)}")
         
@@ -6062,6 +5216,9 @@ def ask_password(main_window):
 # MAIN APPLICATION LAUNCH - SILENT VERSION
 # =============================================================
 if __name__ == "__main__":
+    # 0. Bản đóng gói (frozen): process con của engine không được chạy lại GUI
+    multiprocessing.freeze_support()
+
     # 1. SILENT license check - No console output
     if not check_license():
         # License check failed - exit silently without any message
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark bộ dựng layer: skyline theo row so với MaxRects (bssf / baf),
+và engine 3D extreme point (không chia layer).
+
+Chạy:
+    python bench_packing.py > bench_output.txt
+    python bench_packing.py --repeat 3 --scale 1 4
+
+Mỗi manifest được xếp bằng chiến lược đơn (GFBUp) với từng bộ dựng layer;
+in số container, số kiện đã xếp, tỷ lệ lấp đầy thể tích, tỷ lệ trúng cache mẫu
+layer và thời gian. Cache mẫu layer được xóa trước mỗi lần đo nên thời gian là
+của lần chạy nguội (trúng cache chỉ đến từ các container trong cùng lần chạy).
+"""
+
+import argparse
+import random
+import time
+
+from packing_engine import PackingEngine, PackingOptions, SAMPLE_MANIFEST, LAYER_PATTERNS, count_units
+
+
+CONTAINER = (12000, 2340, 2610)
+
+BUILDERS = [
+    ("skyline", {"use_maxrect": False}),
+    ("maxrects-bssf", {"use_maxrect": True, "maxrect_heuristic": "bssf"}),
+    ("maxrects-baf", {"use_maxrect": True, "maxrect_heuristic": "baf"}),
+    ("extreme-point", {"placement": "extreme_point", "item_order": "volume"}),
+    ("ep-per-unit", {"placement": "extreme_point", "item_order": "volume", "block_building": False}),
+]
+
+
+def manifest_records(rows, scale=1):
+    return [{"L": L, "W": W, "H": H, "count": Q * scale, "NoID": ID, "rotate": r}
+            for L, W, H, Q, ID, r in rows]
+
+
+def mixed_manifest(seed=0, n_sku=40):
+    """Manifest ngẫu nhiên nhiều kiện nhỏ (layer hàng trăm box)"""
+    rnd = random.Random(seed)
+    return [(rnd.randint(200, 1200), rnd.randint(150, 800), rnd.randint(100, 400),
+             rnd.randint(5, 60), f"M{i}", rnd.randint(0, 1)) for i in range(n_sku)]
+
+
+def run_once(records, options):
+    # Cache mẫu layer dùng chung cả process: xóa để lần đo sau không phát lại kết quả lần trước
+    LAYER_PATTERNS.clear()
+    engine = PackingEngine(options)
+    start = time.perf_counter()
+    containers = engine.pack(records, CONTAINER)
+    elapsed = time.perf_counter() - start
+
+    cL, cW, cH = CONTAINER
+    boxes = [b for c in containers for layer in c["layers"] for b in layer["boxes"]]
+    volume = sum(b["L"] * b["W"] * b["H"] for b in boxes)
+    fill = volume / (len(containers) * cL * cW * cH) if containers else 0
+    max_layer = max((len(layer["boxes"]) for c in containers for layer in c["layers"]), default=0)
+    stats = LAYER_PATTERNS.stats()
+    lookups = stats["hits"] + stats["misses"]
+    hit_rate = stats["hits"] / lookups if lookups else 0
+    return len(containers), len(boxes), fill, max_layer, hit_rate, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh skyline và MaxRects trên manifest mẫu")
+    parser.add_argument("--repeat", type=int, default=3, help="số lần đo, lấy thời gian nhỏ nhất")
+    parser.add_argument("--scale", type=int, nargs="+", default=[1, 4], help="nhân số lượng manifest mẫu")
+    args = parser.parse_args()
+
+    manifests = [(f"sample x{k}", manifest_records(SAMPLE_MANIFEST, k)) for k in args.scale]
+    manifests.append(("mixed (40 SKU)", manifest_records(mixed_manifest())))
+
+    print(f"{'manifest':<16} {'builder':<14} {'units':>6} {'cont':>5} {'packed':>7} "
+          f"{'fill %':>7} {'max/layer':>9} {'hit %':>6} {'time s':>8}")
+    for label, records in manifests:
+        for name, changes in BUILDERS:
+            options = PackingOptions(multi_strategy=False, **changes)
+            runs = [run_once(records, options) for _ in range(args.repeat)]
+            n_cont, packed, fill, max_layer, hit_rate, _ = runs[0]
+            best = min(r[-1] for r in runs)
+            print(f"{label:<16} {name:<14} {count_units(records):>6} {n_cont:>5} {packed:>7} "
+                  f"{fill * 100:>7.2f} {max_layer:>9} {hit_rate * 100:>6.1f} {best:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Container Packing Engine - Headless
+Toàn bộ thuật toán xếp kiện (Gap-Filling, skyline theo layer, chồng item thấp)
+tách khỏi giao diện Tk. Module này KHÔNG import tkinter/matplotlib nên có thể
+chạy trong worker process hoặc trên server.
+
+Cách dùng:
+    from packing_engine import PackingOptions, pack
+    items = [{"L": 2990, "W": 330, "H": 220, "NoID": "L100", "rotate": 1, "count": 78}]
+    containers = pack(items, (12000, 2340, 2610), PackingOptions(allow_rotation=True))
+
+Engine làm việc trên bản ghi SKU (kích thước + số lượng còn lại); từng kiện
+chỉ được tạo (kèm uid) khi xuất box vào layer.
+"""
+
+import bisect
+import functools
+import itertools
+import math
+import multiprocessing
+import operator
+import os
+import random
+import threading
+import time
+from collections import defaultdict, Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, replace
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+# =============================================================
+# TÙY CHỌN XẾP KIỆN (BẤT BIẾN)
+# =============================================================
+
+@dataclass(frozen=True)
+class PackingOptions:
+    """Tùy chọn thuật toán - đọc một lần từ GUI, không đổi trong suốt lần chạy"""
+    allow_rotation: bool = True
+    use_maxrect: bool = False  # True: dựng layer bằng MaxRects thay cho skyline theo row
+    maxrect_heuristic: str = "bssf"  # bssf (best short side fit) | baf (best area fit)
+    group_similar: bool = True
+    pack_density: bool = True
+    multi_strategy: bool = True
+    allow_stacking_in_layer: bool = True
+    allow_height_tolerance: bool = True
+    height_tolerance: int = 10
+    stack_strategy: str = "2d_packing"  # 2d_packing | same_spot | separate
+    max_containers: int = 100
+    max_layers: int = 200
+    # Tham số chiến lược (mặc định = GFBUp)
+    layer_height_policy: str = "interleaved"  # interleaved | mode | tallest | best_fill | planned
+    item_order: str = "footprint"  # footprint | height | volume | length
+    row_fit: str = "first"  # first | best
+    # Cách xếp container: layers (theo lớp) | extreme_point (đặt 3D trực tiếp)
+    placement: str = "layers"
+    min_support_ratio: float = 0.75  # extreme_point: tỷ lệ diện tích đáy phải được đỡ
+    # extreme_point: đặt khối nx × ny × nz kiện giống nhau như một vật (False = từng kiện)
+    block_building: bool = True
+    # Beam search theo layer: giữ beam_width container dở dang mỗi độ sâu (0 = tắt, xếp greedy)
+    beam_width: int = 0
+    beam_orders: tuple = ("footprint", "volume")  # thứ tự item thử cho mỗi chiều cao ứng viên
+    # Hai pha: chia hàng cho từng container theo thể tích rồi xếp các container song song
+    two_phase: bool = False
+    assign_fill: float = 0.9  # tỷ lệ thể tích container dùng khi chia hàng
+    # Chạy song song trên process pool (đa chiến lược, quần thể BRKGA)
+    parallel_strategies: bool = True
+    max_workers: int = 0  # 0 = theo số CPU
+    strategy_time_budget: float = 120.0  # giây cho mỗi chiến lược, 0 = không giới hạn
+    # Giai đoạn cải thiện (simulated annealing) sau khi xếp greedy
+    improve_time_budget: float = 0.0  # giây, 0 = tắt
+    improve_seed: int = 0
+    # Tìm kiếm BRKGA (biased random-key GA) thay cho bước xếp greedy
+    use_brkga: bool = False
+    brkga_population: int = 30
+    brkga_generations: int = 40
+    brkga_time_budget: float = 60.0  # giây, 0 = chỉ giới hạn theo số thế hệ
+    brkga_elite_fraction: float = 0.2
+    brkga_mutant_fraction: float = 0.15
+    brkga_inherit_prob: float = 0.7  # xác suất gen con lấy từ cha/mẹ elite
+    brkga_seed: int = 0
+    # Cache mẫu layer (LRU): layer dựng từ cùng tập ứng viên được phát lại thay vì dựng lại
+    layer_pattern_cache: bool = True
+    # Đơn hàng lớn: nhân bản container vừa xếp khi hàng còn lại đủ thêm một bản y hệt
+    replicate_containers: bool = True
+
+    @property
+    def effective_tolerance(self):
+        """Tolerance chiều cao thực tế (0 nếu tắt tùy chọn)"""
+        return self.height_tolerance if self.allow_height_tolerance else 0
+
+    @property
+    def layer_build_key(self):
+        """Các tùy chọn build_layer thực sự đọc (khóa cache mẫu layer).
+
+        Thứ tự item / chính sách chiều cao / seed không nằm ở đây: thứ tự ứng
+        viên đã có trong khóa, các tùy chọn còn lại không đụng tới bộ dựng layer.
+        """
+        return (self.use_maxrect, self.maxrect_heuristic if self.use_maxrect else None,
+                None if self.use_maxrect else self.row_fit, self.allow_rotation, self.effective_tolerance,
+                self.allow_stacking_in_layer and self.stack_strategy)
+
+    def with_changes(self, **changes):
+        """Trả về bản sao options với một số trường thay đổi"""
+        return replace(self, **changes)
+
+
+# =============================================================
+# BẢN GHI SKU (MỖI KÍCH THƯỚC/NoID/ROTATE MỘT DÒNG + SỐ LƯỢNG)
+# =============================================================
+
+def build_sku_records(items):
+    """Gom items thành bản ghi SKU mới {"sku", "L", "W", "H", "NoID", "rotate", "count"}.
+
+    items có thể là từng kiện (không có "count" → 1) hoặc SKU đã có "count".
+    Bản ghi trả về là bản sao, engine được phép trừ "count" khi xếp.
+    """
+    index = {}
+    records = []
+    for it in items:
+        key = (it["L"], it["W"], it["H"], it["NoID"], it.get("rotate", 1))
+        rec = index.get(key)
+        if rec is None:
+            rec = {"sku": len(records), "L": it["L"], "W": it["W"], "H": it["H"],
+                   "NoID": it["NoID"], "rotate": it.get("rotate", 1), "count": 0}
+            index[key] = rec
+            records.append(rec)
+        rec["count"] += it.get("count", 1)
+    return [r for r in records if r["count"] > 0]
+
+
+def count_units(items):
+    """Tổng số kiện của danh sách SKU / từng kiện"""
+    return sum(it.get("count", 1) for it in items)
+
+
+def quality_metric(container_count, used_volume, item_counts, cL, cW, cH):
+    """Điểm lời giải từ các tổng theo container (công thức của evaluate_solution_quality)"""
+    if not container_count:
+        return float('-inf')
+
+    total_volume = cL * cW * cH * container_count
+    volume_utilization = used_volume / total_volume if total_volume > 0 else 0
+
+    max_count = max(item_counts)
+    stability = 1 - (max_count - min(item_counts)) / max_count if max_count > 0 else 1
+
+    return (volume_utilization * 0.5 +
+            (1 / container_count) * 0.3 +
+            stability * 0.2)
+
+
+# Các loại xe/container cho chế độ đội xe (lòng trong, mm); cost là chi phí tương đối mỗi chuyến
+FLEET_TYPES = [
+    {"name": "20ft", "L": 5898, "W": 2352, "H": 2393, "cost": 1.0},
+    {"name": "40ft", "L": 12032, "W": 2352, "H": 2393, "cost": 1.5},
+    {"name": "40HC", "L": 12000, "W": 2340, "H": 2610, "cost": 1.6},
+    {"name": "Xe tải 9m6", "L": 9600, "W": 2350, "H": 2600, "cost": 1.3},
+    {"name": "Xe tải 6m2", "L": 6200, "W": 2200, "H": 2300, "cost": 0.9},
+]
+
+
+# Manifest mẫu (L, W, H, số lượng, NoID, rotate) - nút "Load Mẫu" và bench_packing.py
+SAMPLE_MANIFEST = [
+    (2590, 300, 160, 54, "C100", 1),
+    (2590, 300, 160, 10, "C101", 1),
+    (2590, 300, 160, 1, "C102", 1),
+    (2600, 172, 160, 5, "C106", 1),
+    (2960, 230, 220, 27, "B109", 1),
+    (2960, 230, 220, 1, "B156", 1),
+    (2990, 330, 220, 78, "L100", 1),
+    (2990, 330, 220, 9, "L101", 1),
+    (2990, 330, 220, 4, "L152", 1),
+    (2990, 395, 225, 24, "L106", 1),
+    (2990, 395, 225, 3, "L107", 1),
+    (2990, 395, 225, 1, "L153", 1),
+    (3155, 230, 220, 3, "B100", 1),
+    (3865, 212, 211, 5, "L180", 1),
+    (3865, 230, 220, 10, "B164", 1),
+    (3890, 330, 220, 50, "L156", 1),
+    (3890, 398, 225, 5, "L157", 1),
+    (4050, 230, 220, 15, "B103", 1),
+    (4955, 230, 220, 9, "B106", 1),
+    (4955, 230, 220, 5, "B161", 1),
+    (4955, 230, 220, 1, "B162", 1),
+    (6050, 230, 220, 5, "B180", 1),
+]
+
+
+# =============================================================
+# BẢNG HƯỚNG XOAY (TÍNH MỘT LẦN CHO MỖI SKU)
+# =============================================================
+
+# Hoán vị (L, W, H) theo đúng thứ tự sinh biến thể cũ; phần tử đầu là không xoay
+_ORIENTATIONS = [(0, 1, 2), (0, 2, 1), (1, 0, 2), (2, 0, 1), (1, 2, 0), (2, 1, 0)]
+
+
+def build_orientation_table(item, allow_rotation=True):
+    """Các hướng đặt khác nhau của SKU, sắp theo diện tích đáy giảm dần.
+
+    Trùng kích thước (ví dụ L == W) chỉ giữ hướng sinh ra trước, nên kết quả
+    "hướng đầu tiên vừa" giống hệt danh sách biến thể cũ.
+    """
+    dims = (item["L"], item["W"], item["H"])
+    perms = _ORIENTATIONS if allow_rotation and item.get("rotate", 1) == 1 else _ORIENTATIONS[:1]
+    table = []
+    seen = set()
+    for i, perm in enumerate(perms):
+        L, W, H = (dims[k] for k in perm)
+        if (L, W, H) in seen:
+            continue
+        seen.add((L, W, H))
+        table.append({"L": L, "W": W, "H": H, "NoID": item["NoID"],
+                      "sku": item.get("sku"), "rotate": item.get("rotate", 1), "rotated": i > 0})
+    table.sort(key=lambda v: v["L"] * v["W"], reverse=True)
+    return tuple(table)
+
+
+class FitMatrix:
+    """Ma trận kích thước (n × 6 × 3) của các SKU theo mọi hướng xoay cho phép.
+
+    fits(maxL, maxW, maxH) trả về mask "vừa ở ít nhất một hướng" cho mọi SKU
+    trong một phép so sánh mảng (NumPy); không có NumPy thì duyệt Python.
+    SKU không xoay / ít hướng hơn được lặp lại hướng đầu cho đủ 6 cột.
+    """
+
+    def __init__(self, items, allow_rotation=True):
+        self.items = list(items)
+        self.rows = []
+        for it in self.items:
+            dims = [(v["L"], v["W"], v["H"]) for v in build_orientation_table(it, allow_rotation)]
+            dims += [dims[0]] * (len(_ORIENTATIONS) - len(dims))
+            self.rows.append(dims)
+        self._dims = np.array(self.rows, dtype=float).reshape(-1, len(_ORIENTATIONS), 3) if NUMPY_AVAILABLE else None
+
+    def fits(self, maxL, maxW, maxH):
+        """List bool theo thứ tự items: True nếu vừa (maxL, maxW, maxH) ở một hướng nào đó"""
+        if self._dims is not None:
+            d = self._dims
+            return ((d[:, :, 0] <= maxL) & (d[:, :, 1] <= maxW) & (d[:, :, 2] <= maxH)).any(axis=1).tolist()
+        return [any(L <= maxL and W <= maxW and H <= maxH for L, W, H in dims) for dims in self.rows]
+
+    def fitting(self, maxL, maxW, maxH):
+        """Các item vừa (maxL, maxW, maxH)"""
+        return [it for it, ok in zip(self.items, self.fits(maxL, maxW, maxH)) if ok]
+
+    def not_fitting(self, maxL, maxW, maxH):
+        """Các item không vừa ở bất kỳ hướng nào"""
+        return [it for it, ok in zip(self.items, self.fits(maxL, maxW, maxH)) if not ok]
+
+
+_NEIGHBOUR_OFFSETS = list(itertools.product((-1, 0, 1), repeat=3))
+
+
+class ToleranceIndex:
+    """Chỉ mục lưới cho gom nhóm kích thước ±tolerance.
+
+    Mỗi nhóm nằm trong ô (key, d // cell); hai kích thước chênh ≤ tolerance chỉ
+    lệch nhau tối đa một ô mỗi chiều, nên tra cứu chỉ cần xét 3^3 ô lân cận
+    thay vì so với mọi nhóm. Khi nhiều nhóm cùng khớp, trả về nhóm thêm vào trước.
+    """
+
+    def __init__(self, tolerance):
+        self.tolerance = tolerance
+        self.cell = max(1, tolerance)
+        self._cells = defaultdict(list)
+        self._next_order = 0
+
+    def _cell_of(self, dims):
+        return tuple(d // self.cell for d in dims)
+
+    def add(self, key, dims, value):
+        self._cells[(key, self._cell_of(dims))].append((self._next_order, dims, value))
+        self._next_order += 1
+
+    def find(self, key, dims):
+        tol = self.tolerance
+        home = self._cell_of(dims)
+        best = None
+        for offset in _NEIGHBOUR_OFFSETS:
+            cell = tuple(c + o for c, o in zip(home, offset))
+            for order, g_dims, value in self._cells.get((key, cell), ()):
+                if best is not None and order >= best[0]:
+                    continue
+                if all(abs(a - b) <= tol for a, b in zip(dims, g_dims)):
+                    best = (order, value)
+        return best[1] if best is not None else None
+
+
+class HeightHistogram:
+    """Histogram số kiện theo chiều cao, hỗ trợ thống kê thứ tự.
+
+    Tập chiều cao cố định theo manifest; cây phân đoạn lưu (tổng, max) số kiện
+    trên các chiều cao đã sắp xếp. add() O(log m); đếm, phần tử thứ k, mode và
+    "chiều cao lớn nhất ≤ h" đều O(log m) (m = số chiều cao khác nhau).
+    """
+
+    def __init__(self, heights):
+        self.heights = sorted(set(heights))
+        self._pos = {h: i for i, h in enumerate(self.heights)}
+        size = 1
+        while size < len(self.heights):
+            size *= 2
+        self._size = size
+        self._sum = [0] * (2 * size)
+        self._max = [0] * (2 * size)
+
+    def copy(self):
+        clone = HeightHistogram.__new__(HeightHistogram)
+        clone.heights = self.heights
+        clone._pos = self._pos
+        clone._size = self._size
+        clone._sum = list(self._sum)
+        clone._max = list(self._max)
+        return clone
+
+    def add(self, h, n):
+        i = self._pos[h] + self._size
+        self._sum[i] += n
+        self._max[i] = self._sum[i]
+        i //= 2
+        while i:
+            left, right = 2 * i, 2 * i + 1
+            self._sum[i] = self._sum[left] + self._sum[right]
+            self._max[i] = max(self._max[left], self._max[right])
+            i //= 2
+
+    def __getitem__(self, h):
+        i = self._pos.get(h)
+        return 0 if i is None else self._sum[i + self._size]
+
+    def __len__(self):
+        return self._sum[1]
+
+    def _prefix(self, r, tree, op, init):
+        # Gộp giá trị các lá [0, r) theo op
+        res = init
+        lo, hi = self._size, r + self._size
+        while lo < hi:
+            if lo & 1:
+                res = op(res, tree[lo])
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                res = op(res, tree[hi])
+            lo //= 2
+            hi //= 2
+        return res
+
+    def _upper(self, h):
+        return bisect.bisect_right(self.heights, h)
+
+    def count_at_most(self, h):
+        """Số kiện có chiều cao ≤ h"""
+        return self._prefix(self._upper(h), self._sum, operator.add, 0)
+
+    def count_below(self, h):
+        """Số kiện có chiều cao < h"""
+        return self._prefix(bisect.bisect_left(self.heights, h), self._sum, operator.add, 0)
+
+    def kth(self, k):
+        """Chiều cao của kiện thứ k (0-based) theo thứ tự tăng dần"""
+        i = 1
+        while i < self._size:
+            if k < self._sum[2 * i]:
+                i = 2 * i
+            else:
+                k -= self._sum[2 * i]
+                i = 2 * i + 1
+        return self.heights[i - self._size]
+
+    def largest_at_most(self, h, strict=False):
+        """Chiều cao lớn nhất còn kiện mà ≤ h (< h nếu strict), None nếu không có"""
+        n = self.count_below(h) if strict else self.count_at_most(h)
+        return self.kth(n - 1) if n else None
+
+    def mode(self, h, prefer_taller=False):
+        """Chiều cao nhiều kiện nhất trong các chiều cao ≤ h (bằng nhau → thấp hơn, hoặc cao hơn)"""
+        r = self._upper(h)
+        best = self._prefix(r, self._max, max, 0)
+        if best <= 0:
+            return None
+        if not prefer_taller:
+            # Lá trái nhất có count ≥ best nằm trong [0, r) vì max trên [0, r) bằng best
+            i = 1
+            while i < self._size:
+                i = 2 * i if self._max[2 * i] >= best else 2 * i + 1
+            return self.heights[i - self._size]
+        return self.heights[self._rightmost(1, 0, self._size, r, best)]
+
+    def _rightmost(self, node, lo, hi, r, target):
+        # Lá phải nhất trong [0, r) có count ≥ target
+        if lo >= r or self._max[node] < target:
+            return None
+        if hi - lo == 1:
+            return lo
+        mid = (lo + hi) // 2
+        found = self._rightmost(2 * node + 1, mid, hi, r, target)
+        if found is None:
+            found = self._rightmost(2 * node, lo, mid, r, target)
+        return found
+
+    def items(self, h=None):
+        """Các cặp (chiều cao, số kiện > 0) tăng dần, giới hạn ≤ h nếu có"""
+        r = len(self.heights) if h is None else self._upper(h)
+        base = self._size
+        return [(self.heights[i], self._sum[base + i]) for i in range(r) if self._sum[base + i] > 0]
+
+
+class ItemPool:
+    """Kho kiện còn lại theo SKU.
+
+    - remove/add: O(1) (chỉ trừ/cộng bộ đếm, không dựng lại list)
+    - duyệt theo chiều cao (with_height, heights() = HeightHistogram) và theo thứ tự sắp xếp
+      cố định như diện tích đáy (ordered/by_footprint), thứ tự được cache một lần
+    - snapshot(): bản sao chỉ chép bộ đếm O(#SKU), chỉ mục dùng chung
+    """
+
+    def __init__(self, skus):
+        self.skus = list(skus)
+        self._by_id = {s["sku"]: s for s in self.skus}
+        self._by_height = defaultdict(list)
+        for s in self.skus:
+            self._by_height[s["H"]].append(s)
+        self._orders = {}
+        self._fit_matrices = {}
+        self._counts = {s["sku"]: s["count"] for s in self.skus}
+        self._height_units = HeightHistogram(s["H"] for s in self.skus)
+        for s in self.skus:
+            if s["count"] > 0:
+                self._height_units.add(s["H"], s["count"])
+        self.total = sum(self._counts.values())
+
+    def __bool__(self):
+        return self.total > 0
+
+    def __len__(self):
+        return self.total
+
+    def snapshot(self):
+        """Bản sao độc lập về số lượng, dùng chung chỉ mục (chi phí theo số SKU)"""
+        clone = ItemPool.__new__(ItemPool)
+        clone.skus = self.skus
+        clone._by_id = self._by_id
+        clone._by_height = self._by_height
+        clone._orders = self._orders
+        clone._fit_matrices = self._fit_matrices
+        clone._counts = dict(self._counts)
+        clone._height_units = self._height_units.copy()
+        clone.total = self.total
+        return clone
+
+    def restore(self, snapshot):
+        """Quay lại số lượng của một snapshot trước đó"""
+        self._counts = dict(snapshot._counts)
+        self._height_units = snapshot._height_units.copy()
+        self.total = snapshot.total
+
+    def get(self, sku_id):
+        return self._by_id[sku_id]
+
+    def count(self, sku_id):
+        return self._counts.get(sku_id, 0)
+
+    def remove(self, sku_id, n=1):
+        left = self._counts[sku_id] - n
+        if left < 0:
+            raise ValueError(f"SKU {sku_id}: không đủ {n} kiện trong pool")
+        self._counts[sku_id] = left
+        self._height_units.add(self._by_id[sku_id]["H"], -n)
+        self.total -= n
+
+    def add(self, sku_id, n=1):
+        self._counts[sku_id] += n
+        self._height_units.add(self._by_id[sku_id]["H"], n)
+        self.total += n
+
+    def active(self):
+        """Các SKU còn hàng, theo thứ tự manifest"""
+        counts = self._counts
+        for s in self.skus:
+            if counts[s["sku"]] > 0:
+                yield s
+
+    def ordered(self, name, key):
+        """Các SKU còn hàng theo key giảm dần (sort một lần, cache theo tên)"""
+        order = self._orders.get(name)
+        if order is None:
+            order = sorted(self.skus, key=key, reverse=True)
+            self._orders[name] = order
+        counts = self._counts
+        return [s for s in order if counts[s["sku"]] > 0]
+
+    def fitting_ids(self, maxL, maxW, maxH, allow_rotation=True):
+        """Tập sku id vừa (maxL, maxW, maxH) ở một hướng nào đó (mọi SKU, kể cả đã hết)"""
+        matrix = self._fit_matrices.get(allow_rotation)
+        if matrix is None:
+            matrix = FitMatrix(self.skus, allow_rotation)
+            self._fit_matrices[allow_rotation] = matrix
+        return {s["sku"] for s, ok in zip(self.skus, matrix.fits(maxL, maxW, maxH)) if ok}
+
+    def by_footprint(self):
+        return self.ordered("footprint", lambda s: (s["L"]*s["W"], s["H"]))
+
+    def with_height(self, h):
+        """Các SKU còn hàng có chiều cao (theo hướng gốc) bằng h"""
+        counts = self._counts
+        return [s for s in self._by_height.get(h, ()) if counts[s["sku"]] > 0]
+
+    def height_counts(self):
+        """Histogram {H: số kiện còn lại} (bản dict, dựng từ HeightHistogram)"""
+        return dict(self._height_units.items())
+
+    def heights(self):
+        """HeightHistogram số kiện còn lại - cập nhật tăng dần khi remove/add"""
+        return self._height_units
+
+    def remaining_records(self):
+        """Bản ghi SKU (bản sao) với count = số còn lại"""
+        return [dict(s, count=self._counts[s["sku"]]) for s in self.active()]
+
+
+# =============================================================
+# CHỈ MỤC CHỖ TRỐNG CHO CÁC ROW SKYLINE TRONG MỘT LAYER
+# =============================================================
+
+class _MaxTree:
+    """Cây max trên mảng tăng dần kích thước: append/update O(log n),
+    tìm phần tử đầu tiên ≥ t O(log n)"""
+
+    def __init__(self):
+        self._size = 1
+        self._n = 0
+        self._tree = [-1, -1]
+
+    def append(self, value):
+        if self._n == self._size:
+            leaves = self._tree[self._size:] + [-1] * self._size
+            self._size *= 2
+            self._tree = [-1] * self._size + leaves
+            for i in range(self._size - 1, 0, -1):
+                self._tree[i] = max(self._tree[2 * i], self._tree[2 * i + 1])
+        self._n += 1
+        self.update(self._n - 1, value)
+
+    def update(self, i, value):
+        i += self._size
+        self._tree[i] = value
+        i //= 2
+        while i:
+            self._tree[i] = max(self._tree[2 * i], self._tree[2 * i + 1])
+            i //= 2
+
+    def first_at_least(self, t):
+        if self._tree[1] < t:
+            return None
+        i = 1
+        while i < self._size:
+            i = 2 * i if self._tree[2 * i] >= t else 2 * i + 1
+        return i - self._size
+
+
+class SkylineRows:
+    """Các row của một mặt skyline (cL × cW) kèm chỉ mục chỗ trống.
+
+    rows: list dict {"y", "height", "segments"} như trước (hàm chồng item dùng tiếp).
+    Row được gom theo chiều cao; mỗi nhóm có cây max theo đoạn trống dài nhất,
+    nên tìm row first-fit/best-fit tốn O(k log r) (k = số chiều cao row khác nhau)
+    thay vì quét mọi row. y_cursor thay cho sum(height) của các row.
+    """
+
+    def __init__(self, engine, cL, cW):
+        self.engine = engine
+        self.cL = cL
+        self.cW = cW
+        self.rows = []
+        self.y_cursor = 0
+        self._heights = []
+        self._groups = {}
+        self._slot = {}
+
+    @staticmethod
+    def _free(row):
+        return max((e - s for s, e in row["segments"]), default=0)
+
+    def find(self, length, width, best_fit=False):
+        """(row, x) cho kiện length × width: first-fit = row tạo sớm nhất vừa,
+        best-fit = row thấp nhất vừa (bằng nhau → tạo sớm nhất); None nếu không có"""
+        best = None
+        for h in self._heights[bisect.bisect_left(self._heights, width):]:
+            members, tree = self._groups[h]
+            j = tree.first_at_least(length)
+            if j is None:
+                continue
+            order, row = members[j]
+            if best_fit:
+                best = (order, row)
+                break
+            if best is None or order < best[0]:
+                best = (order, row)
+        if best is None:
+            return None
+        row = best[1]
+        return row, self.engine.find_x_position_in_segments(row["segments"], length, self.cL)
+
+    def place(self, row, x, length):
+        """Chiếm đoạn [x, x + length) của row"""
+        row["segments"] = self.engine.update_segments_after_place(row["segments"], x, length)
+        h, j = self._slot[id(row)]
+        self._groups[h][1].update(j, self._free(row))
+
+    def open_row(self, length, width):
+        """Mở row mới tại y_cursor với kiện đầu tiên đặt ở x = 0; None nếu hết chiều rộng"""
+        if self.y_cursor + width > self.cW:
+            return None
+        row = {"y": self.y_cursor, "height": width, "segments": [(length, self.cL)]}
+        group = self._groups.get(width)
+        if group is None:
+            group = ([], _MaxTree())
+            self._groups[width] = group
+            bisect.insort(self._heights, width)
+        self._slot[id(row)] = (width, len(group[0]))
+        group[0].append((len(self.rows), row))
+        group[1].append(self._free(row))
+        self.rows.append(row)
+        self.y_cursor += width
+        return row
+
+
+# =============================================================
+# MAXRECTS: DANH SÁCH HÌNH CHỮ NHẬT TRỐNG CỰC ĐẠI TRÊN MẶT LAYER
+# =============================================================
+
+class MaxRectsBin:
+    """Mặt cL × cW với tập hình chữ nhật trống cực đại (x, y, L, W).
+
+    Sau mỗi lần đặt, chỉ các hình trống giao với kiện bị tách (tối đa 4 mảnh);
+    mảnh mới nằm gọn trong hình khác bị loại ngay. Hình cũ không thể nằm trong
+    mảnh mới (mảnh mới là tập con của một hình cũ cực đại), nên không cần so
+    mọi cặp - tập trống luôn gọn kể cả với layer hàng trăm kiện.
+    """
+
+    def __init__(self, cL, cW):
+        self.free = [(0, 0, cL, cW)]
+
+    @staticmethod
+    def _score(heuristic, free_L, free_W, L, W, x, y):
+        short, long_ = sorted((free_L - L, free_W - W))
+        if heuristic == "baf":
+            return (free_L * free_W - L * W, short, y, x)
+        return (short, long_, y, x)
+
+    def find(self, variants, heuristic="bssf"):
+        """(variant, x, y) tốt nhất theo heuristic trong các hướng variants, None nếu không vừa"""
+        best = None
+        for fx, fy, fL, fW in self.free:
+            for v in variants:
+                if v["L"] <= fL and v["W"] <= fW:
+                    score = self._score(heuristic, fL, fW, v["L"], v["W"], fx, fy)
+                    if best is None or score < best[0]:
+                        best = (score, v, fx, fy)
+        if best is None:
+            return None
+        return best[1], best[2], best[3]
+
+    def place(self, x, y, L, W):
+        """Chiếm hình [x, x + L) × [y, y + W), cập nhật tập trống"""
+        kept = []
+        pieces = []
+        for rect in self.free:
+            fx, fy, fL, fW = rect
+            if x >= fx + fL or x + L <= fx or y >= fy + fW or y + W <= fy:
+                kept.append(rect)
+                continue
+            if x > fx:
+                pieces.append((fx, fy, x - fx, fW))
+            if x + L < fx + fL:
+                pieces.append((x + L, fy, fx + fL - x - L, fW))
+            if y > fy:
+                pieces.append((fx, fy, fL, y - fy))
+            if y + W < fy + fW:
+                pieces.append((fx, y + W, fL, fy + fW - y - W))
+
+        def contains(a, b):
+            return (a[0] <= b[0] and a[1] <= b[1] and
+                    b[0] + b[2] <= a[0] + a[2] and b[1] + b[3] <= a[1] + a[3])
+
+        for i, piece in enumerate(pieces):
+            if any(contains(r, piece) for r in kept):
+                continue
+            # Mảnh trùng nhau: chỉ giữ mảnh đứng trước
+            if any(contains(other, piece) and (other != piece or j < i)
+                   for j, other in enumerate(pieces) if j != i):
+                continue
+            kept.append(piece)
+        self.free = kept
+
+
+# =============================================================
+# EXTREME POINT: ĐẶT KIỆN TRỰC TIẾP TRONG KHÔNG GIAN 3D
+# =============================================================
+
+class BoxGrid:
+    """Lưới đều 3D (kích thước ô riêng cho từng trục): mỗi ô giữ các box chạm ô.
+
+    Kiểm tra va chạm, diện tích đỡ và chiếu điểm cực chỉ xét box ở các ô
+    liên quan thay vì mọi box đã đặt.
+    """
+
+    def __init__(self, cell_x, cell_y, cell_z):
+        self.cells = (max(1, cell_x), max(1, cell_y), max(1, cell_z))
+        self._cells = defaultdict(list)
+
+    @staticmethod
+    def _span(lo, length, cell):
+        return range(int(lo // cell), int((lo + max(length, 1) - 1) // cell) + 1)
+
+    def _keys(self, x, y, z, L, W, H):
+        cx, cy, cz = self.cells
+        return itertools.product(self._span(x, L, cx), self._span(y, W, cy), self._span(z, H, cz))
+
+    def add(self, box):
+        for key in self._keys(box["x"], box["y"], box["z"], box["L"], box["W"], box["H"]):
+            self._cells[key].append(box)
+
+    def near(self, x, y, z, L, W, H):
+        """Các box (không lặp) có thể giao khối [x, x+L) × [y, y+W) × [z, z+H)"""
+        found = {}
+        cells = self._cells
+        for key in self._keys(x, y, z, L, W, H):
+            for b in cells.get(key, ()):
+                found[b["uid"]] = b
+        return found.values()
+
+    def collides(self, x, y, z, L, W, H):
+        """Có box nào giao khối đã cho không; dừng ở box giao đầu tiên"""
+        cells = self._cells
+        for key in self._keys(x, y, z, L, W, H):
+            for b in cells.get(key, ()):
+                if (x < b["x"] + b["L"] and b["x"] < x + L and y < b["y"] + b["W"] and b["y"] < y + W and
+                        z < b["z"] + b["H"] and b["z"] < z + H):
+                    return True
+        return False
+
+
+def _overlap_1d(a, a_len, b, b_len):
+    return max(0, min(a + a_len, b + b_len) - max(a, b))
+
+
+class ExtremePointSpace:
+    """Không gian một container cho heuristic extreme point (Crainic et al.).
+
+    Điểm cực được sinh từ 3 góc của mỗi box vừa đặt và hình chiếu của chúng
+    về phía gốc tọa độ (theo -x, -y, -z) lên box gần nhất hoặc vách container.
+    Điểm giữ trong list sắp theo (z, x, y): lấp sàn trước, từ đầu container ra.
+    Điểm nằm trong box đã đặt bị loại ngay khi đặt box (chỉ xét dải z của box).
+    Mỗi điểm kèm residual space: khoảng trống theo tia +x, +y, +z tới box/vách
+    gần nhất. Kiện dài hơn residual chắc chắn va chạm nên find() loại ngay
+    không cần tra lưới; residual chỉ giảm và được cập nhật khi đặt box.
+    """
+
+    def __init__(self, cL, cW, cH, cells, min_support_ratio=0.75):
+        self.cL, self.cW, self.cH = cL, cW, cH
+        self.min_support_ratio = min_support_ratio
+        self.grid = BoxGrid(*cells)
+        self.points = [(0, 0, 0)]  # (z, x, y) để list tự sắp theo thứ tự duyệt
+        self._known = {(0, 0, 0)}
+        self._residual = {(0, 0, 0): [cL, cW, cH]}
+        self._memo_variants = None
+        self._rejected = {}
+
+    def _collides(self, x, y, z, L, W, H):
+        return self.grid.collides(x, y, z, L, W, H)
+
+    def _supported(self, x, y, z, L, W):
+        if z == 0:
+            return True
+        area = 0
+        for b in self.grid.near(x, y, z - 1, L, W, 1):
+            if b["z"] + b["H"] == z:
+                area += _overlap_1d(x, L, b["x"], b["L"]) * _overlap_1d(y, W, b["y"], b["W"])
+        return area >= self.min_support_ratio * L * W
+
+    def _occupied(self, px, py, pz):
+        for b in self.grid.near(px, py, pz, 1, 1, 1):
+            if (b["x"] <= px < b["x"] + b["L"] and b["y"] <= py < b["y"] + b["W"] and
+                    b["z"] <= pz < b["z"] + b["H"]):
+                return True
+        return False
+
+    def find(self, variants):
+        """(variant, x, y, z) ở điểm cực thấp nhất đặt vừa; None nếu không có.
+
+        Các kiện cùng SKU gọi liên tiếp với cùng list variants: điểm đã hỏng vì
+        vượt container/va chạm thì hỏng mãi (không gian chỉ thu hẹp) nên được nhớ
+        và bỏ qua; điểm chỉ thiếu chỗ đỡ thì thử lại vì box mới có thể đỡ nó.
+        Nhớ theo từng variant của điểm (bitmask) để không thử lại các hướng đã
+        va chạm.
+        """
+        if variants is not self._memo_variants:
+            self._memo_variants = variants
+            self._rejected = {}
+        rejected = self._rejected
+        residual = self._residual
+        full = (1 << len(variants)) - 1
+        min_L = min(v["L"] for v in variants)
+        min_W = min(v["W"] for v in variants)
+        min_H = min(v["H"] for v in variants)
+        for point in self.points:
+            mask = rejected.get(point, 0)
+            if mask == full:
+                continue
+            z, x, y = point
+            rx, ry, rz = residual[point]
+            if rx < min_L or ry < min_W or rz < min_H:
+                rejected[point] = full
+                continue
+            for i, v in enumerate(variants):
+                if mask >> i & 1:
+                    continue
+                L, W, H = v["L"], v["W"], v["H"]
+                if L > rx or W > ry or H > rz or self._collides(x, y, z, L, W, H):
+                    mask |= 1 << i
+                    continue
+                if self._supported(x, y, z, L, W):
+                    rejected[point] = mask
+                    return v, x, y, z
+            rejected[point] = mask
+        return None
+
+    def grow(self, variant, x, y, z, limit):
+        """Khối nx × ny × nz kiện variant lớn nhất đặt được tại (x, y, z), tối đa limit kiện.
+
+        (x, y, z) là chỗ find() vừa trả về cho một kiện. Khối mở rộng theo y,
+        rồi x (mỗi dải mới phải trong container, không va chạm và được đỡ như
+        một kiện), rồi chồng theo z lên chính khối (luôn được đỡ đủ).
+        """
+        L, W, H = variant["L"], variant["W"], variant["H"]
+
+        def free(bx, by, bz, bL, bW):
+            return (bx + bL <= self.cL and by + bW <= self.cW and bz + H <= self.cH and
+                    not self._collides(bx, by, bz, bL, bW, H) and self._supported(bx, by, bz, bL, bW))
+
+        ny = 1
+        while ny < limit and free(x, y + ny * W, z, L, W):
+            ny += 1
+        nx = 1
+        while (nx + 1) * ny <= limit and free(x + nx * L, y, z, L, ny * W):
+            nx += 1
+        nz = 1
+        while ((nz + 1) * nx * ny <= limit and z + (nz + 1) * H <= self.cH and
+               not self._collides(x, y, z + nz * H, nx * L, ny * W, H)):
+            nz += 1
+        return nx, ny, nz
+
+    def _project_down(self, x, y, z):
+        top = 0
+        for b in self.grid.near(x, y, 0, 1, 1, z):
+            if b["x"] <= x < b["x"] + b["L"] and b["y"] <= y < b["y"] + b["W"] and b["z"] + b["H"] <= z:
+                top = max(top, b["z"] + b["H"])
+        return top
+
+    def _project_back_x(self, x, y, z):
+        face = 0
+        for b in self.grid.near(0, y, z, x, 1, 1):
+            if b["x"] + b["L"] <= x and b["y"] <= y < b["y"] + b["W"] and b["z"] <= z < b["z"] + b["H"]:
+                face = max(face, b["x"] + b["L"])
+        return face
+
+    def _project_back_y(self, x, y, z):
+        face = 0
+        for b in self.grid.near(x, 0, z, 1, y, 1):
+            if b["y"] + b["W"] <= y and b["x"] <= x < b["x"] + b["L"] and b["z"] <= z < b["z"] + b["H"]:
+                face = max(face, b["y"] + b["W"])
+        return face
+
+    def place(self, box):
+        """Ghi nhận box đã đặt, bỏ các điểm cực nằm trong box và sinh điểm cực mới"""
+        self.grid.add(box)
+        x, y, z, L, W, H = box["x"], box["y"], box["z"], box["L"], box["W"], box["H"]
+        residual = self._residual
+        lo = bisect.bisect_left(self.points, (z,))
+        hi = bisect.bisect_left(self.points, (z + H,))
+        band = []
+        for point in self.points[lo:hi]:
+            pz, px, py = point
+            in_x = x <= px < x + L
+            in_y = y <= py < y + W
+            if in_x and in_y:
+                self._known.discard(point)
+                del residual[point]
+                continue
+            band.append(point)
+            # Box chắn tia +x / +y của điểm cùng dải z
+            r = residual[point]
+            if in_y and x > px:
+                r[0] = min(r[0], x - px)
+            elif in_x and y > py:
+                r[1] = min(r[1], y - py)
+        self.points[lo:hi] = band
+        # Box chắn tia +z của các điểm thấp hơn nằm dưới nó
+        for point in self.points[:lo]:
+            pz, px, py = point
+            if x <= px < x + L and y <= py < y + W:
+                r = residual[point]
+                r[2] = min(r[2], z - pz)
+
+        candidates = [
+            (x + L, y, z), (x + L, self._project_back_y(x + L, y, z), z), (x + L, y, self._project_down(x + L, y, z)),
+            (x, y + W, z), (self._project_back_x(x, y + W, z), y + W, z), (x, y + W, self._project_down(x, y + W, z)),
+            (x, y, z + H), (self._project_back_x(x, y, z + H), y, z + H), (x, self._project_back_y(x, y, z + H), z + H),
+        ]
+        for px, py, pz in candidates:
+            point = (pz, px, py)
+            if (px >= self.cL or py >= self.cW or pz >= self.cH or point in self._known or
+                    self._occupied(px, py, pz)):
+                continue
+            self._known.add(point)
+            residual[point] = [self._free_x(px, py, pz), self._free_y(px, py, pz), self._free_z(px, py, pz)]
+            bisect.insort(self.points, point)
+
+    def _free_x(self, x, y, z):
+        """Khoảng trống theo tia +x từ (x, y, z) tới box gần nhất hoặc vách"""
+        end = self.cL
+        for b in self.grid.near(x, y, z, self.cL - x, 1, 1):
+            if x <= b["x"] < end and b["y"] <= y < b["y"] + b["W"] and b["z"] <= z < b["z"] + b["H"]:
+                end = b["x"]
+        return end - x
+
+    def _free_y(self, x, y, z):
+        end = self.cW
+        for b in self.grid.near(x, y, z, 1, self.cW - y, 1):
+            if y <= b["y"] < end and b["x"] <= x < b["x"] + b["L"] and b["z"] <= z < b["z"] + b["H"]:
+                end = b["y"]
+        return end - y
+
+    def _free_z(self, x, y, z):
+        end = self.cH
+        for b in self.grid.near(x, y, z, 1, 1, self.cH - z):
+            if z <= b["z"] < end and b["x"] <= x < b["x"] + b["L"] and b["y"] <= y < b["y"] + b["W"]:
+                end = b["z"]
+        return end - z
+
+
+# =============================================================
+# CẬN DƯỚI SỐ CONTAINER (THỂ TÍCH, MARTELLO L1/L2)
+# =============================================================
+
+def _bin_bound_1d(sizes, capacity):
+    """Cận dưới Martello-Toth L2 cho bin packing 1D; sizes: list (kích thước, số lượng)"""
+    half = capacity / 2
+    best = 0
+    for k in {0} | {s for s, _ in sizes if s <= half}:
+        n_big = n_mid = 0
+        sum_mid = sum_small = 0
+        for s, n in sizes:
+            if s > capacity - k:
+                n_big += n
+            elif s > half:
+                n_mid += n
+                sum_mid += s * n
+            elif s >= k:
+                sum_small += s * n
+        extra = -(-(sum_small - (n_mid * capacity - sum_mid)) // capacity)
+        best = max(best, n_big + n_mid + max(0, extra))
+    return best
+
+
+def container_lower_bounds(items, cL, cW, cH, allow_rotation=True):
+    """Cận dưới số container cho manifest (SKU có "count" hoặc từng kiện).
+
+    volume: ⌈Σ thể tích / thể tích container⌉.
+    l1, l2: cận Martello-Pisinger-Vigo lấy max theo 3 trục. Kiện "lớn" theo hai
+    trục còn lại (> nửa container) không thể đứng cạnh nhau nên xếp nối tiếp
+    theo trục thứ ba (L1 = bin packing 1D); L2 thêm phần thể tích các kiện nhỏ
+    không chen được vào lát cắt của kiện rất lớn. Khi được xoay, điều kiện phải
+    đúng ở mọi hướng (lấy kích thước nhỏ nhất) nên cận vẫn đúng.
+    """
+    skus = build_sku_records(items)
+    dims = (cL, cW, cH)
+    container_vol = cL * cW * cH
+    total_vol = sum(s["L"] * s["W"] * s["H"] * s["count"] for s in skus)
+    volume = -(-total_vol // container_vol)
+
+    tables = [([(v["L"], v["W"], v["H"]) for v in build_orientation_table(s, allow_rotation)],
+               s["count"], s["L"] * s["W"] * s["H"]) for s in skus]
+    l1 = l2 = 0
+    for d in range(3):
+        a, b = (k for k in range(3) if k != d)
+        A, B, C = dims[a], dims[b], dims[d]
+        # (nhỏ nhất theo trục d, theo a, theo b) trên mọi hướng cho phép
+        rows = [(min(o[d] for o in t), min(o[a] for o in t), min(o[b] for o in t), n, vol)
+                for t, n, vol in tables]
+        l1_d = _bin_bound_1d([(sd, n) for sd, sa, sb, n, _ in rows if sa > A / 2 and sb > B / 2], C)
+        l1 = max(l1, l1_d)
+
+        # Chỉ p, q có kiện rất lớn (sa > A - p, sb > B - q) mới cho cận mạnh hơn thể tích
+        max_a = max((sa for _, sa, _, _, _ in rows), default=0)
+        max_b = max((sb for _, _, sb, _, _ in rows), default=0)
+        ps = {sa for _, sa, _, _, _ in rows if A - max_a < sa <= A / 2}
+        qs = {sb for _, _, sb, _, _ in rows if B - max_b < sb <= B / 2}
+        for p in ps:
+            for q in qs:
+                slab = 0  # tổng bề dày lát cắt của kiện rất lớn (không kiện nào đứng cạnh)
+                rest_vol = 0
+                for sd, sa, sb, n, vol in rows:
+                    if sa > A - p and sb > B - q:
+                        slab += sd * n
+                    elif (sa > A / 2 and sb > B / 2) or (sa >= p and sb >= q):
+                        rest_vol += vol * n
+                extra = -(-(rest_vol - (C * l1_d - slab) * A * B) // container_vol)
+                l2 = max(l2, l1_d + max(0, extra))
+
+    # p = q = 0 cho đúng cận thể tích nên L2 không bao giờ yếu hơn L1 và thể tích
+    l2 = max(l2, l1, volume)
+    return {"volume": volume, "l1": l1, "l2": l2, "best": l2}
+
+
+# =============================================================
+# SỐ KIỆN ĐỒNG NHẤT TỐI ĐA (GUILLOTINE 3 TẦNG, 6 HƯỚNG)
+# =============================================================
+
+def _best_strips(choices, capacity):
+    """Knapsack không giới hạn trên vài bề dày: chia đoạn capacity thành các dải.
+
+    choices: [(bề dày, giá trị một dải, payload)] → (tổng giá trị, [(payload, số dải)])
+    """
+    by_size = {}
+    for size, value, payload in choices:
+        if size <= capacity and value > 0 and value > by_size.get(size, (0,))[0]:
+            by_size[size] = (value, payload)
+    items = [(size,) + by_size[size] for size in sorted(by_size, reverse=True)]
+
+    def solve(i, cap):
+        size, value, payload = items[i]
+        if i == len(items) - 1:
+            k = cap // size
+            return k * value, [(payload, k)] if k else []
+        best = (0, [])
+        for k in range(cap // size, -1, -1):
+            total, plan = solve(i + 1, cap - k * size)
+            total += k * value
+            if total > best[0]:
+                best = (total, ([(payload, k)] if k else []) + plan)
+        return best
+
+    return solve(0, capacity) if items else (0, [])
+
+
+def _slab_pattern(t, p, q, a, C):
+    """Lát bề dày t theo trục a; mặt cắt chia thành dải, mỗi dải một hướng (p×q hoặc q×p)"""
+    b, c = (k for k in range(3) if k != a)
+    best = (0, Counter())
+    for along, across in ((b, c), (c, b)):
+        # Dải nối tiếp theo trục `along`, trong dải kiện thẳng hàng theo trục `across`
+        choices = []
+        for s, r in ((p, q), (q, p)):
+            if s <= C[along] and r <= C[across]:
+                orientation = [0, 0, 0]
+                orientation[a], orientation[along], orientation[across] = t, s, r
+                choices.append((s, C[across] // r, tuple(orientation)))
+        total, plan = _best_strips(choices, C[along])
+        if total > best[0]:
+            per_strip = {o: n for _, n, o in choices}
+            best = (total, Counter({o: k * per_strip[o] for o, k in plan}))
+    return best
+
+
+@functools.lru_cache(maxsize=4096)
+def guillotine_pattern(L, W, H, cL, cW, cH, allow_rotation=True):
+    """Số kiện (L, W, H) nhiều nhất trong container bằng cắt guillotine 3 tầng.
+
+    Tầng 1 chia container theo một trục thành các lát (bề dày = một cạnh kiện),
+    tầng 2 chia lát thành dải, tầng 3 xếp thẳng hàng trong dải. Mỗi lát / dải
+    chọn hướng riêng nên trộn được cả 6 hướng. Cache theo bộ kích thước.
+    Trả về (số kiện, ((hướng (x, y, z), số kiện), ...)) theo số kiện giảm dần.
+    """
+    C = (cL, cW, cH)
+    if not allow_rotation:
+        n = (cL // L) * (cW // W) * (cH // H)
+        return n, (((L, W, H), n),) if n else ()
+
+    dims = (L, W, H)
+    best = (0, Counter())
+    for a in range(3):
+        choices = []
+        for i in range(3):
+            p, q = (dims[j] for j in range(3) if j != i)
+            count, slab = _slab_pattern(dims[i], p, q, a, C)
+            choices.append((dims[i], count, slab))
+        total, plan = _best_strips(choices, C[a])
+        if total > best[0]:
+            pattern = Counter()
+            for slab, k in plan:
+                for o, n in slab.items():
+                    pattern[o] += k * n
+            best = (total, pattern)
+    return best[0], tuple(sorted(best[1].items(), key=lambda x: (-x[1], x[0])))
+
+
+# =============================================================
+# CACHE MẪU LAYER (LRU, DÙNG CHUNG CHO MỌI ENGINE TRONG PROCESS)
+# =============================================================
+
+LAYER_PATTERN_CACHE_SIZE = 1024
+
+
+class LayerPatternCache:
+    """Mẫu layer đã dựng, khóa theo (ứng viên + số kiện đã chặn, chiều cao, cL, cW, tùy chọn dựng layer).
+
+    Mẫu là tuple bất biến (chỉ số ứng viên, L, W, H, rotated, x, y, dz, stacked,
+    stack_level); khi trúng, engine tạo lại box với uid mới. Vượt maxsize thì bỏ
+    mẫu dùng lâu nhất. hits/misses để đo hiệu quả.
+    """
+
+    def __init__(self, maxsize=LAYER_PATTERN_CACHE_SIZE):
+        self._lock = threading.Lock()
+        self._patterns = OrderedDict()
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            pattern = self._patterns.get(key)
+            if pattern is None:
+                self.misses += 1
+                return None
+            self._patterns.move_to_end(key)
+            self.hits += 1
+            return pattern
+
+    def put(self, key, pattern):
+        with self._lock:
+            self._patterns[key] = pattern
+            self._patterns.move_to_end(key)
+            while len(self._patterns) > self.maxsize:
+                self._patterns.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._patterns.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._patterns)}
+
+
+LAYER_PATTERNS = LayerPatternCache()
+
+
+# =============================================================
+# TIẾN TRÌNH & HỦY (DÙNG CHUNG GIỮA WORKER VÀ GUI)
+# =============================================================
+
+class PackingProgress:
+    """Bộ đếm tiến trình thread-safe; GUI đọc bằng snapshot(), worker ghi qua engine"""
+
+    def __init__(self, total_items=0, cancel_event=None):
+        self._lock = threading.Lock()
+        self._cancel_event = cancel_event if cancel_event is not None else threading.Event()
+        self.started_at = time.time()
+        self.total_items = total_items
+        self.containers_done = 0
+        self.layers_built = 0
+        self.items_packed = 0
+        self.stage = ""
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def start_stage(self, name):
+        """Bắt đầu một chiến lược mới - đếm lại từ đầu"""
+        with self._lock:
+            self.stage = name
+            self.containers_done = 0
+            self.layers_built = 0
+            self.items_packed = 0
+
+    def update(self, stage=None, containers_done=None, items_packed=None):
+        """Ghi đè các bộ đếm (dùng khi kết quả đến từ process khác)"""
+        with self._lock:
+            if stage is not None:
+                self.stage = stage
+            if containers_done is not None:
+                self.containers_done = containers_done
+            if items_packed is not None:
+                self.items_packed = items_packed
+
+    def layer_built(self):
+        with self._lock:
+            self.layers_built += 1
+
+    def container_done(self, packed_count):
+        with self._lock:
+            self.containers_done += 1
+            self.items_packed += packed_count
+
+    def elapsed(self):
+        return time.time() - self.started_at
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "stage": self.stage,
+                "containers_done": self.containers_done,
+                "layers_built": self.layers_built,
+                "items_packed": self.items_packed,
+                "total_items": self.total_items,
+                "elapsed": self.elapsed(),
+                "cancelled": self.is_cancelled(),
+            }
+
+
+# =============================================================
+# ENGINE
+# =============================================================
+
+class PackingEngine:
+    """Engine xếp kiện thuần Python, mọi tùy chọn lấy từ PackingOptions"""
+
+    # Mỗi chiến lược = bộ tham số riêng (thứ tự item, chọn chiều cao layer, cách chọn row)
+    STRATEGIES = [
+        ("GFBUp", {}),
+        ("GFI", {"layer_height_policy": "mode", "item_order": "length", "row_fit": "best"}),
+        ("Greedy + Layer-based", {"layer_height_policy": "tallest", "item_order": "volume"}),
+        ("Hybrid Approach", {"layer_height_policy": "best_fill", "row_fit": "best"}),
+        # Extreme point đặt cả khối kiện giống nhau nên nhanh ngang layer ở đơn ~40 SKU;
+        # đơn rất nhiều SKU lẻ (~150) vẫn chậm hơn MaxRects khoảng 2 lần
+        ("Extreme Point", {"placement": "extreme_point", "item_order": "volume"}),
+        ("Layer Plan (DP)", {"layer_height_policy": "planned"}),
+    ]
+
+    ITEM_ORDER_KEYS = {
+        "footprint": lambda x: (x["L"]*x["W"], x["H"]),
+        "height": lambda x: (x["H"], x["L"]*x["W"]),
+        "volume": lambda x: (x["L"]*x["W"]*x["H"], x["L"]),
+        "length": lambda x: (x["L"], x["W"]),
+    }
+
+    def __init__(self, options=None, progress=None):
+        self.options = options if options is not None else PackingOptions()
+        self.progress = progress
+        self.deadline = None
+        self._uids = itertools.count(1)
+        self._layer_plan = []
+        # Giải mã BRKGA: khóa ưu tiên SKU (thay item_order) và hướng xoay ưu tiên theo SKU
+        self.sku_priority = None
+        self.orientation_preference = None
+        self._preferred_tables = {}
+        # Cận dưới số container của manifest đang xếp (pack() tính); đạt cận → dừng tìm kiếm
+        self.lower_bounds = None
+        self.lower_bound = 0
+
+    def is_cancelled(self):
+        """Dừng khi người dùng hủy hoặc hết ngân sách thời gian của chiến lược"""
+        if self.deadline is not None and time.time() >= self.deadline:
+            return True
+        return self.progress is not None and self.progress.is_cancelled()
+
+    def strategy_engine(self, name):
+        """Engine con với tham số của chiến lược `name`, dùng chung progress/deadline"""
+        overrides = dict(self.STRATEGIES)[name]
+        engine = PackingEngine(self.options.with_changes(**overrides), self.progress)
+        engine.deadline = self.deadline
+        return engine
+
+    # ---------------------------------------------------------
+    # API CHÍNH
+    # ---------------------------------------------------------
+    def pack(self, items, container_dims):
+        """Xếp danh sách item vào container (cL, cW, cH), trả về list container.
+
+        items: bản ghi SKU {"L","W","H","NoID","rotate","count"} hoặc từng kiện (không có "count")
+        """
+        cL, cW, cH = container_dims
+        # Gom nhóm kích thước một lần cho cả manifest, mọi chiến lược/container dùng chung
+        skus = self.prepare_skus(items)
+        self.lower_bounds = container_lower_bounds(skus, cL, cW, cH, self.options.allow_rotation)
+        self.lower_bound = self.lower_bounds["best"]
+        if self.options.use_brkga:
+            solution = self.run_brkga_optimization(skus, cL, cW, cH)
+        elif self.options.two_phase:
+            solution = self.run_two_phase(skus, cL, cW, cH)
+        elif self.options.multi_strategy:
+            solution = self.run_multi_strategy_optimization(skus, cL, cW, cH)
+        else:
+            solution = self.run_single_strategy_optimization(skus, cL, cW, cH)
+        if self.options.improve_time_budget > 0 and not self.reached_lower_bound(solution, skus):
+            solution = self.improve_solution(solution, skus, cL, cW, cH)
+        return solution
+
+    def repack_incremental(self, items, container_dims, previous):
+        """Xếp lại sau khi sửa manifest, giữ nguyên các container trước chỗ sửa.
+
+        So manifest mới với hàng trong previous theo (NoID, kích thước, rotate):
+        container đầu tiên chứa SKU có số lượng thay đổi (hoặc container cuối
+        nếu chỉ thêm SKU mới) là chỗ bắt đầu xếp lại; các container trước đó
+        giữ nguyên box/uid, phần hàng còn lại xếp bằng chiến lược hiện tại.
+        """
+        cL, cW, cH = container_dims
+        if not previous or any(c.get("dims") != (cL, cW, cH) for c in previous):
+            # Kích thước container đã đổi (kể cả lớn hơn): lời giải cũ không dùng lại được
+            return self.pack(items, container_dims)
+        skus = self.prepare_skus(items)
+        self.lower_bounds = container_lower_bounds(skus, cL, cW, cH, self.options.allow_rotation)
+        self.lower_bound = self.lower_bounds["best"]
+        allow_rotation = self.options.allow_rotation
+
+        def key(r):
+            # rotate thuộc khóa: chỉ sửa cột xoay cũng phải xếp lại SKU đó. Kiện không xoay
+            # giữ đúng hướng nên so nguyên (L, W, H); kiện xoay được so theo bộ kích thước
+            rotate = r.get("rotate", 1)
+            dims = (r["L"], r["W"], r["H"])
+            return (r["NoID"], tuple(sorted(dims)) if allow_rotation and rotate == 1 else dims, rotate)
+
+        # Nhiều SKU có thể cùng khóa (hoán vị kích thước của cùng NoID) → đếm theo từng SKU id
+        ids = defaultdict(list)
+        for s in skus:
+            ids[key(s)].append(s["sku"])
+        new_counts = Counter()
+        for s in skus:
+            new_counts[key(s)] += s["count"]
+        used = [Counter(key(b) for l in c["layers"] for b in l["boxes"]) for c in previous]
+        old_counts = sum(used, Counter())
+        changed = {k for k in set(old_counts) | set(new_counts) if old_counts[k] != new_counts[k]}
+        if not changed:
+            return previous
+        first = next((i for i, u in enumerate(used) if changed & set(u)), max(len(previous) - 1, 0))
+        print(f"Xếp lại từ xe {first + 1}/{len(previous)} ({len(changed)} SKU thay đổi)")
+
+        solution = []
+        pool = ItemPool(skus)
+        for c in previous[:first]:
+            layers = []
+            for l in c["layers"]:
+                boxes = []
+                for b in l["boxes"]:
+                    # Khóa không đổi số lượng nên luôn còn một SKU cùng khóa đủ hàng
+                    sku = next(i for i in ids[key(b)] if pool.count(i))
+                    pool.remove(sku)
+                    boxes.append(dict(b, sku=sku))
+                layers.append(dict(l, boxes=boxes))
+            solution.append(dict(c, layers=layers))
+        max_uid = max((b["uid"] for c in solution for l in c["layers"] for b in l["boxes"]), default=0)
+        self._uids = itertools.count(max_uid + 1)
+        if self.progress is not None:
+            self.progress.start_stage(f"Xếp lại từ xe {first + 1}")
+            self.progress.update(containers_done=first, items_packed=sum(c["packed_count"] for c in solution))
+        return solution + self.pack_from_pool(pool, cL, cW, cH, first=first)
+
+    def reached_lower_bound(self, solution, skus):
+        """Lời giải xếp hết hàng với số xe bằng cận dưới → tối ưu, không cần tìm tiếp"""
+        return (bool(solution) and len(solution) <= self.lower_bound
+                and sum(c["packed_count"] for c in solution) >= count_units(skus))
+
+    def find_oversized_items(self, items, cL, cW, cH):
+        """Trả về các SKU/item không thể cho vào container ở bất kỳ hướng cho phép nào"""
+        return FitMatrix(items, self.options.allow_rotation).not_fitting(cL, cW, cH)
+
+    def run_strategy(self, name, skus, cL, cW, cH):
+        """Chạy một chiến lược trên SKU đã chuẩn hóa (prepare_skus), trả về outcome dict"""
+        budget = self.options.strategy_time_budget
+        engine = self.strategy_engine(name)
+        if budget and budget > 0:
+            engine.deadline = time.time() + budget
+        if self.progress is not None:
+            self.progress.start_stage(name)
+
+        start_time = time.time()
+        solution = engine.pack_prepared_skus(skus, cL, cW, cH)
+        elapsed = time.time() - start_time
+
+        packed = sum(c["packed_count"] for c in solution)
+        return {
+            "name": name,
+            "solution": solution,
+            "time": elapsed,
+            "complete": packed >= count_units(skus),
+            "packed": packed,
+        }
+
+    def run_multi_strategy_optimization(self, skus, cL, cW, cH):
+        """skus: kết quả prepare_skus - không chuẩn hóa lại trong từng chiến lược"""
+        names = [name for name, _ in self.STRATEGIES]
+        outcomes = None
+        if self.options.parallel_strategies and len(names) > 1:
+            outcomes = _parallel_or_none(self._run_strategies_parallel, names, skus, cL, cW, cH)
+        if outcomes is None:
+            outcomes = self._run_strategies_sequential(names, skus, cL, cW, cH)
+
+        best_solution = None
+        best_key = None
+        best_metric = float('-inf')
+        best_strategy_name = ""
+
+        for outcome in outcomes:
+            solution = outcome["solution"]
+            name = outcome["name"]
+            if not solution:
+                continue
+
+            metric = self.evaluate_solution_quality(solution, cL, cW, cH)
+
+            for i, container in enumerate(solution):
+                container["strategy"] = name
+                container["time"] = outcome["time"]
+                container["name"] = f"Xe {i+1:02d}"
+
+            print(f"Chiến lược {name}: {len(solution)} xe, Điểm: {metric:.2f}, Thời gian: {outcome['time']:.2f}s"
+                  + ("" if outcome["complete"] else " (chưa xếp hết)"))
+
+            # Lời giải đầy đủ luôn thắng lời giải bị cắt do hủy / hết thời gian
+            key = (outcome["complete"], outcome["packed"], metric)
+            if best_key is None or key > best_key:
+                best_key = key
+                best_metric = metric
+                best_solution = solution
+                best_strategy_name = name
+
+        if best_solution:
+            print(f"CHIẾN LƯỢC TỐT NHẤT: {best_strategy_name} với điểm số: {best_metric:.2f}")
+            for container in best_solution:
+                container["best_strategy"] = best_strategy_name
+
+        return best_solution
+
+    def _run_strategies_sequential(self, names, skus, cL, cW, cH):
+        outcomes = []
+        for name in names:
+            if self.is_cancelled() and any(o["solution"] for o in outcomes):
+                break
+            try:
+                outcomes.append(self.run_strategy(name, skus, cL, cW, cH))
+            except Exception as e:
+                print(f"Lỗi với chiến lược {name}: {str(e)}")
+                continue
+            if self.reached_lower_bound(outcomes[-1]["solution"], skus):
+                print(f"Chiến lược {name} đạt cận dưới {self.lower_bound} xe, dừng sớm")
+                break
+        return outcomes
+
+    def _run_strategies_parallel(self, names, skus, cL, cW, cH):
+        """Mỗi chiến lược chạy trên một process; hủy được truyền qua multiprocessing.Event"""
+        outcomes = []
+        calls = {name: (_run_strategy_worker, (name, self.options, skus, (cL, cW, cH))) for name in names}
+        with _WorkerPool(self.options, len(names)) as pool:
+            if self.progress is not None:
+                self.progress.update(stage=f"Song song 0/{len(names)} chiến lược")
+            for name, outcome, error in pool.completed(calls, self.progress):
+                if error is not None:
+                    print(f"Lỗi với chiến lược {name}: {str(error)}")
+                    continue
+                outcomes.append(outcome)
+                if self.reached_lower_bound(outcome["solution"], skus) and not pool.cancel_event.is_set():
+                    # Đạt cận dưới: các chiến lược còn chạy dừng và trả lời giải dở
+                    print(f"Chiến lược {name} đạt cận dưới {self.lower_bound} xe, dừng sớm")
+                    pool.cancel_event.set()
+                if self.progress is not None:
+                    self.progress.update(
+                        stage=f"Song song {len(outcomes)}/{len(names)} chiến lược",
+                        containers_done=len(outcome["solution"]),
+                        items_packed=outcome["packed"],
+                    )
+
+        # Giữ thứ tự khai báo để kết quả ổn định khi điểm bằng nhau
+        order = {name: i for i, name in enumerate(names)}
+        outcomes.sort(key=lambda o: order[o["name"]])
+        return outcomes
+
+    def run_single_strategy_optimization(self, skus, cL, cW, cH):
+        if self.progress is not None:
+            self.progress.start_stage("GFBUp")
+        solution = self.pack_prepared_skus(skus, cL, cW, cH)
+        if solution:
+            for i, container in enumerate(solution):
+                container["name"] = f"Xe {i+1:02d}"
+        return solution
+
+    def evaluate_solution_quality(self, solution, cL, cW, cH):
+        if not solution:
+            return float('-inf')
+        return quality_metric(len(solution), sum(cont["packed_vol"] for cont in solution),
+                              [cont["packed_count"] for cont in solution], cL, cW, cH)
+
+    # ---------------------------------------------------------
+    # CẢI THIỆN LỜI GIẢI: SIMULATED ANNEALING THEO LAYER
+    # ---------------------------------------------------------
+    SA_REHEAT_EVERY = 2000
+    SA_T_START = 0.01
+    SA_T_END = 0.0005
+    SA_REBUILD_CHOICES = {
+        "item_order": list(ITEM_ORDER_KEYS),
+        "row_fit": ["first", "best"],
+        "use_maxrect": [False, True],
+    }
+    SA_ROTATE_PROB = 0.25  # xác suất dựng lại layer với hướng xoay ưu tiên ngẫu nhiên theo SKU
+
+    def improve_solution(self, solution, skus, cL, cW, cH):
+        """Cải thiện lời giải greedy trong improve_time_budget giây (0 = tắt).
+
+        Layer là đơn vị độc lập (mặt 2D + chiều cao), nên mỗi bước chỉ đụng 1-2 layer:
+        - chuyển nguyên một layer sang container khác còn đủ chiều cao
+        - gộp hai layer của hai container rồi dựng lại ở chiều cao lớn hơn với
+          thứ tự item / hướng xoay / bộ dựng layer chọn ngẫu nhiên; phần không vừa
+          dựng lại ở layer nguồn, bước bị bỏ nếu còn kiện không xếp được
+        Năng lượng và điểm tính từ tổng theo container (cập nhật theo layer bị đổi,
+        không duyệt lại box). Lịch nhiệt độ theo số bước (hâm nóng mỗi
+        SA_REHEAT_EVERY bước) với seed cố định: ngân sách dài hơn chỉ đi tiếp cùng
+        quỹ đạo nên lời giải tốt nhất không kém đi khi tăng thời gian.
+        """
+        budget = self.options.improve_time_budget
+        if not solution or budget <= 0 or len(solution) < 2:
+            return solution
+        if any(c.get("placement") == "extreme_point" for c in solution):
+            # Lớp của engine 3D chỉ là lát cắt theo z, không tách rời được
+            return solution
+
+        if self.progress is not None:
+            self.progress.start_stage("Cải thiện (SA)")
+        by_id = {s["sku"]: s for s in skus}
+        max_uid = max((b["uid"] for c in solution for l in c["layers"] for b in l["boxes"]), default=0)
+        self._uids = itertools.count(max_uid + 1)
+
+        conts = [self._sa_container(c, [self._sa_layer(l["height"], l["boxes"]) for l in c["layers"]])
+                 for c in solution]
+        total_vol = sum(c["vol"] for c in conts)
+        container_vol = cL * cW * cH
+
+        def energy(state):
+            # Ít container trước; cùng số container thì dồn hàng (Σ fill²) để xe nhẹ nhất rỗng dần
+            n = len(state)
+            return n - 0.9 * sum((c["vol"] / container_vol) ** 2 for c in state) / n
+
+        def metric(state):
+            return quality_metric(len(state), total_vol, [c["count"] for c in state], cL, cW, cH)
+
+        rnd = random.Random(self.options.improve_seed)
+        engines = {}
+        start_metric = best_metric = metric(conts)
+        best = [dict(c, layers=list(c["layers"])) for c in conts]
+        current_energy = energy(conts)
+        deadline = time.time() + budget
+        step = 0
+
+        while (time.time() < deadline and not self.is_cancelled() and len(conts) > 1
+               and len(best) > self.lower_bound):
+            frac = (step % self.SA_REHEAT_EVERY) / self.SA_REHEAT_EVERY
+            temperature = self.SA_T_START * (self.SA_T_END / self.SA_T_START) ** frac
+            step += 1
+
+            candidate = self._sa_neighbour(rnd, conts, by_id, engines, cL, cW, cH)
+            if candidate is None:
+                continue
+            new_energy = energy(candidate)
+            delta = new_energy - current_energy
+            if delta > 0 and rnd.random() >= math.exp(-delta / temperature):
+                continue
+            conts, current_energy = candidate, new_energy
+
+            m = metric(conts)
+            if m > best_metric + 1e-12:
+                best_metric = m
+                best = [dict(c, layers=list(c["layers"])) for c in conts]
+
+        print(f"Cải thiện SA: {len(solution)} → {len(best)} xe, Điểm: {start_metric:.3f} → {best_metric:.3f}, "
+              f"{step} bước")
+        return self._sa_solution(best)
+
+    def _sa_layer(self, height, boxes):
+        return {"height": height, "boxes": boxes, "units": Counter(b["sku"] for b in boxes),
+                "vol": sum(b["L"] * b["W"] * b["H"] for b in boxes)}
+
+    def _sa_container(self, meta, layers):
+        return {"meta": meta, "layers": layers, "height": sum(l["height"] for l in layers),
+                "count": sum(len(l["boxes"]) for l in layers), "vol": sum(l["vol"] for l in layers)}
+
+    def _sa_build(self, units, height, by_id, engines, rnd, cL, cW):
+        """Dựng một layer từ multiset SKU với tham số dựng layer và hướng xoay ngẫu nhiên"""
+        params = tuple((k, rnd.choice(v)) for k, v in self.SA_REBUILD_CHOICES.items())
+        engine = engines.get(params)
+        if engine is None:
+            engine = PackingEngine(self.options.with_changes(**dict(params)))
+            engine._uids = self._uids
+            engines[params] = engine
+        # Hướng xoay: như giải mã BRKGA, khóa ngẫu nhiên chọn hướng thử đầu tiên của từng SKU
+        engine.orientation_preference = None
+        if self.options.allow_rotation and rnd.random() < self.SA_ROTATE_PROB:
+            engine.orientation_preference = {sku: rnd.random() for sku in units}
+            engine._preferred_tables = {}
+        pool = ItemPool([dict(by_id[sku], count=n) for sku, n in units.items() if n > 0])
+        return engine.build_layer(pool, cL, cW, height, 0)
+
+    def _sa_neighbour(self, rnd, conts, by_id, engines, cL, cW, cH):
+        """Trạng thái lân cận (list container mới, chỉ container bị đổi là bản mới); None nếu không hợp lệ"""
+        # Nguồn: xe nhẹ nhất (một nửa số lần) hoặc xe ngẫu nhiên
+        if rnd.random() < 0.5:
+            i = min(range(len(conts)), key=lambda k: conts[k]["vol"])
+        else:
+            i = rnd.randrange(len(conts))
+        j = rnd.randrange(len(conts) - 1)
+        if j >= i:
+            j += 1
+        src, dst = conts[i], conts[j]
+        x = rnd.randrange(len(src["layers"]))
+        layer_x = src["layers"][x]
+        src_layers = src["layers"][:x] + src["layers"][x + 1:]
+
+        if rnd.random() < 0.3:
+            # Chuyển nguyên layer
+            if dst["height"] + layer_x["height"] > cH:
+                return None
+            new_src_layers, new_dst_layers = src_layers, dst["layers"] + [layer_x]
+        else:
+            # Gộp với một layer của xe đích rồi dựng lại
+            y = rnd.randrange(len(dst["layers"]))
+            layer_y = dst["layers"][y]
+            height = max(layer_x["height"], layer_y["height"])
+            if dst["height"] - layer_y["height"] + height > cH:
+                return None
+            units = layer_x["units"] + layer_y["units"]
+            boxes = self._sa_build(units, height, by_id, engines, rnd, cL, cW)
+            merged = self._sa_layer(height, boxes)
+            leftover = units - merged["units"]
+            new_src_layers = src_layers
+            if leftover:
+                boxes = self._sa_build(leftover, layer_x["height"], by_id, engines, rnd, cL, cW)
+                rest = self._sa_layer(layer_x["height"], boxes)
+                if rest["units"] != leftover:
+                    return None
+                new_src_layers = src_layers + [rest]
+            new_dst_layers = dst["layers"][:y] + [merged] + dst["layers"][y + 1:]
+
+        state = list(conts)
+        state[j] = self._sa_container(dst["meta"], new_dst_layers)
+        if new_src_layers:
+            state[i] = self._sa_container(src["meta"], new_src_layers)
+        else:
+            del state[i]
+        return state
+
+    def _sa_solution(self, state):
+        """Chuyển trạng thái SA về cấu trúc container/layer/box chuẩn"""
+        solution = []
+        for idx, c in enumerate(state):
+            container = dict(c["meta"])
+            container.update({
+                "name": f"Xe {idx+1:02d}",
+                "layers": [{"name": "", "z": 0, "height": l["height"], "boxes": l["boxes"]} for l in c["layers"]],
+                "packed_count": c["count"],
+                "packed_vol": c["vol"],
+            })
+            self.sort_layers_by_z(container)
+            solution.append(container)
+        return solution
+
+    # ---------------------------------------------------------
+    # TÌM KIẾM BRKGA (BIASED RANDOM-KEY GENETIC ALGORITHM)
+    # ---------------------------------------------------------
+    def run_brkga_optimization(self, skus, cL, cW, cH):
+        """Tìm thứ tự SKU + hướng xoay ưu tiên bằng BRKGA, giải mã bằng bộ xếp layer sẵn có.
+
+        Chromosome gồm 2n khóa trong [0, 1) cho n SKU: n khóa đầu là độ ưu tiên
+        (thay cho item_order), n khóa sau chọn hướng xoay được thử trước. Cá thể
+        đầu tiên tái tạo đúng thứ tự greedy nên kết quả không kém lần xếp thường.
+        Elite được chép nguyên sang thế hệ sau và giữ điểm đã giải mã (không giải
+        lại); phần còn lại đánh giá song song trên process pool nếu được.
+        """
+        opts = self.options
+        n = len(skus)
+        if n == 0:
+            return []
+        rnd = random.Random(opts.brkga_seed)
+        size = max(4, opts.brkga_population)
+        n_elite = max(1, int(size * opts.brkga_elite_fraction))
+        n_mutant = max(1, int(size * opts.brkga_mutant_fraction))
+        n_mutant = min(n_mutant, size - n_elite - 1)
+        deadline = time.time() + opts.brkga_time_budget if opts.brkga_time_budget > 0 else None
+
+        population = [self.brkga_seed_chromosome(skus)]
+        population += [[rnd.random() for _ in range(2 * n)] for _ in range(size - 1)]
+        elite_cache = {}
+
+        evaluator = None
+        if opts.parallel_strategies and (opts.max_workers or os.cpu_count() or 1) > 1:
+            evaluator = _parallel_or_none(_WorkerPool, opts, size, _init_brkga_worker, (opts, skus, (cL, cW, cH)))
+
+        if self.progress is not None:
+            self.progress.start_stage("BRKGA")
+        generation = 0
+        try:
+            while True:
+                todo = [c for c in population if tuple(c) not in elite_cache]
+                fitness = None
+                if evaluator is not None and todo:
+                    # Chia lô theo số worker để giảm chi phí gửi nhận
+                    step = -(-len(todo) // evaluator.workers)
+                    calls = {i: (_brkga_fitness_worker, (todo[i:i + step],)) for i in range(0, len(todo), step)}
+                    batches = _parallel_or_none(evaluator.map, calls, self.progress)
+                    if batches is None:
+                        evaluator.close()
+                        evaluator = None
+                    else:
+                        fitness = [f for i in sorted(batches) for f in batches[i]]
+                if fitness is None:
+                    fitness = [self.brkga_fitness(skus, c, cL, cW, cH) for c in todo]
+                scores = dict(elite_cache)
+                scores.update(zip(map(tuple, todo), fitness))
+                population.sort(key=lambda c: scores[tuple(c)], reverse=True)
+                generation += 1
+
+                best = scores[tuple(population[0])]
+                if self.progress is not None:
+                    self.progress.update(stage=f"BRKGA thế hệ {generation}/{opts.brkga_generations}",
+                                         containers_done=-best[1], items_packed=best[0])
+                optimal = best[0] >= count_units(skus) and -best[1] <= self.lower_bound
+                if (optimal or generation >= opts.brkga_generations or self.is_cancelled()
+                        or (deadline is not None and time.time() >= deadline)):
+                    break
+
+                elites = population[:n_elite]
+                elite_cache = {tuple(c): scores[tuple(c)] for c in elites}
+                others = population[n_elite:]
+                children = []
+                for _ in range(size - n_elite - n_mutant):
+                    a, b = rnd.choice(elites), rnd.choice(others)
+                    children.append([x if rnd.random() < opts.brkga_inherit_prob else y for x, y in zip(a, b)])
+                mutants = [[rnd.random() for _ in range(2 * n)] for _ in range(n_mutant)]
+                population = elites + children + mutants
+        finally:
+            if evaluator is not None:
+                evaluator.close()
+
+        solution = self.brkga_decoder(skus, population[0]).pack_prepared_skus(skus, cL, cW, cH)
+        for i, container in enumerate(solution):
+            container["name"] = f"Xe {i+1:02d}"
+            container["strategy"] = "BRKGA"
+        print(f"BRKGA: {len(solution)} xe, Điểm: {best[2]:.2f}, {generation} thế hệ")
+        return solution
+
+    def brkga_seed_chromosome(self, skus):
+        """Chromosome tái tạo thứ tự item_order hiện tại, hướng xoay mặc định"""
+        order = sorted(range(len(skus)), key=lambda i: self.ITEM_ORDER_KEYS[self.options.item_order](skus[i]),
+                       reverse=True)
+        keys = [0.0] * (2 * len(skus))
+        for rank, i in enumerate(order):
+            keys[i] = 1.0 - (rank + 0.5) / len(skus)
+        return keys
+
+    def brkga_decoder(self, skus, keys):
+        """Engine con giải mã chromosome (không ghi progress; người gọi tự báo)"""
+        n = len(skus)
+        engine = PackingEngine(self.options)
+        engine.sku_priority = {s["sku"]: keys[i] for i, s in enumerate(skus)}
+        engine.orientation_preference = {s["sku"]: keys[n + i] for i, s in enumerate(skus)}
+        return engine
+
+    def brkga_fitness(self, skus, keys, cL, cW, cH):
+        """Điểm của chromosome, so sánh lớn hơn = tốt hơn: (số kiện xếp được, -số xe, metric)"""
+        solution = self.brkga_decoder(skus, keys).pack_prepared_skus(skus, cL, cW, cH)
+        packed = sum(c["packed_count"] for c in solution)
+        return (packed, -len(solution), self.evaluate_solution_quality(solution, cL, cW, cH))
+
+    # ---------------------------------------------------------
+    # HAI PHA: CHIA HÀNG CHO CONTAINER RỒI XẾP SONG SONG
+    # ---------------------------------------------------------
+    def assign_to_containers(self, skus, cL, cW, cH, capacities=None):
+        """Pha 1: chia kiện cho các container theo thể tích (first-fit decreasing).
+
+        SKU đi theo item_order (đáy lớn trước) và được tách theo số lượng, mỗi
+        container mới nhận tới assign_fill thể tích. capacities: thể tích còn
+        nhận được của các container đã có (điền trước, theo thứ tự).
+        Trả về list {sku id: số kiện}, các container đã có đứng đầu.
+        """
+        capacity = self.options.assign_fill * cL * cW * cH
+        order = self.options.item_order
+        bins = [{"units": {}, "room": room} for room in (capacities or [])]
+        for sku in sorted(skus, key=self.ITEM_ORDER_KEYS[order], reverse=True):
+            vol = sku["L"] * sku["W"] * sku["H"]
+            left = sku["count"]
+            for b in bins:
+                if not left:
+                    break
+                n = min(left, int(b["room"] // vol))
+                if n > 0:
+                    b["units"][sku["sku"]] = b["units"].get(sku["sku"], 0) + n
+                    b["room"] -= n * vol
+                    left -= n
+            while left:
+                n = max(1, min(left, int(capacity // vol)))
+                bins.append({"units": {sku["sku"]: n}, "room": capacity - n * vol})
+                left -= n
+        return [b["units"] for b in bins]
+
+    def run_two_phase(self, skus, cL, cW, cH):
+        """Chia hàng (pha 1) rồi xếp mọi container cùng lúc (pha 2).
+
+        Sửa sau mỗi vòng: kiện không vừa được gom lại, chia vào container còn
+        trống (đã xếp hết hàng của mình) rồi tới container mới; vòng sau xếp
+        lại song song các container có tập hàng thay đổi. Container đã tràn
+        không nhận thêm nên số vòng nhỏ, thời gian không theo số container.
+        """
+        # Kiện quá khổ không vào container nào (pack()/GUI báo riêng), không đem chia
+        oversized = {s["sku"] for s in self.find_oversized_items(skus, cL, cW, cH)}
+        skus = [s for s in skus if s["sku"] not in oversized]
+        by_id = {s["sku"]: s for s in skus}
+        container_vol = cL * cW * cH
+        sets = self.assign_to_containers(skus, cL, cW, cH)
+        packed = [None] * len(sets)
+        full = set()
+        dirty = set(range(len(sets)))
+        if self.progress is not None:
+            self.progress.start_stage(f"Hai pha: {len(sets)} container")
+
+        runner = None
+        if self.options.parallel_strategies and len(sets) > 1:
+            runner = _parallel_or_none(_WorkerPool, self.options, len(sets))
+        rounds = 0
+        placed_units = 0
+        try:
+            while dirty and not self.is_cancelled() and len(sets) <= self.options.max_containers:
+                rounds += 1
+                jobs = {i: [dict(by_id[sku], count=n) for sku, n in sets[i].items() if n > 0] for i in sorted(dirty)}
+                results = None
+                if runner is not None:
+                    calls = {i: (_pack_assigned_worker, (self.options, job, (cL, cW, cH))) for i, job in jobs.items()}
+                    results = _parallel_or_none(runner.map, calls, self.progress)
+                    if results is None:
+                        runner.close()
+                        runner = None
+                if results is None:
+                    results = {i: _pack_assigned(self, job, (cL, cW, cH)) for i, job in jobs.items()}
+
+                overflow = Counter()
+                for i, (layers, leftover) in results.items():
+                    packed[i] = layers
+                    if leftover:
+                        full.add(i)
+                        overflow.update(leftover)
+                        for sku, n in leftover.items():
+                            sets[i][sku] -= n
+                if self.progress is not None:
+                    self.progress.update(containers_done=sum(1 for p in packed if p is not None))
+                if not overflow:
+                    break
+                # Vòng không đặt thêm được kiện nào → sửa tiếp cũng vô ích
+                now_placed = sum(len(l["boxes"]) for layers in packed if layers for l in layers)
+                if now_placed <= placed_units:
+                    print(f"Hai pha: còn {sum(overflow.values())} kiện không xếp được")
+                    break
+                placed_units = now_placed
+
+                # Sửa: phần tràn vào container còn chỗ trước, thiếu thì mở container mới
+                open_ids = [i for i in range(len(sets)) if i not in full]
+                rooms = [self.options.assign_fill * container_vol
+                         - sum(b["L"] * b["W"] * b["H"] for l in packed[i] for b in l["boxes"]) for i in open_ids]
+                extra = self.assign_to_containers([dict(by_id[sku], count=n) for sku, n in overflow.items()],
+                                                  cL, cW, cH, capacities=rooms)
+                dirty = set()
+                for k, units in enumerate(extra):
+                    if not units:
+                        continue
+                    if k < len(open_ids):
+                        i = open_ids[k]
+                    else:
+                        i = len(sets)
+                        sets.append({})
+                        packed.append(None)
+                    for sku, n in units.items():
+                        sets[i][sku] = sets[i].get(sku, 0) + n
+                    dirty.add(i)
+        finally:
+            if runner is not None:
+                runner.close()
+
+        uids = itertools.count(1)
+        solution = []
+        for layers in packed:
+            if not layers:
+                continue
+            for layer in layers:
+                for b in layer["boxes"]:
+                    b["uid"] = next(uids)
+            boxes = [b for l in layers for b in l["boxes"]]
+            container = {
+                "name": f"Xe {len(solution)+1:02d}",
+                "layers": layers,
+                "packed_count": len(boxes),
+                "packed_vol": sum(b["L"]*b["W"]*b["H"] for b in boxes),
+                "placement": self.options.placement,
+                "dims": (cL, cW, cH)
+            }
+            self.sort_layers_by_z(container)
+            solution.append(container)
+        print(f"Hai pha: {len(solution)} xe sau {rounds} vòng xếp")
+        return solution
+
+    # ---------------------------------------------------------
+    # ĐỘI XE NHIỀU LOẠI: CHỌN TỔ HỢP XE RẺ NHẤT
+    # ---------------------------------------------------------
+    FLEET_TAIL_SIZES = (1, 2)  # số xe cuối của loại chính được thay bằng loại đuôi
+
+    def pack_fleet(self, items, fleet=None):
+        """Đội xe rẻ nhất chở hết hàng; trả về {"solution", "cost", "mix"} hoặc None.
+
+        Ứng viên: từng loại xe dùng riêng, và mỗi cặp (loại chính, loại đuôi):
+        giữ các xe loại chính trừ 1-2 xe cuối, hàng của các xe đó xếp lại bằng
+        loại đuôi. Lời giải dùng riêng tính một lần cho mỗi kích thước và dùng
+        chung cho mọi cặp; loại đuôi cùng rộng và cao với loại chính mà mọi layer
+        của các xe cuối nằm gọn trong chiều dài của nó thì dùng lại các layer đã
+        dựng (restack_layers), không xếp lại. Các lần xếp độc lập chạy song song.
+        """
+        fleet = list(fleet or FLEET_TYPES)
+        skus = self.prepare_skus(items)
+        by_id = {s["sku"]: s for s in skus}
+        total = count_units(skus)
+
+        def dims(t):
+            return (t["L"], t["W"], t["H"])
+
+        def packed(solution):
+            return sum(c["packed_count"] for c in solution)
+
+        if self.progress is not None:
+            self.progress.start_stage("Đội xe: từng loại")
+        solo = self._fleet_run({dims(t): (dims(t), skus) for t in fleet})
+
+        candidates = []
+        jobs = {}
+        plans = []
+        for main in fleet:
+            # Thiếu kết quả (hủy / worker lỗi) coi như loại xe này không chở hết
+            solution = solo.get(dims(main))
+            if not solution or packed(solution) < total:
+                continue
+            candidates.append([(main, c) for c in solution])
+            for k in self.FLEET_TAIL_SIZES:
+                if len(solution) <= k:
+                    continue
+                head, tail = solution[:-k], solution[-k:]
+                units = Counter(b["sku"] for c in tail for l in c["layers"] for b in l["boxes"])
+                reach = max(b["x"] + b["L"] for c in tail for l in c["layers"] for b in l["boxes"])
+                for t in fleet:
+                    if t is main:
+                        continue
+                    if (t["W"], t["H"]) == (main["W"], main["H"]) and reach <= t["L"]:
+                        # Cùng mặt cắt, hàng nằm gọn: dùng lại các layer đã dựng của các xe cuối
+                        candidates.append([(main, c) for c in head] +
+                                          [(t, c) for c in self.restack_layers(tail, dims(t))])
+                        continue
+                    key = (dims(t), tuple(sorted(units.items())))
+                    if key not in jobs:
+                        jobs[key] = (dims(t), [dict(by_id[sku], count=n) for sku, n in units.items()])
+                    plans.append((main, head, t, key, sum(units.values())))
+
+        if jobs and not self.is_cancelled():
+            if self.progress is not None:
+                self.progress.start_stage("Đội xe: tổ hợp loại chính + đuôi")
+            tails = self._fleet_run(jobs)
+            for main, head, t, key, needed in plans:
+                solution = tails.get(key)
+                if solution and packed(solution) >= needed:
+                    candidates.append([(main, c) for c in head] + [(t, c) for c in solution])
+
+        if not candidates:
+            return None
+        best = min(candidates, key=lambda cand: (round(sum(t["cost"] for t, _ in cand), 6), len(cand)))
+
+        # Ghép từ nhiều lần xếp độc lập → đánh lại uid và tên xe
+        uids = itertools.count(1)
+        result = []
+        for i, (t, c) in enumerate(best):
+            container = dict(c, name=f"Xe {i+1:02d} ({t['name']})", type=t["name"], cost=t["cost"], dims=dims(t))
+            container["layers"] = [dict(l, boxes=[dict(b, uid=next(uids)) for b in l["boxes"]]) for l in c["layers"]]
+            result.append(container)
+        cost = sum(t["cost"] for t, _ in best)
+        mix = Counter(t["name"] for t, _ in best)
+        print("Đội xe rẻ nhất: " + ", ".join(f"{n}×{name}" for name, n in mix.items()) + f" - chi phí {cost:.2f}")
+        return {"solution": result, "cost": cost, "mix": dict(mix)}
+
+    def restack_layers(self, containers, container_dims):
+        """Chuyển các layer đã dựng sang container cùng mặt cắt (box không đổi, chỉ đổi z).
+
+        Layer xếp theo first-fit giảm dần chiều cao vào container cao cH, nên
+        các xe đuôi còn trống được gộp lại. Container extreme point giữ nguyên
+        (box có thể vắt qua nhiều "lớp" theo cao độ).
+        """
+        cL, cW, cH = container_dims
+        if any(c.get("placement") == "extreme_point" for c in containers):
+            return [dict(c, dims=container_dims) for c in containers]
+        bins = []
+        for layer in sorted((l for c in containers for l in c["layers"]), key=lambda l: l["height"], reverse=True):
+            for b in bins:
+                if b["height"] + layer["height"] <= cH:
+                    break
+            else:
+                b = {"height": 0, "layers": []}
+                bins.append(b)
+            b["layers"].append(dict(layer, z=b["height"], boxes=[dict(box) for box in layer["boxes"]]))
+            b["height"] += layer["height"]
+        result = []
+        for b in bins:
+            boxes = [box for l in b["layers"] for box in l["boxes"]]
+            container = {
+                "name": f"Xe {len(result)+1:02d}",
+                "layers": b["layers"],
+                "packed_count": len(boxes),
+                "packed_vol": sum(box["L"]*box["W"]*box["H"] for box in boxes),
+                "placement": containers[0].get("placement", "layers"),
+                "dims": container_dims
+            }
+            self.sort_layers_by_z(container)
+            result.append(container)
+        return result
+
+    def _fleet_run(self, jobs):
+        """Xếp độc lập từng job {key: ((cL, cW, cH), skus)} → {key: solution}, song song nếu được"""
+        results = None
+        if self.options.parallel_strategies and len(jobs) > 1:
+            results = _parallel_or_none(self._fleet_run_parallel, jobs)
+        if results is None:
+            results = {}
+            for i, (key, (container_dims, skus)) in enumerate(jobs.items()):
+                if self.is_cancelled():
+                    break
+                if self.progress is not None:
+                    self.progress.update(stage=f"Đội xe {i}/{len(jobs)} lần xếp", containers_done=0, items_packed=0)
+                engine = PackingEngine(self.options, self.progress)
+                results[key] = engine.pack_prepared_skus(skus, *container_dims)
+        return results
+
+    def _fleet_run_parallel(self, jobs):
+        results = {}
+        calls = {key: (_pack_fleet_worker, (self.options, skus, container_dims))
+                 for key, (container_dims, skus) in jobs.items()}
+        with _WorkerPool(self.options, len(jobs)) as pool:
+            for key, solution, error in pool.completed(calls, self.progress):
+                if error is not None:
+                    print(f"Lỗi khi xếp thử loại xe {key[0]}: {str(error)}")
+                    continue
+                results[key] = solution
+                if self.progress is not None:
+                    self.progress.update(stage=f"Đội xe {len(results)}/{len(jobs)} lần xếp")
+        return results
+
+    # ---------------------------------------------------------
+    # GAP-FILLING THEO CONTAINER / LAYER
+    # ---------------------------------------------------------
+    def pack_gap_filling(self, items, cL, cW, cH):
+        return self.pack_prepared_skus(self.prepare_skus(items), cL, cW, cH)
+
+    def pack_prepared_skus(self, skus, cL, cW, cH):
+        """Gap-filling trên SKU đã chuẩn hóa; skus không bị sửa nên dùng chung được"""
+        return self.pack_from_pool(ItemPool(skus), cL, cW, cH)
+
+    def pack_from_pool(self, pool, cL, cW, cH, first=0):
+        """Xếp lần lượt từng container cho tới khi pool hết; first = số container đã có trước.
+
+        replicate_containers: khi pool còn đủ trọn một bản hàng của container vừa xếp,
+        container kế tiếp là bản sao layer của nó (uid mới) thay vì dựng lại.
+        """
+        all_containers = []
+        container_count = first
+        last_content = None
+
+        while pool and container_count < self.options.max_containers:
+            if self.is_cancelled():
+                break
+            container_count += 1
+
+            if last_content is not None and all(pool.count(sku) >= n for sku, n in last_content.items()):
+                layers = [dict(l, boxes=[dict(b, uid=next(self._uids)) for b in l["boxes"]])
+                          for l in all_containers[-1]["layers"]]
+                packed = [b for l in layers for b in l["boxes"]]
+                for sku, n in last_content.items():
+                    pool.remove(sku, n)
+            else:
+                packed, layers = self.pack_container_from_pool(pool, cL, cW, cH)
+                if self.options.replicate_containers:
+                    last_content = Counter(b["sku"] for b in packed)
+
+            if not packed:
+                break
+
+            container = {
+                "name": f"Xe {container_count:02d}",
+                "layers": layers,
+                "packed_count": len(packed),
+                "packed_vol": sum(i["L"]*i["W"]*i["H"] for i in packed),
+                "placement": self.options.placement,
+                "dims": (cL, cW, cH)
+            }
+
+            self.sort_layers_by_z(container)
+            all_containers.append(container)
+            if self.progress is not None:
+                self.progress.container_done(len(packed))
+
+        return all_containers
+
+    def prepare_skus(self, items):
+        """Gom items thành SKU (bản sao, có "count") và chuẩn hóa kích thước một lần cho cả manifest"""
+        skus = build_sku_records(items)
+        if self.options.group_similar:
+            skus = self.normalize_dimensions_advanced(skus)
+            skus = build_sku_records(self.normalize_dimensions_simple(skus))
+        # Bảng hướng xoay dựng một lần cho mỗi SKU, các layer chỉ lọc lại
+        for s in skus:
+            self.orientations(s)
+        return skus
+
+    def pack_gap_filling_single_container(self, items, cL, cW, cH):
+        """Xếp một container từ items (từng kiện hoặc SKU), trả về (packed, layers)"""
+        return self.pack_container_from_pool(ItemPool(self.prepare_skus(items)), cL, cW, cH)
+
+    def pack_container_from_pool(self, pool, cL, cW, cH):
+        """Xếp một container; kiện đã đặt bị trừ khỏi pool (O(1) mỗi kiện)"""
+        if self.options.placement == "extreme_point":
+            return self.pack_container_extreme_points(pool, cL, cW, cH)
+        if self.options.beam_width > 0:
+            return self.pack_container_beam(pool, cL, cW, cH)
+        self._layer_plan = []
+        layers = []
+        packed_total = []
+
+        current_z = 0
+        max_layers = self.options.max_layers
+        layer_count = 0
+
+        while pool and current_z < cH and layer_count < max_layers:
+            if self.is_cancelled():
+                break
+            layer_height, placed_in_layer = self.choose_layer(pool, cL, cW, cH - current_z, current_z)
+            if layer_height is None:
+                break
+
+            if not placed_in_layer:
+                smaller = pool.heights().largest_at_most(layer_height, strict=True)
+                if smaller is not None:
+                    layer_height = smaller
+                    placed_in_layer = self.build_layer(pool, cL, cW, layer_height, current_z)
+                if not placed_in_layer:
+                    break
+
+            layers.append({
+                "name": f"Layer_{layer_count+1}",
+                "z": current_z,
+                "height": layer_height,
+                "boxes": placed_in_layer
+            })
+
+            packed_total.extend(placed_in_layer)
+            for b in placed_in_layer:
+                pool.remove(b["sku"])
+
+            current_z += layer_height
+            layer_count += 1
+            if self.progress is not None:
+                self.progress.layer_built()
+
+        return packed_total, layers
+
+    def pack_container_beam(self, pool, cL, cW, cH):
+        """Xếp một container bằng beam search trên chuỗi layer, trả về (packed, layers).
+
+        Mỗi trạng thái là container dở dang (pool còn lại, z, các layer). Nhánh =
+        chiều cao ứng viên (interleaved / mode / tallest) × thứ tự item trong
+        beam_orders. Giữ beam_width trạng thái có điểm cao nhất mỗi độ sâu, điểm =
+        thể tích đã xếp + cận trên phần còn lại min(thể tích pool, thể tích trống).
+        Hai trạng thái cùng multiset kiện còn lại thì chỉ giữ trạng thái thấp hơn.
+        Chi phí tuyến tính theo beam_width.
+        """
+        area = cL * cW
+        engines = self.beam_engines()
+        volumes = {s["sku"]: s["L"] * s["W"] * s["H"] for s in pool.skus}
+
+        def remaining_volume(p):
+            return sum(volumes[s["sku"]] * p.count(s["sku"]) for s in p.active())
+
+        def score(state):
+            return state["used"] + min(state["rest"], area * (cH - state["z"]))
+
+        start = {"pool": pool.snapshot(), "z": 0, "layers": [], "used": 0, "rest": remaining_volume(pool)}
+        beam = [start]
+        best = start
+        seen = {}
+
+        for _ in range(self.options.max_layers):
+            if self.is_cancelled():
+                break
+            children = {}
+            for state in beam:
+                for layer_height, placed in self.beam_expansions(state, engines, cL, cW, cH):
+                    child_pool = state["pool"].snapshot()
+                    for b in placed:
+                        child_pool.remove(b["sku"])
+                    key = tuple(child_pool.count(s["sku"]) for s in child_pool.skus)
+                    z = state["z"] + layer_height
+                    # Trội: cùng hàng còn lại nhưng đã dùng cao hơn → bỏ
+                    if key in seen and seen[key] <= z:
+                        continue
+                    seen[key] = z
+                    vol = sum(b["L"] * b["W"] * b["H"] for b in placed)
+                    children[key] = {
+                        "pool": child_pool, "z": z, "layers": state["layers"] + [(layer_height, placed)],
+                        "used": state["used"] + vol, "rest": state["rest"] - vol,
+                    }
+            if not children:
+                break
+            beam = sorted(children.values(), key=score, reverse=True)[:self.options.beam_width]
+            for state in beam:
+                if (state["used"], -state["z"]) > (best["used"], -best["z"]):
+                    best = state
+
+        layers = []
+        packed_total = []
+        current_z = 0
+        for layer_count, (layer_height, placed) in enumerate(best["layers"]):
+            layers.append({
+                "name": f"Layer_{layer_count+1}",
+                "z": current_z,
+                "height": layer_height,
+                "boxes": placed
+            })
+            packed_total.extend(placed)
+            for b in placed:
+                pool.remove(b["sku"])
+            current_z += layer_height
+            if self.progress is not None:
+                self.progress.layer_built()
+        return packed_total, layers
+
+    def beam_engines(self):
+        """Engine con cho từng thứ tự item của beam, dùng chung bộ đếm uid"""
+        orders = self.options.beam_orders if self.sku_priority is None else (self.options.item_order,)
+        engines = []
+        for order in orders:
+            engine = PackingEngine(self.options.with_changes(item_order=order, beam_width=0))
+            engine._uids = self._uids
+            engine.sku_priority = self.sku_priority
+            engine.orientation_preference = self.orientation_preference
+            engines.append(engine)
+        return engines
+
+    def beam_expansions(self, state, engines, cL, cW, cH):
+        """Các layer (chiều cao, box) dựng được trên trạng thái beam, bỏ layer trùng nhau"""
+        pool = state["pool"]
+        current_z = state["z"]
+        remaining_height = cH - current_z
+        heights = []
+        for h in (self.select_layer_height_interleaved(pool, remaining_height),
+                  self.select_layer_height_mode(pool, remaining_height),
+                  self.select_layer_height_tallest(pool, remaining_height)):
+            if h is not None and h not in heights:
+                heights.append(h)
+
+        expansions = []
+        signatures = set()
+        while heights:
+            for h in heights:
+                for engine in engines:
+                    placed = engine.build_layer(pool, cL, cW, h, current_z)
+                    if not placed:
+                        continue
+                    signature = (h, tuple(sorted(Counter(b["sku"] for b in placed).items())))
+                    if signature not in signatures:
+                        signatures.add(signature)
+                        expansions.append((h, placed))
+            if expansions:
+                break
+            # Như xếp greedy: không ứng viên nào dựng được → thử chiều cao nhỏ hơn kế tiếp
+            smaller = pool.heights().largest_at_most(min(heights), strict=True)
+            heights = [smaller] if smaller is not None else []
+        return expansions
+
+    def pack_container_extreme_points(self, pool, cL, cW, cH):
+        """Xếp một container bằng extreme point 3D, trả về (packed, layers) như xếp theo lớp.
+
+        Box được gom thành "lớp" theo cao độ đáy: mỗi z khác nhau một lớp, lớp
+        cao tới z kế tiếp, nên sort_layers_by_z giữ nguyên tọa độ thật và mọi
+        view/exporter theo lớp vẫn dùng được.
+        """
+        skus = [s for s in pool.active()]
+        if not skus:
+            return [], []
+        # Ô lưới ~ kích thước trung vị theo từng trục: mỗi box chỉ chạm vài ô
+        cells = [max(50, sorted(s[k] for s in skus)[len(skus) // 2]) for k in ("L", "W", "H")]
+        space = ExtremePointSpace(cL, cW, cH, cells, self.options.min_support_ratio)
+
+        packed = []
+        for sku in self.ordered_skus(pool):
+            if self.is_cancelled():
+                break
+            variants = [v for v in self.orientations(sku) if v["L"] <= cL and v["W"] <= cW and v["H"] <= cH]
+            while pool.count(sku["sku"]):
+                hit = space.find(variants)
+                if hit is None:
+                    # Không gian chỉ thu hẹp → các kiện giống hệt còn lại cũng không vừa
+                    break
+                variant, x, y, z = hit
+                limit = pool.count(sku["sku"]) if self.options.block_building else 1
+                nx, ny, nz = space.grow(variant, x, y, z, limit)
+                boxes = [self.make_box(variant, x + i * variant["L"], y + j * variant["W"], z + k * variant["H"])
+                         for k in range(nz) for i in range(nx) for j in range(ny)]
+                # Khối là một vật trong không gian điểm cực, chỉ tách thành kiện khi xuất
+                space.place({"x": x, "y": y, "z": z, "L": nx * variant["L"], "W": ny * variant["W"],
+                             "H": nz * variant["H"], "uid": boxes[0]["uid"]})
+                packed.extend(boxes)
+                pool.remove(sku["sku"], len(boxes))
+
+        by_z = defaultdict(list)
+        for box in packed:
+            by_z[box["z"]].append(box)
+        levels = sorted(by_z)
+        top = max((b["z"] + b["H"] for b in packed), default=0)
+        layers = []
+        for i, z in enumerate(levels):
+            next_z = levels[i + 1] if i + 1 < len(levels) else top
+            layers.append({
+                "name": f"Layer_{i+1}",
+                "z": z,
+                "height": next_z - z,
+                "boxes": by_z[z]
+            })
+            if self.progress is not None:
+                self.progress.layer_built()
+        return packed, layers
+
+    def choose_layer(self, pool, cL, cW, remaining_height, current_z):
+        """Chọn chiều cao layer theo layer_height_policy và dựng layer đó"""
+        policy = self.options.layer_height_policy
+        if policy == "best_fill":
+            # Thử nhiều chiều cao ứng viên, giữ layer có mật độ thể tích cao nhất
+            candidates = []
+            for h in (self.select_layer_height_interleaved(pool, remaining_height),
+                      self.select_layer_height_mode(pool, remaining_height),
+                      self.select_layer_height_tallest(pool, remaining_height)):
+                if h is not None and h not in candidates:
+                    candidates.append(h)
+            if not candidates:
+                return None, []
+
+            best = (candidates[0], [])
+            best_density = -1
+            for h in candidates:
+                placed = self.build_layer(pool, cL, cW, h, current_z)
+                if not placed:
+                    continue
+                density = sum(b["L"]*b["W"]*b["H"] for b in placed) / (cL * cW * h)
+                if density > best_density:
+                    best_density = density
+                    best = (h, placed)
+            return best
+
+        if policy == "mode":
+            layer_height = self.select_layer_height_mode(pool, remaining_height)
+        elif policy == "tallest":
+            layer_height = self.select_layer_height_tallest(pool, remaining_height)
+        elif policy == "planned":
+            layer_height = self.next_planned_layer_height(pool, cL, cW, remaining_height)
+        else:
+            layer_height = self.select_layer_height_interleaved(pool, remaining_height)
+        if layer_height is None:
+            return None, []
+        return layer_height, self.build_layer(pool, cL, cW, layer_height, current_z)
+
+    def select_layer_height_mode(self, pool, remaining_height):
+        """Chiều cao xuất hiện nhiều nhất (bằng nhau → chọn cao hơn)"""
+        return pool.heights().mode(remaining_height, prefer_taller=True)
+
+    def select_layer_height_tallest(self, pool, remaining_height):
+        """Greedy: layer cao bằng item cao nhất còn vừa"""
+        return pool.heights().largest_at_most(remaining_height)
+
+    def next_planned_layer_height(self, pool, cL, cW, remaining_height):
+        """Lấy chiều cao layer kế tiếp từ kế hoạch DP; lập lại kế hoạch khi
+        chiều cao đầu hàng không còn hàng trong cửa sổ tolerance hoặc không vừa"""
+        hist = pool.heights()
+        tol = self.options.effective_tolerance
+        for attempt in range(2):
+            while self._layer_plan:
+                h = self._layer_plan[0]
+                if h <= remaining_height and hist.count_at_most(h + tol) > hist.count_below(h):
+                    return self._layer_plan.pop(0)
+                self._layer_plan.pop(0)
+            if attempt == 0:
+                self._layer_plan = self.plan_layer_heights(pool, cL, cW, remaining_height)
+        return self.select_layer_height_interleaved(pool, remaining_height)
+
+    def plan_layer_heights(self, pool, cL, cW, total_height):
+        """Kế hoạch chiều cao các layer (thấp → cao) cho total_height.
+
+        Histogram chiều cao được gom thành cụm [a, a + tolerance] (layer cao a
+        chứa được cả cụm). Diện tích đáy của cụm / (cL·cW) cho số layer đầy và
+        một layer lẻ (lấp một phần). Knapsack bị chặn: chọn các layer có tổng
+        chiều cao ≤ total_height và thể tích lấp (chiều cao × độ đầy) lớn nhất.
+        Chiều cao rời rạc theo bước tolerance/2, làm tròn lên nên kế hoạch không
+        vượt total_height; DP chạy trên các cụm, không trên từng kiện.
+        Xếp layer thấp trước để mỗi layer chủ yếu lấy hàng của cụm mình (layer
+        cao dựng trước sẽ hút cả hàng thấp và phí chiều cao).
+        """
+        tol = self.options.effective_tolerance
+        hist = pool.heights().items(total_height)
+        if not hist:
+            return []
+
+        # Gom cụm theo cửa sổ tolerance, diện tích đáy tính trên SKU còn hàng
+        clusters = []
+        for h, _ in hist:
+            area = sum(pool.count(s["sku"]) * s["L"] * s["W"] for s in pool.with_height(h))
+            if clusters and h <= clusters[-1][0] + tol:
+                clusters[-1][1] += area
+            else:
+                clusters.append([h, area])
+        floor_area = cL * cW
+
+        # Đủ chỗ cho mọi layer → không cần tối ưu
+        if sum(h * -(-area // floor_area) for h, area in clusters) <= total_height:
+            return sorted(h for h, area in clusters for _ in range(-(-area // floor_area)))
+
+        # Món hàng 0/1 sau khi tách nhị phân số layer đầy: (số layer, chiều cao, giá trị)
+        pieces = []
+        for h, area in clusters:
+            full, rest = divmod(area, floor_area)
+            chunk = 1
+            while full > 0:
+                take = min(chunk, full)
+                pieces.append((take, h, take * h))
+                full -= take
+                chunk *= 2
+            if rest:
+                pieces.append((1, h, h * rest / floor_area))
+
+        step = max(1, tol // 2)
+        capacity = int(total_height // step)
+        best = [0.0] * (capacity + 1)
+        taken = []
+        for n, h, value in pieces:
+            w = n * -(-h // step)
+            row = [False] * (capacity + 1)
+            for c in range(capacity, w - 1, -1):
+                if best[c - w] + value > best[c]:
+                    best[c] = best[c - w] + value
+                    row[c] = True
+            taken.append(row)
+
+        plan = []
+        c = capacity
+        for k in range(len(pieces) - 1, -1, -1):
+            if taken[k][c]:
+                n, h, _ = pieces[k]
+                plan.extend([h] * n)
+                c -= n * -(-h // step)
+        return sorted(plan)
+
+    def normalize_dimensions_simple(self, items, tolerance=5):
+        """Gom item cùng NoID có kích thước chênh ≤ tolerance về kích thước nhóm đầu tiên"""
+        if not items:
+            return items
+        index = ToleranceIndex(tolerance)
+        normalized = []
+        for it in items:
+            dims = (it["L"], it["W"], it["H"])
+            g = index.find(it["NoID"], dims)
+            if g is not None:
+                normalized.append(dict(it, L=g[0], W=g[1], H=g[2]))
+            else:
+                index.add(it["NoID"], dims, dims)
+                normalized.append(it.copy())
+        return normalized
+
+    def normalize_dimensions_advanced(self, items, tolerance=5):
+        """Gom item cùng NoID/rotate: khớp trực tiếp ±tolerance, hoặc (nếu được xoay)
+        khớp theo một hoán vị bất kỳ - tương đương so kích thước đã sắp xếp"""
+        if not self.options.group_similar:
+            return items
+
+        direct_index = ToleranceIndex(tolerance)
+        perm_index = ToleranceIndex(tolerance)
+        normalized = []
+
+        for item in items:
+            dims = (item["L"], item["W"], item["H"])
+            key = (item["NoID"], item["rotate"])
+
+            group = direct_index.find(key, dims)
+            if group is None and item["rotate"] == 1:
+                group = perm_index.find(key, tuple(sorted(dims)))
+
+            if group is not None:
+                normalized.append(dict(item, L=group[0], W=group[1], H=group[2]))
+            else:
+                direct_index.add(key, dims, dims)
+                perm_index.add(key, tuple(sorted(dims)), dims)
+                normalized.append(item)
+
+        return normalized
+
+    def select_layer_height_interleaved(self, pool, remaining_height):
+        # Thống kê thứ tự trên histogram chiều cao của pool (mỗi truy vấn O(log m))
+        hist = pool.heights()
+        n = hist.count_at_most(remaining_height)
+        if not n:
+            return None
+
+        p30 = hist.kth(max(0, int(n*0.7)-1))
+        p_low = hist.kth(max(0, int(n*0.3)-1))
+        tall = n - hist.count_below(p30)
+        short = hist.count_at_most(p_low)
+
+        # Mode: bằng nhau → chiều cao nhỏ hơn (giống Counter.most_common trên list đã sort)
+        mode_height = hist.mode(remaining_height)
+
+        if tall > short:
+            chosen = p30
+        elif short > tall:
+            chosen = p_low
+        else:
+            chosen = mode_height
+
+        if chosen > remaining_height:
+            chosen = remaining_height
+        return chosen
+
+    # =============================================================
+    # ƯU TIÊN ITEM CÓ CHIỀU CAO CHÊNH NHAU ≤ tolerance mm CÙNG LAYER
+    # =============================================================
+
+    def build_layer(self, pool, cL, cW, layer_height, current_z):
+        """Dựng một layer bằng MaxRects (use_maxrect) hoặc skyline theo row.
+
+        Với layer_pattern_cache, layer có cùng khóa (layer_pattern_key) với một
+        layer đã dựng được phát lại từ LAYER_PATTERNS, kết quả y hệt dựng lại.
+        """
+        if not self.options.layer_pattern_cache:
+            return self._build_layer(pool, cL, cW, layer_height, current_z)
+        key, candidates = self.layer_pattern_key(pool, cL, cW, layer_height)
+        if key is None:
+            return []
+        pattern = LAYER_PATTERNS.get(key)
+        if pattern is not None:
+            return [self.make_box({"L": L, "W": W, "H": H, "NoID": candidates[i]["NoID"], "sku": candidates[i]["sku"],
+                                   "rotate": candidates[i].get("rotate", 1), "rotated": rotated},
+                                  x, y, current_z + dz, stacked=stacked, stack_level=level)
+                    for i, L, W, H, rotated, x, y, dz, stacked, level in pattern]
+        placed = self._build_layer(pool, cL, cW, layer_height, current_z)
+        index = {s["sku"]: i for i, s in enumerate(candidates)}
+        LAYER_PATTERNS.put(key, tuple(
+            (index[b["sku"]], b["L"], b["W"], b["H"], b["rotated"], b["x"], b["y"], b["z"] - current_z,
+             b["stacked"], b["stack_level"]) for b in placed))
+        return placed
+
+    def _build_layer(self, pool, cL, cW, layer_height, current_z):
+        if self.options.use_maxrect:
+            return self.build_layer_maxrects(pool, cL, cW, layer_height, current_z)
+        return self.build_layer_by_length_skyline(pool, cL, cW, layer_height, current_z)
+
+    def layer_pattern_key(self, pool, cL, cW, layer_height):
+        """Khóa cache của layer → (key, ứng viên), (None, []) nếu không SKU nào vừa.
+
+        Ứng viên theo thứ tự dựng, kèm thứ tự manifest (pool.active, dùng khi chồng
+        item thấp). Số kiện chặn ở thể tích layer // thể tích kiện + 1: nhiều hơn mức
+        đó không đổi kết quả vì layer không chứa nổi, nên các container sau có
+        lượng hàng khác nhau vẫn trúng cùng mẫu.
+        """
+        candidates = self.layer_candidates(pool, cL, cW, layer_height)
+        if not candidates:
+            return None, []
+        layer_vol = cL * cW * (layer_height + self.options.effective_tolerance)
+        preference = self.orientation_preference or {}
+        skus = tuple((s["NoID"], s["L"], s["W"], s["H"], s.get("rotate", 1), preference.get(s["sku"]),
+                      min(pool.count(s["sku"]), layer_vol // (s["L"] * s["W"] * s["H"]) + 1))
+                     for s in candidates)
+        index = {s["sku"]: i for i, s in enumerate(candidates)}
+        manifest_order = tuple(index[s["sku"]] for s in pool.active() if s["sku"] in index)
+        return (skus, manifest_order, layer_height, cL, cW, self.options.layer_build_key), candidates
+
+    def layer_candidates(self, pool, cL, cW, layer_height):
+        """SKU còn hàng vừa layer (có tolerance), theo item_order"""
+        # Thứ tự sắp xếp SKU được pool cache sẵn; lọc vừa layer cho mọi SKU trong một lần (FitMatrix)
+        fitting = pool.fitting_ids(cL, cW, layer_height + self.options.effective_tolerance,
+                                   self.options.allow_rotation)
+        return [s for s in self.ordered_skus(pool) if s["sku"] in fitting]
+
+    def ordered_skus(self, pool):
+        """SKU còn hàng theo item_order, hoặc theo khóa ưu tiên khi giải mã BRKGA"""
+        if self.sku_priority is not None:
+            priority = self.sku_priority
+            return pool.ordered("priority", lambda s: priority[s["sku"]])
+        order = self.options.item_order
+        return pool.ordered(order, self.ITEM_ORDER_KEYS[order])
+
+    def build_layer_maxrects(self, pool, cL, cW, layer_height, current_z):
+        """Xây dựng layer bằng MaxRects (best short side / best area fit).
+
+        Cùng hợp đồng với build_layer_by_length_skyline: trả về box đã đặt,
+        không trừ pool. Chồng item thấp dùng chung các hàm *_with_tolerance
+        (không có row skyline nên truyền rows rỗng).
+        """
+        candidates = self.layer_candidates(pool, cL, cW, layer_height)
+        if not candidates:
+            return []
+
+        max_allowed_height = layer_height + self.options.effective_tolerance
+        heuristic = self.options.maxrect_heuristic
+        free = MaxRectsBin(cL, cW)
+        placed = []
+        layer_pool = pool.snapshot()
+        actual_layer_height = layer_height
+
+        for sku in candidates:
+            variants = [v for v in self.orientations(sku)
+                        if v["L"] <= cL and v["W"] <= cW and v["H"] <= max_allowed_height]
+            for _ in range(pool.count(sku["sku"])):
+                hit = free.find(variants, heuristic)
+                if hit is None:
+                    # Tập trống chỉ thu hẹp → các kiện giống hệt còn lại cũng không vừa
+                    break
+                variant, x, y = hit
+                free.place(x, y, variant["L"], variant["W"])
+                placed.append(self.make_box(variant, x, y, current_z))
+                actual_layer_height = max(actual_layer_height, variant["H"])
+                layer_pool.remove(sku["sku"])
+
+        if not placed:
+            return []
+
+        if self.options.allow_stacking_in_layer:
+            self.place_stacked_items_with_tolerance(placed, [], layer_pool, cL, cW, actual_layer_height, current_z)
+
+        return placed
+
+    def build_layer_by_length_skyline(self, pool, cL, cW, layer_height, current_z):
+        """Xây dựng layer với cải tiến cho phép item có chiều cao chênh nhau ≤ tolerance mm.
+
+        pool: ItemPool các kiện còn lại; kiện chỉ được tạo (uid mới) khi đặt box.
+        Không trừ pool - người gọi trừ theo box["sku"] khi giữ layer này.
+        """
+        candidates = self.layer_candidates(pool, cL, cW, layer_height)
+        if not candidates:
+            return []
+
+        best_row_fit = self.options.row_fit == "best"
+
+        placed = []
+        skyline = SkylineRows(self, cL, cW)
+        layer_pool = pool.snapshot()
+
+        # Tìm chiều cao thực tế của layer (có thể lớn hơn layer_height nếu có item cao hơn)
+        actual_layer_height = layer_height
+        max_allowed_height = layer_height + self.options.effective_tolerance
+
+        for sku in candidates:
+            # Bảng hướng xoay có sẵn trên SKU, hướng không vừa bị loại ở vòng dưới
+            item_variants = self.orientations(sku)
+
+            for _ in range(pool.count(sku["sku"])):
+                placed_flag = False
+                for variant in item_variants:
+                    if variant["L"] > cL or variant["W"] > cW or variant["H"] > max_allowed_height:
+                        continue
+
+                    # Cập nhật actual_layer_height nếu item cao hơn layer_height ban đầu
+                    if variant["H"] > actual_layer_height:
+                        actual_layer_height = variant["H"]
+
+                    # first-fit: row đầu tiên còn chỗ; best-fit: row có chiều rộng dư ít nhất
+                    hit = skyline.find(variant["L"], variant["W"], best_row_fit)
+                    if hit is not None:
+                        row, x_pos = hit
+                        placed.append(self.make_box(variant, x_pos, row["y"], current_z))
+                        skyline.place(row, x_pos, variant["L"])
+                        placed_flag = True
+                        break
+
+                    row = skyline.open_row(variant["L"], variant["W"])
+                    if row is not None:
+                        placed.append(self.make_box(variant, 0, row["y"], current_z))
+                        placed_flag = True
+                        break
+
+                if not placed_flag:
+                    # Trạng thái không đổi → các kiện giống hệt còn lại cũng không đặt được
+                    break
+                layer_pool.remove(sku["sku"])
+
+        if not placed:
+            return []
+
+        # Chồng item thấp lên item đã đặt trong cùng layer
+        if self.options.allow_stacking_in_layer:
+            self.place_stacked_items_with_tolerance(placed, skyline.rows, layer_pool, cL, cW, actual_layer_height, current_z)
+
+        return placed
+
+    def orientations(self, item):
+        """Bảng hướng xoay của SKU, cache trên bản ghi (theo allow_rotation)"""
+        allow = self.options.allow_rotation
+        cached = item.get("orientations")
+        if cached is None or cached[0] != allow:
+            cached = (allow, build_orientation_table(item, allow))
+            item["orientations"] = cached
+        preference = self.orientation_preference
+        if preference is None or item.get("sku") not in preference:
+            return cached[1]
+        # Đưa hướng ưu tiên lên đầu, các hướng còn lại giữ thứ tự bảng
+        preferred = self._preferred_tables.get(item["sku"])
+        if preferred is None or preferred[0] is not cached[1]:
+            table = cached[1]
+            i = min(int(preference[item["sku"]] * len(table)), len(table) - 1) if table else 0
+            preferred = (table, table[i:i+1] + table[:i] + table[i+1:])
+            self._preferred_tables[item["sku"]] = preferred
+        return preferred[1]
+
+    def first_fitting_orientation(self, item, maxL, maxW, maxH):
+        """Hướng đầu tiên (đáy lớn nhất) vừa với (maxL, maxW, maxH), None nếu không có"""
+        for v in self.orientations(item):
+            if v["L"] <= maxL and v["W"] <= maxW and v["H"] <= maxH:
+                return v
+        return None
+
+    def make_box(self, variant, x, y, z, stacked=False, stack_level=1):
+        """Tạo box cho một kiện của SKU với uid mới"""
+        return {
+            "x": x, "y": y, "z": z,
+            "L": variant["L"], "W": variant["W"], "H": variant["H"],
+            "NoID": variant["NoID"], "uid": next(self._uids), "sku": variant["sku"],
+            "rotate": variant.get("rotate", 1), "rotated": variant.get("rotated", False),
+            "stacked": stacked,
+            "stack_level": stack_level
+        }
+
+    def can_item_fit_in_layer_with_tolerance(self, item, cL, cW, layer_height):
+        """Kiểm tra item có thể fit vào layer với tolerance chiều cao"""
+        # effective_tolerance = 0 khi tắt tolerance (logic cũ)
+        return self.first_fitting_orientation(item, cL, cW, layer_height + self.options.effective_tolerance) is not None
+
+    def generate_item_variants_with_tolerance(self, item, cL, cW, layer_height):
+        """Tạo các biến thể item với tolerance chiều cao"""
+        return self.generate_item_variants(item, cL, cW, layer_height + self.options.effective_tolerance)
+
+    def place_stacked_items_with_tolerance(self, placed, rows, pool, cL, cW, layer_height, current_z):
+        """Đặt các item chồng với tolerance chiều cao.
+
+        pool: ItemPool snapshot của layer - kiện đặt ở đây bị trừ khỏi snapshot này
+        """
+        strategy = self.options.stack_strategy
+
+        if strategy == "2d_packing":
+            return self.place_stacked_items_2d_packing_with_tolerance(placed, rows, pool, cL, cW, layer_height, current_z)
+        elif strategy == "same_spot":
+            return self.place_stacked_items_same_spot_with_tolerance(placed, rows, pool, cL, cW, layer_height, current_z)
+        else:  # "separate"
+            return self.place_stacked_items_separate_with_tolerance(placed, rows, pool, cL, cW, layer_height, current_z)
+
+    def place_stacked_items_2d_packing_with_tolerance(self, placed, rows, pool, cL, cW, layer_height, current_z):
+        """Chiến lược 2D packing với tolerance chiều cao"""
+        if not pool:
+            return pool
+
+        # Tìm các base item có H_base < layer_height (có tính tolerance)
+        base_items = [box for box in placed if box["H"] < layer_height]
+        # Sắp xếp base từ lớn → nhỏ (ưu tiên base lớn để đặt nhiều item con)
+        base_items.sort(key=lambda x: x["L"] * x["W"], reverse=True)
+
+        for base in base_items:
+            gap_h = layer_height - base["H"]
+            if gap_h <= 0:
+                continue
+
+            # === Packing cục bộ 2D trên mặt base ===
+            local_placed = []
+            rows_local = SkylineRows(self, base["L"], base["W"])
+
+            # Mỗi SKU còn hàng: biến thể đầu tiên vừa mặt base, nhân theo số kiện
+            # (tối đa số kiện mà diện tích base chứa nổi)
+            candidates_for_base = []
+            base_area = base["L"] * base["W"]
+            for s in pool.active():
+                n = pool.count(s["sku"])
+                v = self.first_fitting_orientation(s, base["L"], base["W"], gap_h)
+                if v is not None:
+                    candidates_for_base.extend([v] * min(n, base_area // (v["L"] * v["W"])))
+
+            if not candidates_for_base:
+                continue
+
+            # Sắp xếp item nhỏ theo diện tích giảm dần
+            candidates_for_base.sort(key=lambda v: v["L"] * v["W"], reverse=True)
+
+            for v in candidates_for_base:
+                placed_flag = False
+
+                # Thử đặt vào các row hiện có, không được thì tạo row mới
+                hit = rows_local.find(v["L"], v["W"])
+                if hit is not None:
+                    row, x_pos = hit
+                    local_placed.append({"x": x_pos, "y": row["y"], "variant": v})
+                    rows_local.place(row, x_pos, v["L"])
+                    placed_flag = True
+                else:
+                    row = rows_local.open_row(v["L"], v["W"])
+                    if row is not None:
+                        local_placed.append({"x": 0, "y": row["y"], "variant": v})
+                        placed_flag = True
+
+                if placed_flag:
+                    # Đánh dấu đã dùng, không dùng cho base khác
+                    pool.remove(v["sku"])
+
+            # === Sau khi packing cục bộ, gán tọa độ thực tế vào placed ===
+            current_z_stack = base["z"] + base["H"]
+            local_placed.sort(key=lambda b: (b["y"], b["x"]))
+
+            for stacked_box_local in local_placed:
+                v = stacked_box_local["variant"]
+                placed.append(self.make_box(v, base["x"] + stacked_box_local["x"], base["y"] + stacked_box_local["y"],
+                                            current_z_stack, stacked=True, stack_level=2))
+                current_z_stack += v["H"]
+                if current_z_stack - (base["z"] + base["H"]) >= gap_h:
+                    break
+
+        return pool
+
+    def place_stacked_items_same_spot_with_tolerance(self, placed, rows, pool, cL, cW, layer_height, current_z):
+        """Chiến lược same spot với tolerance chiều cao.
+
+        Mỗi base chọn cột kiện cao nhất ≤ gap_h bằng subset-sum trên bitset (int),
+        gom theo chiều cao riêng biệt kèm số kiện (tách nhị phân 1, 2, 4, ...).
+        Ứng viên theo mặt base lấy từ chỉ mục footprint, dựng một lần cho mỗi
+        (L, W, gap_h) khác nhau.
+        """
+        if not pool:
+            return pool
+
+        base_items = [box for box in placed if box["H"] < layer_height]
+        base_items.sort(key=lambda x: x["L"] * x["W"], reverse=True)
+        footprint_index = {}
+
+        for base in base_items:
+            gap_h = layer_height - base["H"]
+            if gap_h <= 0:
+                continue
+
+            key = (base["L"], base["W"], gap_h)
+            fits = footprint_index.get(key)
+            if fits is None:
+                ids = pool.fitting_ids(base["L"], base["W"], gap_h, self.options.allow_rotation)
+                fits = []
+                for s in pool.skus:
+                    if s["sku"] in ids:
+                        variant = self.first_fitting_orientation(s, base["L"], base["W"], gap_h)
+                        if variant is not None:
+                            fits.append(variant)
+                footprint_index[key] = fits
+
+            # Gom theo chiều cao: mỗi chiều cao tối đa gap_h // H kiện
+            by_height = {}
+            for variant in fits:
+                if pool.count(variant["sku"]):
+                    by_height.setdefault(variant["H"], []).append(variant)
+            if not by_height:
+                continue
+
+            mask = (1 << (gap_h + 1)) - 1
+            reach = 1
+            steps = []
+            for h in sorted(by_height, reverse=True):
+                left = min(sum(pool.count(v["sku"]) for v in by_height[h]), gap_h // h)
+                part = 1
+                while left > 0:
+                    take = min(part, left)
+                    steps.append((h, take, reach))
+                    reach = (reach | (reach << (h * take))) & mask
+                    left -= take
+                    part *= 2
+
+            best_height = reach.bit_length() - 1
+            if best_height <= 0:
+                continue
+
+            # Truy vết: bước nào bắt buộc dùng để đạt best_height
+            used = Counter()
+            for h, take, before in reversed(steps):
+                if not (before >> best_height) & 1:
+                    used[h] += take
+                    best_height -= h * take
+
+            # Đặt các item chồng lên cùng vị trí, cao trước
+            current_z_stack = current_z + base["H"]
+            stack_level = 2
+            for h in sorted(used, reverse=True):
+                need = used[h]
+                for variant in by_height[h]:
+                    n = min(need, pool.count(variant["sku"]))
+                    for _ in range(n):
+                        placed.append(self.make_box(variant, base["x"], base["y"], current_z_stack,
+                                                    stacked=True, stack_level=stack_level))
+                        current_z_stack += h
+                        stack_level += 1
+                    pool.remove(variant["sku"], n)
+                    need -= n
+                    if not need:
+                        break
+
+        return pool
+
+    def place_stacked_items_separate_with_tolerance(self, placed, rows, pool, cL, cW, layer_height, current_z):
+        """Chiến lược separate với tolerance chiều cao"""
+        if not pool:
+            return pool
+
+        stackable_areas = []
+        for box in placed:
+            if box["H"] < layer_height * 0.7:
+                stackable_areas.append({
+                    "base_box": box,
+                    "remaining_height": layer_height - box["H"],
+                    "used_height": 0
+                })
+
+        stackable_areas.sort(key=lambda x: (x["base_box"]["L"] * x["base_box"]["W"]), reverse=True)
+
+        for area in stackable_areas:
+            if area["remaining_height"] <= 0:
+                continue
+
+            base_box = area["base_box"]
+            max_height = area["remaining_height"]
+
+            # Một ứng viên cho mỗi SKU: các kiện giống hệt cho cùng kết quả tìm vị trí
+            stackable_candidates = []
+            for s in pool.active():
+                variant = self.first_fitting_orientation(s, base_box["L"], base_box["W"], max_height)
+                if variant is not None:
+                    stackable_candidates.append(variant)
+
+            if not stackable_candidates:
+                continue
+
+            stackable_candidates.sort(key=lambda v: v["H"], reverse=True)
+
+            for variant in stackable_candidates:
+                found_position = self.find_position_near_base(placed, rows, base_box, variant, cL, cW)
+
+                if found_position:
+                    stacked_box = self.make_box(variant, found_position["x"], found_position["y"],
+                                                current_z + base_box["H"], stacked=True, stack_level=2)
+                    placed.append(stacked_box)
+                    pool.remove(variant["sku"])
+
+                    self.update_rows_for_stacked_item(rows, stacked_box, cL)
+
+                    area["used_height"] += variant["H"]
+                    area["remaining_height"] -= variant["H"]
+
+                    if area["remaining_height"] > 0:
+                        # Chỉ thử SKU còn hàng đầu tiên
+                        for s2 in pool.active():
+                            variant2 = self.first_fitting_orientation(s2, variant["L"], variant["W"], area["remaining_height"])
+                            if variant2 is not None:
+                                placed.append(self.make_box(variant2, found_position["x"], found_position["y"],
+                                                            current_z + base_box["H"] + variant["H"],
+                                                            stacked=True, stack_level=3))
+                                pool.remove(variant2["sku"])
+                            break
+
+                    break
+
+        return pool
+
+    # ---------------------------------------------------------
+    # HELPER HÌNH HỌC
+    # ---------------------------------------------------------
+    def can_item_fit_in_layer(self, item, cL, cW, layer_height):
+        """Kiểm tra item có fit vào layer (không tolerance)"""
+        return self.first_fitting_orientation(item, cL, cW, layer_height) is not None
+
+    def generate_item_variants(self, item, cL, cW, layer_height):
+        """Các biến thể xoay của item vừa với (cL, cW, layer_height), lọc từ bảng hướng xoay"""
+        return [v for v in self.orientations(item)
+                if v["L"] <= cL and v["W"] <= cW and v["H"] <= layer_height]
+
+    def find_position_near_base(self, placed, rows, base_box, variant, cL, cW):
+        """Tìm vị trí trống gần base_box để đặt item chồng"""
+
+        candidate_positions = [
+            {"x": base_box["x"] + base_box["L"], "y": base_box["y"]},
+            {"x": max(0, base_box["x"] - variant["L"]), "y": base_box["y"]},
+            {"x": base_box["x"], "y": base_box["y"] + base_box["W"]},
+            {"x": base_box["x"], "y": max(0, base_box["y"] - variant["W"])},
+            {"x": base_box["x"] + base_box["L"], "y": base_box["y"] + base_box["W"]},
+        ]
+
+        for pos in candidate_positions:
+            if (pos["x"] + variant["L"] <= cL and
+                pos["y"] + variant["W"] <= cW and
+                pos["x"] >= 0 and pos["y"] >= 0):
+
+                overlap = False
+                test_rect = {
+                    "x": pos["x"],
+                    "y": pos["y"],
+                    "L": variant["L"],
+                    "W": variant["W"]
+                }
+
+                for box in placed:
+                    if self.boxes_overlap(test_rect, box):
+                        overlap = True
+                        break
+
+                if not overlap:
+                    return pos
+
+        for row in rows:
+            segs = row["segments"]
+            x_pos = self.find_x_position_in_segments(segs, variant["L"], cL)
+            if x_pos is not None and row["y"] + variant["W"] <= cW:
+                test_rect = {"x": x_pos, "y": row["y"], "L": variant["L"], "W": variant["W"]}
+                if not self.boxes_overlap(test_rect, base_box):
+                    return {"x": x_pos, "y": row["y"]}
+
+        return None
+
+    def boxes_overlap(self, rect1, rect2):
+        """Kiểm tra hai hình chữ nhật có chồng lên nhau không"""
+        return not (rect1["x"] + rect1["L"] <= rect2["x"] or
+                    rect2["x"] + rect2["L"] <= rect1["x"] or
+                    rect1["y"] + rect1["W"] <= rect2["y"] or
+                    rect2["y"] + rect2["W"] <= rect1["y"])
+
+    def update_rows_for_stacked_item(self, rows, stacked_box, cL):
+        """Cập nhật rows khi đặt item chồng"""
+        for row in rows:
+            if row["y"] <= stacked_box["y"] < row["y"] + row["height"]:
+                segs = row["segments"]
+                row["segments"] = self.update_segments_after_place(segs, stacked_box["x"], stacked_box["L"])
+                break
+        else:
+            rows.append({
+                "y": stacked_box["y"],
+                "height": stacked_box["W"],
+                "segments": [(stacked_box["L"], cL)]
+            })
+
+    def find_x_position_in_segments(self, segments, length_needed, cL):
+        for (start, end) in segments:
+            if end - start >= length_needed:
+                return start
+        return None
+
+    def update_segments_after_place(self, segments, x_pos, length):
+        """Bỏ [x_pos, x_pos + length) khỏi các đoạn trống (đã sắp xếp, rời nhau).
+
+        Chỉ thay các đoạn giao với khoảng vừa đặt (tìm bằng bisect), sửa tại chỗ
+        và trả về chính list đó.
+        """
+        end = x_pos + length
+        lo = max(0, bisect.bisect_right(segments, (x_pos, float("inf"))) - 1)
+        hi = lo
+        pieces = []
+        while hi < len(segments) and segments[hi][0] < end:
+            s, e = segments[hi]
+            if x_pos >= e:
+                pieces.append((s, e))
+            else:
+                if s < x_pos:
+                    pieces.append((s, x_pos))
+                if end < e:
+                    pieces.append((end, e))
+            hi += 1
+        segments[lo:hi] = pieces
+        return segments
+
+    def pack_gap_filling_interleaved(self, items, cL, cW, cH):
+        """GFI: layer theo chiều cao phổ biến nhất, item dài trước, row best-fit"""
+        return self.strategy_engine("GFI").pack_gap_filling(items, cL, cW, cH)
+
+    def pack_greedy_layer_based(self, items, cL, cW, cH):
+        """Greedy: layer cao bằng item cao nhất còn lại, item thể tích lớn trước"""
+        return self.strategy_engine("Greedy + Layer-based").pack_gap_filling(items, cL, cW, cH)
+
+    def pack_hybrid_approach(self, items, cL, cW, cH):
+        """Hybrid: thử nhiều chiều cao cho mỗi layer, giữ layer đầy nhất"""
+        return self.strategy_engine("Hybrid Approach").pack_gap_filling(items, cL, cW, cH)
+
+    def sort_layers_by_z(self, container):
+        """Sắp xếp layers theo Z tăng dần (Z1 ở dưới cùng, Zn ở trên cùng)"""
+        layers = container["layers"]
+        layers_sorted = sorted(layers, key=lambda x: x["z"])
+
+        current_z = 0
+        for idx, layer in enumerate(layers_sorted):
+            layer["name"] = f"Lớp Z{idx+1}"
+            layer["z"] = current_z
+            # Giữ độ cao của kiện chồng so với đáy layer (đáy = z thấp nhất trong layer)
+            floor = min((box["z"] for box in layer["boxes"]), default=current_z)
+            for box in layer["boxes"]:
+                box["z"] = current_z + box["z"] - floor
+            current_z += layer["height"]
+
+        container["layers"] = layers_sorted
+
+    # ---------------------------------------------------------
+    # PHÂN TÍCH XOAY
+    # ---------------------------------------------------------
+    def analyze_rotation_improvement(self, raw_items, cL, cW, cH):
+        """Phân tích xoay theo NoID (raw_items: SKU hoặc từng kiện)"""
+        analysis = {
+            "improved_items": [],
+            "summary": {}
+        }
+
+        item_types = defaultdict(list)
+        for item in raw_items:
+            item_types[item["NoID"]].append(item)
+
+        for item_type, items in item_types.items():
+            if not items:
+                continue
+
+            sample_item = items[0]
+            L, W, H = sample_item["L"], sample_item["W"], sample_item["H"]
+
+            if sample_item["rotate"] != 1:
+                continue
+
+            # Cùng kích thước → cùng kết quả (guillotine_pattern có cache)
+            original_count = guillotine_pattern(L, W, H, cL, cW, cH, allow_rotation=False)[0]
+            best_count, pattern = guillotine_pattern(L, W, H, cL, cW, cH)
+            best_orientation = pattern[0][0] if pattern else (L, W, H)
+
+            if best_count > original_count:
+                improvement = ((best_count - original_count) / max(original_count, 1)) * 100
+
+                analysis["improved_items"].append({
+                    "type": item_type,
+                    "original": (L, W, H),
+                    "best_orientation": best_orientation,
+                    "original_count": original_count,
+                    "best_count": best_count,
+                    "pattern": pattern,
+                    "improvement": improvement,
+                    "quantity": count_units(items)
+                })
+
+        analysis["improved_items"].sort(key=lambda x: x["improvement"], reverse=True)
+
+        if analysis["improved_items"]:
+            total_items = sum(item["quantity"] for item in analysis["improved_items"])
+            avg_improvement = sum(item["improvement"] for item in analysis["improved_items"]) / len(analysis["improved_items"])
+            analysis["summary"] = {
+                "total_improved_types": len(analysis["improved_items"]),
+                "total_improved_items": total_items,
+                "avg_improvement": avg_improvement
+            }
+
+        return analysis
+
+    def calculate_possible_count(self, L, W, H, cL, cW, cH):
+        """Số kiện (L, W, H) nhiều nhất trong container, trộn hướng theo allow_rotation"""
+        return guillotine_pattern(L, W, H, cL, cW, cH, self.options.allow_rotation)[0]
+
+
+# =============================================================
+# WORKER CHO PROCESS POOL (PHẢI Ở MỨC MODULE ĐỂ PICKLE ĐƯỢC)
+# =============================================================
+
+# Luôn spawn: engine chạy từ thread nền của GUI Tk, fork khi còn thread khác
+# và interpreter Tk đang sống không an toàn; bản đóng gói Windows cũng chỉ có spawn
+PROCESS_START_METHOD = "spawn"
+
+_WORKER_CANCEL_EVENT = None
+
+
+def _init_strategy_worker(cancel_event):
+    global _WORKER_CANCEL_EVENT
+    _WORKER_CANCEL_EVENT = cancel_event
+
+
+def _run_strategy_worker(name, options, skus, container_dims):
+    progress = PackingProgress(count_units(skus), cancel_event=_WORKER_CANCEL_EVENT)
+    cL, cW, cH = container_dims
+    return PackingEngine(options, progress).run_strategy(name, skus, cL, cW, cH)
+
+
+class _WorkerPool:
+    """Process pool spawn dùng chung cho mọi chế độ song song.
+
+    Worker nhận Event hủy qua initializer (kèm initargs riêng của từng chế độ);
+    số worker theo max_workers / số CPU, không quá số job. Khi chờ kết quả, cứ
+    0.1s kiểm tra progress một lần để chuyển lệnh hủy của người dùng sang worker.
+    """
+
+    def __init__(self, options, n_jobs, initializer=None, initargs=()):
+        ctx = multiprocessing.get_context(PROCESS_START_METHOD)
+        self.cancel_event = ctx.Event()
+        self.workers = max(1, min(options.max_workers or os.cpu_count() or 1, n_jobs))
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx,
+                                            initializer=initializer or _init_strategy_worker,
+                                            initargs=(self.cancel_event,) + tuple(initargs))
+
+    def completed(self, calls, progress=None):
+        """calls {key: (hàm, args)} → sinh (key, kết quả, lỗi) theo thứ tự xong.
+
+        Lỗi của từng job trả về cho người gọi; BrokenProcessPool (worker không
+        khởi động được) được ném lại để người gọi chuyển sang chạy tuần tự.
+        """
+        futures = {self.executor.submit(fn, *args): key for key, (fn, args) in calls.items()}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+            if progress is not None and progress.is_cancelled():
+                self.cancel_event.set()
+            for future in done:
+                try:
+                    result, error = future.result(), None
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    result, error = None, e
+                yield futures[future], result, error
+
+    def map(self, calls, progress=None):
+        """Như completed() nhưng chờ đủ và trả về {key: kết quả}; job lỗi thì ném lỗi"""
+        results = {}
+        for key, result, error in self.completed(calls, progress):
+            if error is not None:
+                raise error
+            results[key] = result
+        return results
+
+    def close(self):
+        self.cancel_event.set()
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _parallel_or_none(run, *args):
+    """Gọi run(*args) (tạo / dùng process pool); không chạy song song được → None, người gọi chạy tuần tự"""
+    try:
+        return run(*args)
+    except (OSError, RuntimeError, ImportError) as e:
+        # Môi trường hạn chế / app đóng gói / worker chết (BrokenProcessPool là RuntimeError)
+        print(f"Không chạy song song được ({e}), chuyển sang tuần tự")
+        return None
+
+
+def _pack_assigned(engine, skus, container_dims):
+    """Xếp một container từ tập hàng đã chia → (layers, {sku id: số kiện không vừa})"""
+    pool = ItemPool(skus)
+    _, layers = engine.pack_container_from_pool(pool, *container_dims)
+    return layers, {s["sku"]: pool.count(s["sku"]) for s in pool.active()}
+
+
+def _pack_assigned_worker(options, skus, container_dims):
+    progress = PackingProgress(count_units(skus), cancel_event=_WORKER_CANCEL_EVENT)
+    return _pack_assigned(PackingEngine(options, progress), skus, container_dims)
+
+
+def _pack_fleet_worker(options, skus, container_dims):
+    progress = PackingProgress(count_units(skus), cancel_event=_WORKER_CANCEL_EVENT)
+    return PackingEngine(options, progress).pack_prepared_skus(skus, *container_dims)
+
+
+_BRKGA_CONTEXT = None
+
+
+def _init_brkga_worker(cancel_event, options, skus, container_dims):
+    global _WORKER_CANCEL_EVENT, _BRKGA_CONTEXT
+    _WORKER_CANCEL_EVENT = cancel_event
+    _BRKGA_CONTEXT = (PackingEngine(options), skus, container_dims)
+
+
+def _brkga_fitness_worker(chromosomes):
+    engine, skus, (cL, cW, cH) = _BRKGA_CONTEXT
+    results = []
+    for keys in chromosomes:
+        if _WORKER_CANCEL_EVENT.is_set():
+            # Bị hủy: điểm thấp nhất, vòng GA dừng ở thế hệ này
+            results.append((-1, 0, float('-inf')))
+            continue
+        results.append(engine.brkga_fitness(skus, keys, cL, cW, cH))
+    return results
+
+
+def pack(items, container_dims, options=None, progress=None):
+    """Hàm tiện ích: xếp items vào container_dims (cL, cW, cH) với options"""
+    return PackingEngine(options, progress).pack(items, container_dims)
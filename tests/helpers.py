@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Manifest mẫu và hàm kiểm tra lời giải dùng chung cho các file test"""
+
+import itertools
+import os
+import random
+from collections import Counter
+
+from packing_engine import SAMPLE_MANIFEST, build_sku_records
+
+CONTAINER = (12000, 2340, 2610)
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+def manifest_records(rows=SAMPLE_MANIFEST, scale=1):
+    return [{"L": L, "W": W, "H": H, "count": Q * scale, "NoID": ID, "rotate": r}
+            for L, W, H, Q, ID, r in rows]
+
+
+def mixed_manifest(seed, n_sku=12):
+    rnd = random.Random(seed)
+    return [(rnd.randint(200, 1200), rnd.randint(150, 800), rnd.randint(100, 400),
+             rnd.randint(1, 25), f"M{i}", rnd.randint(0, 1)) for i in range(n_sku)]
+
+
+def all_boxes(solution):
+    return [b for c in solution for l in c["layers"] for b in l["boxes"]]
+
+
+def geometry(solution):
+    return [sorted([b["x"], b["y"], b["z"], b["L"], b["W"], b["H"], b["NoID"]]
+                   for l in c["layers"] for b in l["boxes"]) for c in solution]
+
+
+def assert_valid_solution(solution, records, container_dims, options):
+    """Mọi kiện được xếp đúng một lần, nằm trong container, không chồng lấn nhau.
+
+    Layer cao theo kiện cao nhất trong khoảng tolerance nên layer kế tiếp có thể
+    đè lên kiện thấp hơn tối đa effective_tolerance theo trục z - không hơn.
+    """
+    cL, cW, cH = container_dims
+    tol = options.effective_tolerance
+    boxes = all_boxes(solution)
+
+    uids = [b["uid"] for b in boxes]
+    assert len(uids) == len(set(uids)), "uid bị trùng"
+    expected = Counter()
+    for r in records:
+        expected[r["NoID"]] += r["count"]
+    assert Counter(b["NoID"] for b in boxes) == expected
+    assert sum(c["packed_count"] for c in solution) == len(boxes)
+
+    no_rotate = {r["NoID"] for r in records if r["rotate"] == 0}
+    for b in boxes:
+        if not options.allow_rotation or b["NoID"] in no_rotate:
+            assert not b["rotated"], b
+
+    for c in solution:
+        cboxes = [b for l in c["layers"] for b in l["boxes"]]
+        for b in cboxes:
+            assert b["x"] >= 0 and b["y"] >= 0 and b["z"] >= 0, b
+            assert b["x"] + b["L"] <= cL and b["y"] + b["W"] <= cW and b["z"] + b["H"] <= cH + tol, b
+        for a, b in itertools.combinations(cboxes, 2):
+            overlap_xy = (a["x"] < b["x"] + b["L"] and b["x"] < a["x"] + a["L"] and
+                          a["y"] < b["y"] + b["W"] and b["y"] < a["y"] + a["W"])
+            overlap_z = min(a["z"] + a["H"], b["z"] + b["H"]) - max(a["z"], b["z"])
+            assert not (overlap_xy and overlap_z > tol), (a, b)
+
+
+def sku_records(rows):
+    return build_sku_records([{"L": L, "W": W, "H": H, "NoID": ID, "rotate": r, "count": n}
+                              for L, W, H, n, ID, r in rows])
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""Cận dưới số container (thể tích, L1, L2) và dừng tìm kiếm khi đạt cận"""
+
+import pytest
+
+from helpers import CONTAINER, assert_valid_solution, manifest_records, mixed_manifest
+from packing_engine import PackingEngine, PackingOptions, container_lower_bounds
+
+
+def test_lower_bounds_big_items_cannot_share():
+    # Kiện lớn hơn nửa container theo mọi trục: mỗi kiện một container dù thể tích chỉ cần 1
+    bounds = container_lower_bounds([{"L": 6, "W": 6, "H": 6, "NoID": "A", "count": 3}], 10, 10, 10)
+    assert bounds["volume"] == 1
+    assert bounds["l1"] == 3
+    assert bounds["best"] == 3
+
+
+def test_lower_bounds_l2_counts_small_items_beside_big():
+    # Kiện 5×5×5 luôn giao kiện 6×6×6 đặt trong cùng xe 10×10×10: 2 xe cho kiện lớn,
+    # 8 kiện nhỏ cần thêm một xe riêng - thể tích và L1 chỉ cho 2
+    items = [{"L": 6, "W": 6, "H": 6, "NoID": "A", "count": 2}, {"L": 5, "W": 5, "H": 5, "NoID": "B", "count": 8}]
+    bounds = container_lower_bounds(items, 10, 10, 10)
+    assert (bounds["volume"], bounds["l1"], bounds["l2"], bounds["best"]) == (2, 2, 3, 3)
+
+
+def test_lower_bounds_respect_rotation():
+    # 16×7×7 lớn hơn nửa container 30×12×12 theo cả 3 trục khi giữ nguyên hướng;
+    # được xoay thì cận chỉ dùng cạnh nhỏ nhất (7) nên không còn là kiện "lớn"
+    items = [{"L": 16, "W": 7, "H": 7, "NoID": "A", "rotate": 0, "count": 2}]
+    assert container_lower_bounds(items, 30, 12, 12, allow_rotation=True)["best"] == 2
+    assert container_lower_bounds(items, 30, 12, 12, allow_rotation=False)["best"] == 2
+    rotatable = [dict(items[0], rotate=1)]
+    assert container_lower_bounds(rotatable, 30, 12, 12, allow_rotation=False)["best"] == 2
+    assert container_lower_bounds(rotatable, 30, 12, 12, allow_rotation=True)["best"] == 1
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_lower_bound_never_exceeds_achieved(seed):
+    records = manifest_records(mixed_manifest(seed, n_sku=8), scale=3)
+    options = PackingOptions(parallel_strategies=False, multi_strategy=False)
+    engine = PackingEngine(options)
+    solution = engine.pack(records, CONTAINER)
+    assert_valid_solution(solution, records, CONTAINER, options)
+    bounds = engine.lower_bounds
+    assert bounds["volume"] <= bounds["l2"] and bounds["l1"] <= bounds["l2"]
+    assert bounds["best"] <= len(solution)
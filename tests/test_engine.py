@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""Engine headless: lời giải hợp lệ, khớp bản engine tách đầu tiên, gọi được qua pack()"""
+
+import itertools
+import json
+import os
+
+import pytest
+
+import packing_engine as pe
+from helpers import (
+    CONTAINER, DATA_DIR, all_boxes, assert_valid_solution, geometry, manifest_records, mixed_manifest, sku_records,
+)
+from packing_engine import ExtremePointSpace, ItemPool, LAYER_PATTERNS, LayerPatternCache, PackingEngine, PackingOptions, SAMPLE_MANIFEST, build_sku_records, count_units
+
+SEQUENTIAL = {"parallel_strategies": False}
+
+CONFIGS = [
+    ("gfbup", {"multi_strategy": False}),
+    ("no-rotation", {"multi_strategy": False, "allow_rotation": False}),
+    ("no-tolerance", {"multi_strategy": False, "allow_height_tolerance": False}),
+    ("same-spot", {"multi_strategy": False, "stack_strategy": "same_spot"}),
+    ("separate", {"multi_strategy": False, "stack_strategy": "separate"}),
+    ("no-stacking", {"multi_strategy": False, "allow_stacking_in_layer": False}),
+    ("row-best-fit", {"multi_strategy": False, "row_fit": "best"}),
+    ("maxrects-bssf", {"multi_strategy": False, "use_maxrect": True}),
+    ("maxrects-baf", {"multi_strategy": False, "use_maxrect": True, "maxrect_heuristic": "baf"}),
+    ("extreme-point", {"multi_strategy": False, "placement": "extreme_point", "item_order": "volume"}),
+    ("extreme-point-per-unit", {"multi_strategy": False, "placement": "extreme_point", "item_order": "volume",
+                                "block_building": False}),
+    ("planned", {"multi_strategy": False, "layer_height_policy": "planned"}),
+    ("annealing", {"multi_strategy": False, "improve_time_budget": 0.5}),
+    ("brkga", {"use_brkga": True, "brkga_population": 6, "brkga_generations": 2}),
+    ("beam", {"multi_strategy": False, "beam_width": 2}),
+    ("two-phase", {"two_phase": True}),
+    ("no-cache-no-replicate", {"multi_strategy": False, "layer_pattern_cache": False,
+                               "replicate_containers": False}),
+    ("multi-strategy", {}),
+]
+
+MANIFESTS = pytest.mark.parametrize("rows", [SAMPLE_MANIFEST, mixed_manifest(1)], ids=["sample", "mixed"])
+
+
+@pytest.mark.parametrize("name,overrides", CONFIGS, ids=[name for name, _ in CONFIGS])
+@MANIFESTS
+def test_solution_invariants(name, overrides, rows):
+    records = manifest_records(rows)
+    options = PackingOptions(**dict(SEQUENTIAL, **overrides))
+    engine = PackingEngine(options)
+    solution = engine.pack(records, CONTAINER)
+    assert_valid_solution(solution, records, CONTAINER, options)
+    assert engine.lower_bound <= len(solution)
+
+
+def test_strategies_are_distinct():
+    engine = PackingEngine(PackingOptions())
+    variants = {engine.options.with_changes(**overrides) for _, overrides in PackingEngine.STRATEGIES}
+    assert len(variants) == len(PackingEngine.STRATEGIES)
+
+
+def test_parallel_strategies_match_sequential():
+    records = manifest_records()
+    sequential = PackingEngine(PackingOptions(parallel_strategies=False)).pack(records, CONTAINER)
+    options = PackingOptions(max_workers=2)
+    parallel = PackingEngine(options).pack(records, CONTAINER)
+    assert_valid_solution(parallel, records, CONTAINER, options)
+    assert geometry(parallel) == geometry(sequential)
+
+
+def test_default_strategy_matches_baseline():
+    """GFBUp với tùy chọn mặc định xếp manifest mẫu y hệt bản engine tách đầu tiên"""
+    with open(os.path.join(DATA_DIR, "baseline_gfbup_sample.json"), encoding="utf-8") as f:
+        baseline = json.load(f)
+    options = PackingOptions(multi_strategy=False)
+    solution = PackingEngine(options).pack(manifest_records(), tuple(baseline["container"]))
+    assert geometry(solution) == baseline["containers"]
+
+
+def test_sort_layers_keeps_stacked_height():
+    """Đánh số lại layer dời cả layer: kiện chồng vẫn nằm trên kiện đỡ nó"""
+    engine = PackingEngine(PackingOptions())
+    base = {"x": 0, "y": 0, "z": 500, "L": 100, "W": 100, "H": 40}
+    top = dict(base, z=540, H=30)
+    lower = {"x": 0, "y": 0, "z": 0, "L": 100, "W": 100, "H": 80}
+    container = {"layers": [{"z": 500, "height": 70, "boxes": [base, top]},
+                            {"z": 300, "height": 80, "boxes": [lower]}]}
+    engine.sort_layers_by_z(container)
+    assert [l["z"] for l in container["layers"]] == [0, 80]
+    assert (lower["z"], base["z"], top["z"]) == (0, 80, 120)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_annealing_never_worse_than_greedy(seed):
+    records = manifest_records(mixed_manifest(seed, n_sku=10), scale=2)
+    greedy = PackingOptions(parallel_strategies=False, multi_strategy=False)
+    improved = greedy.with_changes(improve_time_budget=0.3, improve_seed=seed)
+    before = PackingEngine(greedy).pack(records, CONTAINER)
+    after = PackingEngine(improved).pack(records, CONTAINER)
+    assert_valid_solution(after, records, CONTAINER, improved)
+    assert len(after) <= len(before)
+
+
+def test_brkga_parallel_matches_sequential():
+    """Cùng seed: đánh giá quần thể trên process pool cho đúng lời giải như chạy tuần tự"""
+    records = manifest_records(mixed_manifest(2))
+    options = PackingOptions(use_brkga=True, brkga_population=6, brkga_generations=2, brkga_time_budget=0,
+                             max_workers=2)
+    parallel = PackingEngine(options).pack(records, CONTAINER)
+    sequential = PackingEngine(options.with_changes(parallel_strategies=False)).pack(records, CONTAINER)
+    assert_valid_solution(parallel, records, CONTAINER, options)
+    assert geometry(parallel) == geometry(sequential)
+
+
+def test_beam_container_consumes_pool():
+    records = manifest_records(scale=3)
+    engine = PackingEngine(PackingOptions(multi_strategy=False, beam_width=3))
+    pool = ItemPool(engine.prepare_skus(records))
+    total = len(pool)
+    packed, layers = engine.pack_container_from_pool(pool, *CONTAINER)
+    assert packed and len(pool) == total - len(packed)
+    assert sum(len(l["boxes"]) for l in layers) == len(packed)
+    assert sum(l["height"] for l in layers) <= CONTAINER[2]
+    assert [l["z"] for l in layers] == sorted(l["z"] for l in layers)
+
+
+@pytest.mark.parametrize("block_building", [False, True])
+def test_extreme_point_blocks_place_fewer_objects(block_building, monkeypatch):
+    """Khối kiện giống nhau được đặt một lần vào không gian điểm cực, bung ra từng kiện khi xuất"""
+    calls = []
+    place = ExtremePointSpace.place
+    monkeypatch.setattr(ExtremePointSpace, "place", lambda space, box: calls.append(box) or place(space, box))
+    records = [{"L": 1200, "W": 800, "H": 600, "NoID": "P", "rotate": 1, "count": 120},
+               {"L": 400, "W": 300, "H": 250, "NoID": "Q", "rotate": 1, "count": 200}]
+    options = PackingOptions(multi_strategy=False, placement="extreme_point", item_order="volume",
+                             block_building=block_building)
+    solution = PackingEngine(options).pack(records, CONTAINER)
+    assert_valid_solution(solution, records, CONTAINER, options)
+    if block_building:
+        assert len(calls) < 20
+    else:
+        assert len(calls) == 320
+
+
+def test_two_phase_parallel_matches_sequential():
+    records = manifest_records(scale=3)
+    options = PackingOptions(two_phase=True, max_workers=2)
+    parallel = PackingEngine(options).pack(records, CONTAINER)
+    sequential = PackingEngine(options.with_changes(parallel_strategies=False)).pack(records, CONTAINER)
+    assert_valid_solution(parallel, records, CONTAINER, options)
+    assert geometry(parallel) == geometry(sequential)
+
+
+def test_two_phase_stops_on_oversized_items():
+    records = manifest_records() + [{"L": 13000, "W": 3000, "H": 3000, "NoID": "BIG", "rotate": 1, "count": 1}]
+    options = PackingOptions(two_phase=True, parallel_strategies=False)
+    solution = PackingEngine(options).pack(records, CONTAINER)
+    assert len(solution) < options.max_containers
+    assert not any(b["NoID"] == "BIG" for b in all_boxes(solution))
+    assert_valid_solution(solution, manifest_records(), CONTAINER, options)
+
+
+def test_layer_cache_does_not_change_layout():
+    records = manifest_records(scale=4)
+    LAYER_PATTERNS.clear()
+    cached = PackingEngine(PackingOptions(multi_strategy=False, replicate_containers=False)).pack(records, CONTAINER)
+    assert LAYER_PATTERNS.stats()["hits"] > 0
+    plain = PackingEngine(PackingOptions(multi_strategy=False, layer_pattern_cache=False,
+                                         replicate_containers=False)).pack(records, CONTAINER)
+    assert geometry(cached) == geometry(plain)
+    uids = [b["uid"] for b in all_boxes(cached)]
+    assert len(uids) == len(set(uids))
+
+
+def test_layer_pattern_cache_evicts_least_recently_used():
+    cache = LayerPatternCache(maxsize=2)
+    cache.put("a", (1,))
+    cache.put("b", (2,))
+    assert cache.get("a") == (1,)
+    cache.put("c", (3,))
+    assert cache.get("b") is None and cache.get("a") == (1,) and cache.get("c") == (3,)
+    assert cache.stats() == {"hits": 3, "misses": 1, "size": 2}
+
+
+def test_replicated_containers_are_identical_copies():
+    records = [{"L": 1200, "W": 800, "H": 600, "NoID": "P", "rotate": 1, "count": 300}]
+    options = PackingOptions(multi_strategy=False)
+    solution = PackingEngine(options).pack(records, CONTAINER)
+    assert_valid_solution(solution, records, CONTAINER, options)
+    full = [c for c in solution if c["packed_count"] == solution[0]["packed_count"]]
+    assert len(full) >= 3
+    assert all(g == geometry(full)[0] for g in geometry(full))
+
+
+def test_replication_does_not_change_layout():
+    records = manifest_records(scale=4)
+    replicated = PackingEngine(PackingOptions(multi_strategy=False)).pack(records, CONTAINER)
+    plain = PackingEngine(PackingOptions(multi_strategy=False, replicate_containers=False)).pack(records, CONTAINER)
+    assert geometry(replicated) == geometry(plain)
+
+
+def test_same_spot_stack_is_best_subset_sum():
+    """Cột chồng trên mỗi base có tổng chiều cao lớn nhất ≤ khe trống (subset-sum)"""
+    engine = PackingEngine(PackingOptions(stack_strategy="same_spot", allow_rotation=False))
+    pool = ItemPool(sku_records([(100, 100, 7, 2, "A", 0), (100, 100, 5, 3, "B", 0), (90, 90, 3, 1, "C", 0)]))
+    units = [7, 7, 5, 5, 5, 3]
+    layer_height = 50
+    base = engine.make_box({"L": 100, "W": 100, "H": 31, "NoID": "BASE", "sku": -1}, 0, 0, 0)
+    placed = [base]
+    engine.place_stacked_items_same_spot_with_tolerance(placed, [], pool, 1000, 1000, layer_height, 0)
+
+    stacked = [b for b in placed if b["stacked"]]
+    gap = layer_height - base["H"]
+    best = max(sum(c) for r in range(len(units) + 1) for c in itertools.combinations(units, r)
+               if sum(c) <= gap)
+    assert sum(b["H"] for b in stacked) == best
+    z = base["H"]
+    for level, b in enumerate(sorted(stacked, key=lambda b: b["z"]), start=2):
+        assert (b["x"], b["y"], b["z"], b["stack_level"]) == (0, 0, z, level)
+        z += b["H"]
+    assert len(pool) == len(units) - len(stacked)
+
+
+def test_build_sku_records_groups_units():
+    units = [{"L": 10, "W": 5, "H": 3, "NoID": "A", "rotate": 1}] * 3 + [{"L": 10, "W": 5, "H": 3, "NoID": "A", "rotate": 0}]
+    skus = [{"L": 10, "W": 5, "H": 3, "NoID": "A", "rotate": 1, "count": 2},
+            {"L": 7, "W": 5, "H": 3, "NoID": "B", "rotate": 1, "count": 0}]
+    records = build_sku_records(units + skus)
+    assert [(r["sku"], r["NoID"], r["rotate"], r["count"]) for r in records] == [(0, "A", 1, 5), (1, "A", 0, 1)]
+    assert count_units(units + skus) == 6
+    records[0]["count"] -= 1
+    assert skus[0]["count"] == 2
+
+
+def test_per_unit_items_pack_like_sku_records():
+    records = manifest_records()
+    units = [{k: r[k] for k in ("L", "W", "H", "NoID", "rotate")} for r in records for _ in range(r["count"])]
+    options = PackingOptions(parallel_strategies=False, multi_strategy=False)
+    assert geometry(PackingEngine(options).pack(units, CONTAINER)) == \
+           geometry(PackingEngine(options).pack(records, CONTAINER))
+
+
+def test_layer_plan_picks_best_height_mix():
+    """Đáy 100×100: hai layer đầy cao 40, một cao 30, một cao 70 (không tolerance)"""
+    engine = PackingEngine(PackingOptions(allow_height_tolerance=False))
+    pool = ItemPool(sku_records([(100, 100, 40, 2, "A", 0), (100, 100, 30, 1, "B", 0), (100, 100, 70, 1, "C", 0)]))
+    assert engine.plan_layer_heights(pool, 100, 100, 200) == [30, 40, 40, 70]
+    assert engine.plan_layer_heights(pool, 100, 100, 100) == [30, 70]
+    assert engine.plan_layer_heights(pool, 100, 100, 85) == [40, 40]
+    assert engine.plan_layer_heights(pool, 100, 100, 20) == []
+
+
+def test_module_pack_entry_point():
+    records = manifest_records()
+    options = PackingOptions(parallel_strategies=False, multi_strategy=False)
+    solution = pe.pack(records, CONTAINER, options)
+    assert_valid_solution(solution, records, CONTAINER, options)
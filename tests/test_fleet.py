@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Đội xe nhiều loại: chọn tổ hợp rẻ nhất, hủy giữa chừng, dùng lại layer cho xe đuôi"""
+
+from collections import Counter
+
+import pytest
+
+from helpers import CONTAINER, all_boxes, assert_valid_solution, manifest_records
+from packing_engine import PackingEngine, PackingOptions, PackingProgress
+
+# Cùng mặt cắt W × H với 40HC, chỉ khác chiều dài
+SAME_SECTION_FLEET = [
+    {"name": "40HC", "L": 12000, "W": 2340, "H": 2610, "cost": 1.6},
+    {"name": "45HC", "L": 13556, "W": 2340, "H": 2610, "cost": 1.7},
+    {"name": "20HC", "L": 5898, "W": 2340, "H": 2610, "cost": 1.0},
+]
+
+
+def assert_valid_fleet(result, records, options):
+    """Đủ hàng, chi phí khớp, từng xe hợp lệ theo kích thước của chính nó"""
+    solution = result["solution"]
+    assert Counter(b["NoID"] for b in all_boxes(solution)) == Counter({r["NoID"]: r["count"] for r in records})
+    assert result["cost"] == pytest.approx(sum(c["cost"] for c in solution))
+    for c in solution:
+        loaded = Counter(b["NoID"] for b in all_boxes([c]))
+        rotate = {r["NoID"]: r["rotate"] for r in records}
+        assert_valid_solution([c], [{"NoID": k, "count": n, "rotate": rotate[k]} for k, n in loaded.items()],
+                              c["dims"], options)
+
+
+def test_pack_fleet_picks_cheapest_valid_mix():
+    records = manifest_records()
+    options = PackingOptions(parallel_strategies=False)
+    result = PackingEngine(options).pack_fleet(records)
+    assert result is not None
+    assert_valid_fleet(result, records, options)
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_pack_fleet_cancelled_returns_none(parallel):
+    """Hủy trước khi xếp xong: thiếu kết quả của loại xe không được làm hỏng pack_fleet"""
+    progress = PackingProgress()
+    progress.cancel()
+    options = PackingOptions(parallel_strategies=parallel, max_workers=2)
+    assert PackingEngine(options, progress).pack_fleet(manifest_records()) is None
+
+
+def test_pack_fleet_reuses_layers_for_same_section_tail(monkeypatch):
+    records = manifest_records(scale=3)
+    options = PackingOptions(parallel_strategies=False, multi_strategy=False)
+    engine = PackingEngine(options)
+    restacked = []
+    restack = engine.restack_layers
+    monkeypatch.setattr(engine, "restack_layers",
+                        lambda containers, dims: restacked.append(len(containers)) or restack(containers, dims))
+    result = engine.pack_fleet(records, SAME_SECTION_FLEET)
+    assert restacked and max(restacked) >= 2
+    assert_valid_fleet(result, records, options)
+
+
+def test_restack_layers_keeps_boxes_and_fits_height():
+    options = PackingOptions(parallel_strategies=False, multi_strategy=False)
+    engine = PackingEngine(options)
+    solution = engine.pack(manifest_records(scale=2), CONTAINER)
+    tail = solution[-2:]
+    dims = (13556, 2340, 2610)
+    restacked = engine.restack_layers(tail, dims)
+    assert sorted(b["uid"] for b in all_boxes(restacked)) == sorted(b["uid"] for b in all_boxes(tail))
+    for c in restacked:
+        assert c["dims"] == dims
+        assert sum(l["height"] for l in c["layers"]) <= dims[2]
+        assert c["packed_count"] == len(all_boxes([c]))
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Tiến trình và nút hủy: GUI đọc PackingProgress.snapshot() trong khi engine chạy nền"""
+
+from collections import Counter
+
+import pytest
+
+from helpers import CONTAINER, all_boxes, manifest_records
+from packing_engine import PackingEngine, PackingOptions, PackingProgress
+
+
+class CancelAfterFirstContainer(PackingProgress):
+    """Bấm hủy ngay khi container đầu tiên xếp xong"""
+
+    def container_done(self, packed_count):
+        super().container_done(packed_count)
+        self.cancel()
+
+
+def test_progress_counts_match_solution():
+    records = manifest_records(scale=3)
+    total = sum(r["count"] for r in records)
+    progress = PackingProgress(total)
+    options = PackingOptions(parallel_strategies=False, multi_strategy=False)
+    solution = PackingEngine(options, progress).pack(records, CONTAINER)
+
+    snap = progress.snapshot()
+    assert snap["stage"] == "GFBUp"
+    assert snap["containers_done"] == len(solution)
+    assert snap["layers_built"] == sum(len(c["layers"]) for c in solution)
+    assert snap["items_packed"] == snap["total_items"] == total
+    assert snap["elapsed"] >= 0 and not snap["cancelled"]
+
+
+def test_start_stage_resets_counters():
+    progress = PackingProgress(10)
+    progress.layer_built()
+    progress.container_done(4)
+    progress.start_stage("GFI")
+    snap = progress.snapshot()
+    assert (snap["stage"], snap["containers_done"], snap["layers_built"], snap["items_packed"]) == ("GFI", 0, 0, 0)
+    progress.update(containers_done=2, items_packed=7)
+    assert progress.snapshot()["items_packed"] == 7
+
+
+@pytest.mark.parametrize("multi_strategy", [False, True])
+def test_cancel_before_start_returns_no_solution(multi_strategy):
+    progress = PackingProgress()
+    progress.cancel()
+    options = PackingOptions(parallel_strategies=False, multi_strategy=multi_strategy)
+    assert not PackingEngine(options, progress).pack(manifest_records(), CONTAINER)
+
+
+@pytest.mark.parametrize("multi_strategy", [False, True])
+def test_cancel_keeps_containers_packed_so_far(multi_strategy):
+    records = manifest_records(scale=3)
+    progress = CancelAfterFirstContainer()
+    options = PackingOptions(parallel_strategies=False, multi_strategy=multi_strategy)
+    solution = PackingEngine(options, progress).pack(records, CONTAINER)
+
+    assert len(solution) == 1 and progress.snapshot()["cancelled"]
+    boxes = all_boxes(solution)
+    assert solution[0]["packed_count"] == len(boxes) > 0
+    assert len({b["uid"] for b in boxes}) == len(boxes)
+    available = Counter({r["NoID"]: r["count"] for r in records})
+    assert not Counter(b["NoID"] for b in boxes) - available
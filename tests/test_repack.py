@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Xếp lại tăng dần sau khi sửa manifest: giữ container trước chỗ sửa, phần còn lại xếp lại"""
+
+from collections import Counter
+
+import pytest
+
+from helpers import CONTAINER, all_boxes, assert_valid_solution, manifest_records
+from packing_engine import PackingEngine, PackingOptions
+
+
+def uids_per_container(solution):
+    return [[b["uid"] for b in all_boxes([c])] for c in solution]
+
+
+def test_repack_incremental_keeps_untouched_containers():
+    records = manifest_records(scale=3)
+    options = PackingOptions(multi_strategy=False)
+    previous = PackingEngine(options).pack(records, CONTAINER)
+    assert len(previous) >= 3
+    assert PackingEngine(options).repack_incremental(records, CONTAINER, previous) is previous
+
+    last = Counter(b["NoID"] for l in previous[-1]["layers"] for b in l["boxes"])
+    only_last = next(noid for noid in last
+                     if not any(b["NoID"] == noid for c in previous[:-1] for l in c["layers"] for b in l["boxes"]))
+    edited = [dict(r, count=r["count"] + 5) if r["NoID"] == only_last else r for r in records]
+    solution = PackingEngine(options).repack_incremental(edited, CONTAINER, previous)
+    assert_valid_solution(solution, edited, CONTAINER, options)
+    kept = len(previous) - 1
+    assert uids_per_container(solution[:kept]) == uids_per_container(previous[:kept])
+
+
+def test_repack_incremental_applies_rotate_edit():
+    """Chỉ đổi cột rotate của một SKU cũng phải xếp lại SKU đó (không còn kiện xoay)"""
+    records = manifest_records(scale=3)
+    options = PackingOptions(multi_strategy=False)
+    previous = PackingEngine(options).pack(records, CONTAINER)
+    rotated = {b["NoID"] for b in all_boxes(previous) if b["rotated"]}
+    assert "C106" in rotated
+
+    edited = [dict(r, rotate=0) if r["NoID"] == "C106" else r for r in records]
+    solution = PackingEngine(options).repack_incremental(edited, CONTAINER, previous)
+    assert_valid_solution(solution, edited, CONTAINER, options)
+    assert not [b for b in all_boxes(solution) if b["NoID"] == "C106" and b["rotated"]]
+
+
+@pytest.mark.parametrize("group_similar", [True, False])
+def test_repack_incremental_same_noid_in_several_orientations(group_similar):
+    """Cùng NoID khai báo theo nhiều hướng: kiện giữ lại phải trừ đúng dòng SKU còn hàng"""
+    records = [{"L": 1000, "W": 500, "H": 300, "NoID": "A", "rotate": 0, "count": 300},
+               {"L": 500, "W": 1000, "H": 300, "NoID": "A", "rotate": 0, "count": 300},
+               {"L": 1000, "W": 500, "H": 300, "NoID": "D", "rotate": 1, "count": 200},
+               {"L": 500, "W": 300, "H": 1000, "NoID": "D", "rotate": 1, "count": 200},
+               {"L": 200, "W": 200, "H": 200, "NoID": "C", "rotate": 1, "count": 5}]
+    options = PackingOptions(parallel_strategies=False, multi_strategy=False, group_similar=group_similar)
+    previous = PackingEngine(options).pack(records, CONTAINER)
+    edited = records + [{"L": 700, "W": 700, "H": 700, "NoID": "F", "rotate": 1, "count": 3}]
+    solution = PackingEngine(options).repack_incremental(edited, CONTAINER, previous)
+    assert_valid_solution(solution, edited, CONTAINER, options)
+    kept = len(previous) - 1
+    assert uids_per_container(solution[:kept]) == uids_per_container(previous[:kept])
+
+
+def test_repack_incremental_repacks_on_container_change():
+    """Đổi kích thước container (kể cả lớn hơn) thì xếp lại từ đầu"""
+    records = manifest_records(scale=3)
+    options = PackingOptions(multi_strategy=False)
+    previous = PackingEngine(options).pack(records, CONTAINER)
+    bigger = (13556, 2340, 2610)
+    solution = PackingEngine(options).repack_incremental(records, bigger, previous)
+    assert_valid_solution(solution, records, bigger, options)
+    assert all(c["dims"] == bigger for c in solution)
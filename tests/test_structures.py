@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""Cấu trúc dữ liệu của engine, so với cách tính trực tiếp (brute force)"""
+
+import itertools
+import random
+from collections import Counter
+
+import pytest
+
+from helpers import CONTAINER, sku_records
+from packing_engine import (
+    BoxGrid, ExtremePointSpace, FitMatrix, HeightHistogram, ItemPool, MaxRectsBin, PackingEngine, PackingOptions, SkylineRows, ToleranceIndex, _MaxTree,
+    build_orientation_table, guillotine_pattern,
+)
+
+
+def test_item_pool_counts_snapshot_restore():
+    skus = sku_records([(100, 50, 30, 3, "A", 1), (80, 50, 30, 2, "B", 1), (60, 40, 20, 1, "C", 0)])
+    pool = ItemPool(skus)
+    assert len(pool) == 6 and pool
+    assert pool.height_counts() == {20: 1, 30: 5}
+
+    snap = pool.snapshot()
+    pool.remove(0, 3)
+    pool.remove(2)
+    assert pool.count(0) == 0 and len(pool) == 2
+    assert [s["NoID"] for s in pool.active()] == ["B"]
+    assert [s["NoID"] for s in pool.with_height(30)] == ["B"]
+    assert pool.with_height(20) == []
+    assert pool.height_counts() == {30: 2}
+    assert len(snap) == 6 and snap.count(0) == 3
+
+    with pytest.raises(ValueError):
+        pool.remove(1, 3)
+
+    pool.restore(snap)
+    assert len(pool) == 6 and pool.count(0) == 3
+    assert [s["NoID"] for s in pool.by_footprint()] == ["A", "B", "C"]
+    pool.remove(0, 3)
+    assert [s["NoID"] for s in pool.by_footprint()] == ["B", "C"]
+    pool.add(0, 1)
+    assert pool.count(0) == 1
+    assert [r["count"] for r in pool.remaining_records()] == [1, 2, 1]
+
+
+def test_tolerance_index_matches_linear_scan():
+    rnd = random.Random(5)
+    tol = 5
+    index = ToleranceIndex(tol)
+    groups = []
+    for i in range(400):
+        key = rnd.randint(0, 2)
+        dims = tuple(rnd.randint(0, 60) for _ in range(3))
+        expected = next((v for k, d, v in groups
+                         if k == key and all(abs(a - b) <= tol for a, b in zip(dims, d))), None)
+        assert index.find(key, dims) == expected
+        if expected is None:
+            index.add(key, dims, i)
+            groups.append((key, dims, i))
+
+
+def test_orientation_table_unique_and_ordered():
+    item = {"L": 50, "W": 30, "H": 20, "NoID": "A", "sku": 0, "rotate": 1}
+    table = build_orientation_table(item)
+    assert {(v["L"], v["W"], v["H"]) for v in table} == set(itertools.permutations((50, 30, 20)))
+    areas = [v["L"] * v["W"] for v in table]
+    assert areas == sorted(areas, reverse=True)
+    assert [v["rotated"] for v in table if (v["L"], v["W"], v["H"]) == (50, 30, 20)] == [False]
+
+    assert [(v["L"], v["W"], v["H"]) for v in build_orientation_table(dict(item, rotate=0))] == [(50, 30, 20)]
+    assert len(build_orientation_table(item, allow_rotation=False)) == 1
+    assert len(build_orientation_table(dict(item, W=50))) == 3
+    assert len(build_orientation_table(dict(item, W=50, H=50))) == 1
+
+
+def test_item_variants_filter_cached_table():
+    engine = PackingEngine(PackingOptions())
+    item = {"L": 50, "W": 30, "H": 20, "NoID": "A", "sku": 0, "rotate": 1}
+    variants = engine.generate_item_variants(item, 100, 100, 25)
+    assert {(v["L"], v["W"], v["H"]) for v in variants} == {(50, 30, 20), (30, 50, 20)}
+    assert engine.orientations(item) is engine.orientations(item)
+
+
+@pytest.mark.parametrize("allow_rotation", [True, False])
+def test_fit_matrix_matches_orientation_scan(allow_rotation):
+    rnd = random.Random(19)
+    items = [{"L": rnd.randint(1, 90), "W": rnd.randint(1, 90), "H": rnd.randint(1, 90),
+              "NoID": f"S{i}", "sku": i, "rotate": rnd.randint(0, 1)} for i in range(40)]
+    matrix = FitMatrix(items, allow_rotation)
+    for _ in range(100):
+        box = (rnd.randint(1, 100), rnd.randint(1, 100), rnd.randint(1, 100))
+        expected = [any(v["L"] <= box[0] and v["W"] <= box[1] and v["H"] <= box[2]
+                        for v in build_orientation_table(it, allow_rotation)) for it in items]
+        assert matrix.fits(*box) == expected
+        assert len(matrix.fitting(*box)) + len(matrix.not_fitting(*box)) == len(items)
+
+
+def test_item_pool_fitting_ids_respects_rotation():
+    skus = sku_records([(100, 50, 30, 1, "A", 1), (100, 50, 30, 1, "B", 0)])
+    pool = ItemPool(skus)
+    assert pool.fitting_ids(50, 100, 30) == {0}
+    assert pool.fitting_ids(50, 100, 30, allow_rotation=False) == set()
+    assert pool.fitting_ids(100, 50, 30) == {0, 1}
+
+
+def test_height_histogram_matches_brute_force():
+    rnd = random.Random(3)
+    heights = [rnd.randint(1, 40) for _ in range(25)]
+    hist = HeightHistogram(heights)
+    counts = Counter()
+    for _ in range(300):
+        h = rnd.choice(heights)
+        n = rnd.randint(-counts[h], 5)
+        hist.add(h, n)
+        counts[h] += n
+
+        q = rnd.randint(0, 45)
+        units = sorted(itertools.chain.from_iterable([k] * n for k, n in counts.items()))
+        assert len(hist) == len(units)
+        assert hist.count_at_most(q) == sum(1 for u in units if u <= q)
+        assert hist.count_below(q) == sum(1 for u in units if u < q)
+        if units:
+            k = rnd.randrange(len(units))
+            assert hist.kth(k) == units[k]
+        assert hist.largest_at_most(q) == max((u for u in units if u <= q), default=None)
+        assert hist.largest_at_most(q, strict=True) == max((u for u in units if u < q), default=None)
+        below = {k: n for k, n in counts.items() if k <= q and n > 0}
+        if below:
+            top = max(below.values())
+            assert hist.mode(q) == min(k for k, n in below.items() if n == top)
+            assert hist.mode(q, prefer_taller=True) == max(k for k, n in below.items() if n == top)
+        else:
+            assert hist.mode(q) is None
+    copy = hist.copy()
+    copy.add(heights[0], 1)
+    assert copy[heights[0]] == hist[heights[0]] + 1
+
+
+def test_item_pool_keeps_height_histogram_current():
+    pool = ItemPool(sku_records([(100, 50, 30, 3, "A", 1), (60, 40, 20, 1, "C", 0)]))
+    pool.remove(0, 2)
+    pool.add(0, 1)
+    assert pool.heights()[30] == 2 and pool.heights()[20] == 1
+    assert pool.heights().largest_at_most(25) == 20
+
+
+def test_max_tree_first_at_least():
+    rnd = random.Random(7)
+    tree = _MaxTree()
+    values = []
+    for _ in range(200):
+        if values and rnd.random() < 0.4:
+            i = rnd.randrange(len(values))
+            values[i] = rnd.randint(0, 100)
+            tree.update(i, values[i])
+        else:
+            values.append(rnd.randint(0, 100))
+            tree.append(values[-1])
+        t = rnd.randint(0, 110)
+        assert tree.first_at_least(t) == next((i for i, v in enumerate(values) if v >= t), None)
+
+
+@pytest.mark.parametrize("best_fit", [False, True])
+def test_skyline_rows_find_matches_scan(best_fit):
+    rnd = random.Random(11)
+    engine = PackingEngine(PackingOptions())
+    cL, cW = 1000, 5000
+    rows = SkylineRows(engine, cL, cW)
+    for _ in range(300):
+        length, width = rnd.randint(50, 400), rnd.randint(50, 300)
+        fitting = [(i, r) for i, r in enumerate(rows.rows)
+                   if r["height"] >= width and max((e - s for s, e in r["segments"]), default=0) >= length]
+        if best_fit:
+            fitting.sort(key=lambda ir: (ir[1]["height"], ir[0]))
+        found = rows.find(length, width, best_fit=best_fit)
+        if not fitting:
+            assert found is None
+            if rows.open_row(length, width) is None:
+                assert rows.y_cursor + width > cW
+            continue
+        row, x = found
+        assert row is fitting[0][1]
+        assert any(s <= x and x + length <= e for s, e in row["segments"])
+        rows.place(row, x, length)
+    assert rows.y_cursor == sum(r["height"] for r in rows.rows)
+
+
+@pytest.mark.parametrize("heuristic", ["bssf", "baf"])
+def test_maxrects_bin_places_without_overlap(heuristic):
+    rnd = random.Random(13)
+    cL, cW = 1200, 800
+    bin_ = MaxRectsBin(cL, cW)
+    placed = []
+    for _ in range(200):
+        L, W = rnd.randint(40, 300), rnd.randint(40, 300)
+        found = bin_.find([{"L": L, "W": W}, {"L": W, "W": L}], heuristic)
+        if found is None:
+            continue
+        v, x, y = found
+        rect = (x, y, v["L"], v["W"])
+        assert 0 <= x and 0 <= y and x + v["L"] <= cL and y + v["W"] <= cW
+        for px, py, pL, pW in placed:
+            assert x >= px + pL or px >= x + v["L"] or y >= py + pW or py >= y + v["W"]
+        placed.append(rect)
+        bin_.place(*rect)
+        for fx, fy, fL, fW in bin_.free:
+            for px, py, pL, pW in placed:
+                assert fx >= px + pL or px >= fx + fL or fy >= py + pW or py >= fy + fW
+    assert sum(pL * pW for _, _, pL, pW in placed) <= cL * cW
+    assert len(placed) > 10
+
+
+def test_box_grid_collides_matches_brute_force():
+    rnd = random.Random(17)
+    grid = BoxGrid(100, 80, 60)
+    boxes = []
+    for uid in range(150):
+        b = {"x": rnd.randint(0, 900), "y": rnd.randint(0, 700), "z": rnd.randint(0, 500),
+             "L": rnd.randint(1, 200), "W": rnd.randint(1, 200), "H": rnd.randint(1, 200), "uid": uid}
+        boxes.append(b)
+        grid.add(b)
+    for _ in range(500):
+        q = (rnd.randint(0, 1000), rnd.randint(0, 800), rnd.randint(0, 600),
+             rnd.randint(1, 150), rnd.randint(1, 150), rnd.randint(1, 150))
+        x, y, z, L, W, H = q
+        hits = [b for b in boxes
+                if x < b["x"] + b["L"] and b["x"] < x + L and y < b["y"] + b["W"] and b["y"] < y + W and
+                z < b["z"] + b["H"] and b["z"] < z + H]
+        assert grid.collides(*q) == bool(hits)
+        near = {b["uid"] for b in grid.near(*q)}
+        assert {b["uid"] for b in hits} <= near
+
+
+def test_extreme_point_residual_space_matches_rays():
+    """Residual của mỗi điểm cực = khoảng trống theo tia +x, +y, +z tới box/vách gần nhất"""
+    rnd = random.Random(23)
+    cL, cW, cH = 1000, 600, 500
+    space = ExtremePointSpace(cL, cW, cH, (100, 100, 100), min_support_ratio=0.5)
+    placed = []
+    for uid in range(120):
+        L, W, H = rnd.randint(50, 300), rnd.randint(50, 300), rnd.randint(50, 200)
+        found = space.find([{"L": L, "W": W, "H": H}, {"L": W, "W": L, "H": H}])
+        if found is None:
+            continue
+        v, x, y, z = found
+        box = {"x": x, "y": y, "z": z, "L": v["L"], "W": v["W"], "H": v["H"], "uid": uid}
+        space.place(box)
+        placed.append(box)
+    assert len(placed) > 10
+
+    def ray(point, axis):
+        z, x, y = point
+        p = (x, y, z)
+        end = (cL, cW, cH)[axis]
+        for b in placed:
+            lo = (b["x"], b["y"], b["z"])
+            hi = (b["x"] + b["L"], b["y"] + b["W"], b["z"] + b["H"])
+            if all(lo[k] <= p[k] < hi[k] for k in range(3) if k != axis) and lo[axis] >= p[axis]:
+                end = min(end, lo[axis])
+        return end - p[axis]
+
+    for point in space.points:
+        assert space._residual[point] == [ray(point, 0), ray(point, 1), ray(point, 2)]
+
+
+def test_guillotine_pattern():
+    assert guillotine_pattern(1, 1, 1, 3, 3, 3) == (27, (((1, 1, 1), 27),))
+    assert guillotine_pattern(2, 1, 1, 3, 3, 3, allow_rotation=False) == (9, (((2, 1, 1), 9),))
+
+    n, pattern = guillotine_pattern(2, 1, 1, 3, 3, 3)
+    assert 12 <= n <= 13  # trộn hướng tốt hơn 9, không vượt thể tích
+    assert sum(k for _, k in pattern) == n
+    assert all(sorted(o) == [1, 1, 2] for o, _ in pattern)
+
+    # Khớp số kiện của calculate_possible_count (một hướng) hoặc tốt hơn
+    n, _ = guillotine_pattern(2990, 330, 220, *CONTAINER)
+    assert n >= (12000 // 2990) * (2340 // 330) * (2610 // 220)
+
+    before = guillotine_pattern.cache_info().hits
+    guillotine_pattern(2990, 330, 220, *CONTAINER)
+    assert guillotine_pattern.cache_info().hits == before + 1